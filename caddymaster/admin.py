@@ -1,3 +1,7 @@
 from django.contrib import admin
 
-# Register your models here.
+from .models import Assignment, CaddyMaster, CaddyShack
+
+admin.site.register(CaddyMaster)
+admin.site.register(CaddyShack)
+admin.site.register(Assignment)
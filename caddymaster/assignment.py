@@ -0,0 +1,130 @@
+import datetime
+import heapq
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Sum
+
+from loopers.models import Loop, SeasonStats
+
+from .models import CaddyShack
+
+# how long a group is out, its caddies can go out again after this
+ROUND_MINUTES = 4 * 60 + 30
+
+
+def tee_minutes(group, number):
+    """Minutes after midnight of the group's "HH:MM" tee time."""
+    try:
+        tee_time = datetime.time.fromisoformat(group["tee_time"])
+    except (KeyError, TypeError, ValueError):
+        raise ValueError(f"Group {number} has no valid tee time")
+    return tee_time.hour * 60 + tee_time.minute
+
+
+def caddies_needed(group):
+    # one bag per golfer unless the group says otherwise
+    return group.get("caddies_needed", len(group.get("golfers", [])) or 1)
+
+
+def assign(groups, roster, loops_today, season_loops, keep_before=None):
+    """
+    Caddies for every group in ``groups`` from ``roster``, the checked in
+    caddies' user ids in check-in order. Returns a copy of the groups with
+    their "caddies" filled in and how many bags went without a caddy.
+
+    Groups go out in tee time order. Each takes the caddies with the fewest
+    loops today (``loops_today``), then the fewest this season
+    (``season_loops``), then whoever checked in first. A caddy can go out
+    again ROUND_MINUTES after their group tees off, with one more loop.
+    Groups teeing off before ``keep_before`` (minutes after midnight) are
+    already out and keep their caddies.
+    """
+    groups = [dict(group) for group in groups]
+    tee_times = [tee_minutes(group, number) for number, group in enumerate(groups, 1)]
+    position = {user_id: i for i, user_id in enumerate(roster)}
+    loops = {user_id: loops_today.get(user_id, 0) for user_id in roster}
+    # user id -> minute they are back from a group that keeps its caddies
+    back_at = {}
+
+    pending = []
+    for i, group in enumerate(groups):
+        if keep_before is not None and tee_times[i] < keep_before and group.get("caddies"):
+            for user_id in group["caddies"]:
+                if user_id in position:
+                    loops[user_id] += 1
+                    back_at[user_id] = max(back_at.get(user_id, 0), tee_times[i] + ROUND_MINUTES)
+        else:
+            pending.append(i)
+
+    def entry(user_id):
+        return loops[user_id], season_loops.get(user_id, 0), position[user_id], user_id
+
+    available = [entry(user_id) for user_id in roster if user_id not in back_at]
+    heapq.heapify(available)
+    # (back at, user id) of everyone out on the course
+    out = [(minute, user_id) for user_id, minute in back_at.items()]
+    heapq.heapify(out)
+
+    unfilled = 0
+    for i in sorted(pending, key=lambda i: tee_times[i]):
+        while out and out[0][0] <= tee_times[i]:
+            _, user_id = heapq.heappop(out)
+            heapq.heappush(available, entry(user_id))
+
+        caddies = []
+        for _ in range(caddies_needed(groups[i])):
+            if not available:
+                break
+            user_id = heapq.heappop(available)[-1]
+            loops[user_id] += 1
+            caddies.append(user_id)
+            heapq.heappush(out, (tee_times[i] + ROUND_MINUTES, user_id))
+        unfilled += caddies_needed(groups[i]) - len(caddies)
+        groups[i]["caddies"] = caddies
+    return groups, unfilled
+
+
+def caddy_load(user_ids, date):
+    """Loops logged on ``date`` and loops this season of each caddy, as two dicts by user id."""
+    loops_today = dict(
+        Loop.objects.filter(caddy_id__in=user_ids, date=date)
+        .order_by()
+        .values("caddy_id")
+        .annotate(total=Sum("num_loops"))
+        .values_list("caddy_id", "total")
+    )
+    season_loops = dict(
+        SeasonStats.objects.filter(user_id__in=user_ids, season=date.year).values_list(
+            "user_id", "total_loops"
+        )
+    )
+    return loops_today, season_loops
+
+
+def assign_shack(shack_id, roster, keep_before=None):
+    """
+    Run assign over the shack's golfer_groups and save the result. The row
+    is locked while it runs so two caddymasters can't overwrite each other.
+    Returns the shack and the number of bags without a caddy.
+    """
+    with transaction.atomic():
+        shack = CaddyShack.objects.select_for_update().get(pk=shack_id)
+        loops_today, season_loops = caddy_load(roster, shack.date)
+        shack.golfer_groups, unfilled = assign(
+            shack.golfer_groups or [], roster, loops_today, season_loops, keep_before
+        )
+        shack.save(update_fields=["golfer_groups"])
+    return shack, unfilled
+
+
+def named_groups(groups):
+    """The groups in tee time order with "caddy_names" next to the caddy ids, for templates."""
+    user_ids = {user_id for group in groups for user_id in group.get("caddies", [])}
+    usernames = dict(User.objects.filter(id__in=user_ids).values_list("id", "username"))
+    named = []
+    for group in sorted(groups, key=lambda group: group.get("tee_time", "")):
+        group = dict(group)
+        group["caddy_names"] = [usernames.get(user_id, "(deleted)") for user_id in group.get("caddies", [])]
+        named.append(group)
+    return named
@@ -0,0 +1,36 @@
+from django.contrib.auth.models import User
+from django import forms
+from django.core.exceptions import ValidationError
+
+from .teesheet import DEFAULT_TITLE
+
+
+class RosterForm(forms.Form):
+    roster = forms.CharField(
+        label="Checked in caddies, one username per line in check-in order",
+        widget=forms.Textarea(attrs={"rows": 12}),
+    )
+
+    def clean_roster(self):
+        usernames = [line.strip().lower() for line in self.cleaned_data["roster"].splitlines()]
+        usernames = list(dict.fromkeys(username for username in usernames if username))
+        user_ids = dict(
+            User.objects.filter(
+                username__in=usernames, is_active=True, is_staff=False, caddy__isnull=False
+            ).values_list("username", "id")
+        )
+        missing = [username for username in usernames if username not in user_ids]
+        if missing:
+            raise ValidationError(f"No caddy called {', '.join(missing)}")
+        # user ids in check-in order
+        return [user_ids[username] for username in usernames]
+
+
+class TeeSheetForm(forms.Form):
+    csv_file = forms.FileField(label="Tee sheet CSV")
+    title = forms.CharField(
+        max_length=100, required=False, help_text="Name for days that don't have a shack yet"
+    )
+
+    def clean_title(self):
+        return self.cleaned_data["title"] or DEFAULT_TITLE
@@ -0,0 +1,63 @@
+import datetime
+
+from django.contrib.auth.models import User
+from django.db.models import IntegerField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+from loopers.models import Loop
+
+from .models import Assignment, valid_groups
+
+
+def rebuild(shack, created=False):
+    """Replace the shack's Assignment rows with the caddies in its golfer_groups."""
+    groups = valid_groups(shack)
+    user_ids = {user_id for group in groups for user_id in group.get("caddies", [])}
+    # golfer_groups can still name caddies whose accounts are gone
+    existing = set(User.objects.filter(id__in=user_ids).values_list("id", flat=True)) if user_ids else set()
+    if not created:
+        Assignment.objects.filter(shack=shack).delete()
+    Assignment.objects.bulk_create(
+        Assignment(
+            shack=shack,
+            caddy_id=user_id,
+            date=shack.date,
+            tee_time=datetime.time.fromisoformat(group["tee_time"]),
+            tee=group.get("tee", ""),
+            golfers=group.get("golfers", []),
+        )
+        for group in groups
+        for user_id in dict.fromkeys(group.get("caddies", []))
+        if user_id in existing
+    )
+
+
+def with_loops(assignments):
+    """
+    ``assignments`` with the loops and money the caddy logged that day as
+    ``loops_logged`` and ``money_logged``, read off the loop_caddy_date_id_idx
+    index.
+    """
+    day = Loop.objects.filter(caddy=OuterRef("caddy"), date=OuterRef("date")).order_by().values("caddy")
+    return assignments.annotate(
+        loops_logged=Coalesce(
+            Subquery(day.annotate(total=Sum("num_loops")).values("total")), Value(0), output_field=IntegerField()
+        ),
+        money_logged=Coalesce(
+            Subquery(day.annotate(total=Sum("money")).values("total")), Value(0), output_field=IntegerField()
+        ),
+    )
+
+
+def caddy_history(user, start, end):
+    """The groups ``user`` caddied for from ``start`` to ``end``, oldest first."""
+    assignments = Assignment.objects.filter(caddy=user, date__range=(start, end)).select_related("shack")
+    return with_loops(assignments).order_by("date", "tee_time")
+
+
+def roster(caddy_master, date):
+    """Who went out with which group from ``caddy_master``'s shacks on ``date``."""
+    assignments = Assignment.objects.filter(shack__caddy_master=caddy_master, date=date).select_related(
+        "caddy", "shack"
+    )
+    return with_loops(assignments).order_by("caddy__username", "tee_time")
@@ -0,0 +1,128 @@
+import asyncio
+import contextlib
+import json
+import threading
+from collections import defaultdict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from . import assignment
+from .models import CaddyShack
+
+# seconds between comments sent down an idle stream so proxies keep it open
+KEEPALIVE = 15
+# messages a client that stopped reading can fall behind by, older ones are dropped
+QUEUE_SIZE = 16
+
+
+class LocalBackend:
+    """
+    Pub/sub between the connections of this process. Each subscriber is an
+    asyncio queue on the event loop it subscribed from, and publish can be
+    called from any thread, so a sync view reaches streams held by the ASGI
+    event loop.
+
+    A backend for more than one process needs the same publish, subscribe
+    and has_subscribers, e.g. publishing to redis and having one listener
+    per process pass messages on to a LocalBackend. has_subscribers lets a
+    save skip building a board nobody is watching, one that can't tell
+    should return True. Set settings.LIVE_BOARD_BACKEND to its dotted path.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # channel -> {(event loop, queue)}
+        self.subscribers = defaultdict(set)
+
+    def has_subscribers(self, channel):
+        with self.lock:
+            return bool(self.subscribers.get(channel))
+
+    def publish(self, channel, message):
+        with self.lock:
+            subscribers = list(self.subscribers.get(channel, ()))
+        for loop, queue in subscribers:
+            try:
+                loop.call_soon_threadsafe(_put, queue, message)
+            except RuntimeError:
+                # the loop closed, its subscriptions go with it
+                pass
+
+    @contextlib.asynccontextmanager
+    async def subscribe(self, channel):
+        entry = (asyncio.get_running_loop(), asyncio.Queue(QUEUE_SIZE))
+        with self.lock:
+            self.subscribers[channel].add(entry)
+        try:
+            yield entry[1]
+        finally:
+            with self.lock:
+                self.subscribers[channel].discard(entry)
+                if not self.subscribers[channel]:
+                    del self.subscribers[channel]
+
+
+def _put(queue, message):
+    if queue.full():
+        # a board only needs its newest state
+        queue.get_nowait()
+    queue.put_nowait(message)
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def backend():
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            _backend = import_string(settings.LIVE_BOARD_BACKEND)()
+        return _backend
+
+
+def channel(shack_id):
+    return f"shack:{shack_id}"
+
+
+def board(shack):
+    """What a shack's board shows, as a JSON string."""
+    return json.dumps({
+        "title": shack.caddy_shack_title,
+        "date": shack.date.isoformat(),
+        "groups": assignment.named_groups(shack.golfer_groups or []),
+    })
+
+
+def shack_changed(shack):
+    # building the board reads the caddies' names, don't for nobody
+    if backend().has_subscribers(channel(shack.pk)):
+        backend().publish(channel(shack.pk), board(shack))
+
+
+def event(data, name="board"):
+    lines = "".join(f"data: {line}\n" for line in data.splitlines())
+    return f"event: {name}\n{lines}\n"
+
+
+async def stream(shack_id):
+    """
+    Server-Sent Events for a shack: the board when the client connects,
+    then the board again every time the shack is saved. Waiting costs a
+    coroutine on the event loop, the database is only read on connect.
+    """
+    async with backend().subscribe(channel(shack_id)) as queue:
+        # read after subscribing so a save in between isn't missed
+        shack = await CaddyShack.objects.filter(pk=shack_id).afirst()
+        if shack is None:
+            return
+        yield event(await sync_to_async(board)(shack))
+        while True:
+            try:
+                message = await asyncio.wait_for(queue.get(), KEEPALIVE)
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+                continue
+            yield event(message)
@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from caddymaster import teesheet
+from caddymaster.models import CaddyMaster
+
+
+class Command(BaseCommand):
+    help = "Import a tee sheet CSV into a caddymaster's shacks, one per day on the sheet"
+
+    def add_arguments(self, parser):
+        parser.add_argument("username", help="the caddymaster's username")
+        parser.add_argument("csv_file")
+        parser.add_argument(
+            "--title", default=teesheet.DEFAULT_TITLE, help="name for days that don't have a shack yet"
+        )
+        parser.add_argument(
+            "--dry-run", action="store_true", help="only report what would change"
+        )
+
+    def handle(self, *args, **options):
+        try:
+            caddy_master = CaddyMaster.objects.get(user__username=options["username"])
+        except CaddyMaster.DoesNotExist:
+            raise CommandError(f"Caddymaster {options['username']} does not exist")
+
+        with open(options["csv_file"], newline="", encoding="utf-8-sig") as lines:
+            result = teesheet.import_teesheet(
+                caddy_master, lines, title=options["title"], dry_run=options["dry_run"]
+            )
+
+        for line in teesheet.report_lines(result):
+            self.stdout.write(line)
+        written = sum(day.action != "unchanged" for day in result.days)
+        verb = "Would change" if options["dry_run"] else "Changed"
+        self.stdout.write(self.style.SUCCESS(f"{verb} {written} of {len(result.days)} days"))
+        if result.errors:
+            self.stderr.write(f"{len(result.errors)} rows could not be imported")
+            for line, message, row in result.errors:
+                self.stderr.write(f"line {line}: {message}")
@@ -0,0 +1,19 @@
+# Generated by Django 5.0.1 on 2026-10-17 19:13
+
+import caddymaster.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('caddymaster', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='caddyshack',
+            name='golfer_groups',
+            field=models.JSONField(null=True, validators=[caddymaster.models.validate_golfer_groups]),
+        ),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 5.0.1 on 2026-10-17 19:19
+
+import datetime
+
+import caddymaster.models
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_assignments(apps, schema_editor):
+    CaddyShack = apps.get_model("caddymaster", "CaddyShack")
+    Assignment = apps.get_model("caddymaster", "Assignment")
+    User = apps.get_model(*settings.AUTH_USER_MODEL.split("."))
+
+    user_ids = set(User.objects.values_list("id", flat=True))
+    for shack in CaddyShack.objects.exclude(golfer_groups=None).iterator():
+        Assignment.objects.bulk_create(
+            Assignment(
+                shack=shack,
+                caddy_id=user_id,
+                date=shack.date,
+                tee_time=datetime.time.fromisoformat(group["tee_time"]),
+                tee=group.get("tee", ""),
+                golfers=group.get("golfers", []),
+            )
+            for group in caddymaster.models.valid_groups(shack)
+            for user_id in dict.fromkeys(group.get("caddies", []))
+            if user_id in user_ids
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('caddymaster', '0002_golfer_groups_schema'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Assignment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('tee_time', models.TimeField()),
+                ('tee', models.CharField(blank=True, max_length=20)),
+                ('golfers', models.JSONField(default=list)),
+                ('caddy', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='assignments', to=settings.AUTH_USER_MODEL)),
+                ('shack', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='assignments', to='caddymaster.caddyshack')),
+            ],
+            options={
+                'ordering': ['-date', 'tee_time'],
+                'indexes': [models.Index(fields=['caddy', 'date'], name='assignment_caddy_date_idx'), models.Index(fields=['date', 'tee_time'], name='assignment_date_tee_idx')],
+            },
+        ),
+        migrations.RunPython(backfill_assignments, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.0.1 on 2026-10-17 19:31
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('caddymaster', '0003_assignment'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReportDay',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('caddy_master', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='caddymaster.caddymaster')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ReportRow',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('loops', models.IntegerField()),
+                ('money', models.IntegerField()),
+                ('caddy', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+                ('caddy_master', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='caddymaster.caddymaster')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='reportday',
+            constraint=models.UniqueConstraint(fields=('caddy_master', 'date'), name='unique_report_day'),
+        ),
+        migrations.AddConstraint(
+            model_name='reportrow',
+            constraint=models.UniqueConstraint(fields=('caddy_master', 'date', 'caddy'), name='unique_report_row'),
+        ),
+    ]
@@ -1,8 +1,17 @@
 import datetime
+import logging
+import re
 
-from django.db import models
+from django.db import models, transaction
+from django.core.exceptions import ValidationError
 from django.contrib.auth.models import User
 
+GROUP_KEYS = {"tee_time", "tee", "golfers", "caddies_needed", "caddies"}
+TEE_TIME = re.compile(r"^([01]\d|2[0-3]):[0-5]\d$")
+
+logger = logging.getLogger(__name__)
+
+
 class CaddyMaster(models.Model):
 
     user = models.OneToOneField(User, null=True, on_delete=models.SET_NULL)
@@ -12,15 +21,130 @@ class CaddyMaster(models.Model):
     def __str__(self):
         return self.user.username
 
+def validate_golfer_groups(value):
+    # a list of {"tee_time": "HH:MM", "tee": "10", "golfers": [...],
+    # "caddies_needed": 2, "caddies": [user ids]}, only tee_time is required.
+    # made by caddymaster.teesheet, caddies filled in by caddymaster.assignment
+    if value is None:
+        return
+    if not isinstance(value, list):
+        raise ValidationError("Golfer groups must be a list")
+    for number, group in enumerate(value, 1):
+        if not isinstance(group, dict):
+            raise ValidationError(f"Group {number} must be an object")
+        unknown = set(group) - GROUP_KEYS
+        if unknown:
+            raise ValidationError(f"Group {number} has unknown keys: {', '.join(sorted(unknown))}")
+        tee_time = group.get("tee_time")
+        if not isinstance(tee_time, str) or not TEE_TIME.match(tee_time):
+            raise ValidationError(f"Group {number} needs a tee_time like 07:30")
+        if not isinstance(group.get("tee", ""), str):
+            raise ValidationError(f"Group {number} tee must be a string")
+        golfers = group.get("golfers", [])
+        if not isinstance(golfers, list) or not all(isinstance(name, str) and name for name in golfers):
+            raise ValidationError(f"Group {number} golfers must be a list of names")
+        needed = group.get("caddies_needed", 0)
+        if type(needed) is not int or needed < 0:
+            raise ValidationError(f"Group {number} caddies_needed must be a whole number")
+        caddies = group.get("caddies", [])
+        if not isinstance(caddies, list) or not all(type(user_id) is int for user_id in caddies):
+            raise ValidationError(f"Group {number} caddies must be a list of user ids")
+
+
+def valid_groups(shack):
+    """
+    The groups in ``shack.golfer_groups`` that pass validate_golfer_groups.
+    Shacks saved before the validator was added can hold anything, the
+    rest are logged and skipped.
+    """
+    groups = shack.golfer_groups
+    if groups is None:
+        return []
+    if not isinstance(groups, list):
+        logger.warning("Shack %s golfer_groups is not a list, skipped", shack.pk)
+        return []
+    valid = []
+    for number, group in enumerate(groups, 1):
+        try:
+            validate_golfer_groups([group])
+        except ValidationError as e:
+            logger.warning("Shack %s group %s skipped: %s", shack.pk, number, " ".join(e.messages))
+            continue
+        valid.append(group)
+    return valid
+
+
 class CaddyShack(models.Model):
     caddy_shack_title = models.CharField(max_length=100)
     date = models.DateField(default=datetime.date.today)
 
     caddy_master = models.ForeignKey(CaddyMaster, on_delete=models.CASCADE)
-    golfer_groups = models.JSONField(null=True)
+    golfer_groups = models.JSONField(null=True, validators=[validate_golfer_groups])
 
     class Meta:
         ordering = ["-date"]
 
     def __str__(self):
         return self.caddy_shack_title
+
+    def save(self, *args, **kwargs):
+        # post_save rebuilds the shack's Assignment rows, one transaction for both
+        with transaction.atomic(savepoint=False):
+            super().save(*args, **kwargs)
+
+
+class Assignment(models.Model):
+    # one row per caddy per group, rebuilt from CaddyShack.golfer_groups
+    # whenever a shack is saved (caddymaster.signals) so history and roster
+    # queries don't read the JSON
+    shack = models.ForeignKey(CaddyShack, on_delete=models.CASCADE, related_name="assignments")
+    caddy = models.ForeignKey(User, on_delete=models.CASCADE, related_name="assignments")
+    # copied from the shack and the group
+    date = models.DateField()
+    tee_time = models.TimeField()
+    tee = models.CharField(max_length=20, blank=True)
+    golfers = models.JSONField(default=list)
+
+    class Meta:
+        ordering = ["-date", "tee_time"]
+        indexes = [
+            # a caddy's history, and joining to their Loop rows for the day
+            models.Index(fields=["caddy", "date"], name="assignment_caddy_date_idx"),
+            models.Index(fields=["date", "tee_time"], name="assignment_date_tee_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.caddy.username} {self.date} {self.tee_time:%H:%M}"
+
+
+class ReportDay(models.Model):
+    # a settled day whose ReportRows are written, see caddymaster.reports.
+    # kept even when nobody worked so the day isn't added up again
+    caddy_master = models.ForeignKey(CaddyMaster, on_delete=models.CASCADE)
+    date = models.DateField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["caddy_master", "date"], name="unique_report_day"),
+        ]
+
+    def __str__(self):
+        return f"{self.caddy_master} {self.date}"
+
+
+class ReportRow(models.Model):
+    # one caddy's loops and money on a settled day from the caddymaster's
+    # shacks, never changed once written
+    caddy_master = models.ForeignKey(CaddyMaster, on_delete=models.CASCADE)
+    date = models.DateField()
+    caddy = models.ForeignKey(User, on_delete=models.CASCADE)
+    loops = models.IntegerField()
+    money = models.IntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["caddy_master", "date", "caddy"], name="unique_report_row"),
+        ]
+
+    def __str__(self):
+        return f"{self.caddy.username} {self.date}"
@@ -0,0 +1,133 @@
+import datetime
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Count, Exists, OuterRef, Sum
+
+from loopers.models import Loop
+
+from .models import Assignment, ReportDay, ReportRow
+
+PERIODS = ["day", "week", "season"]
+# caddies log loops after the round, a day is only snapshotted once this
+# many days have passed. loops logged for it later aren't in its reports
+SETTLE_DAYS = 3
+
+
+def period_range(period, date):
+    """First and last day of the day, week (from monday) or season (calendar year) holding ``date``."""
+    if period == "day":
+        return date, date
+    if period == "week":
+        start = date - datetime.timedelta(days=date.weekday())
+        return start, start + datetime.timedelta(days=6)
+    return date.replace(month=1, day=1), date.replace(month=12, day=31)
+
+
+def shack_loops(caddy_master, start, end):
+    """Loops logged from ``start`` to ``end`` by caddies on a day they went out from one of the caddymaster's shacks."""
+    worked = Assignment.objects.filter(
+        shack__caddy_master=caddy_master, caddy=OuterRef("caddy"), date=OuterRef("date")
+    )
+    return Loop.objects.filter(Exists(worked), date__range=(start, end)).order_by()
+
+
+def snapshot(caddy_master, dates):
+    """Write ReportDay and ReportRow for ``dates``, settled days that don't have them yet."""
+    dates = set(dates)
+    rows = (
+        shack_loops(caddy_master, min(dates), max(dates))
+        .values("date", "caddy")
+        .annotate(loops=Sum("num_loops"), money=Sum("money"))
+    )
+    with transaction.atomic():
+        # another request may have just written some of these, they'd be the same
+        ReportRow.objects.bulk_create(
+            (
+                ReportRow(caddy_master=caddy_master, date=row["date"], caddy_id=row["caddy"], loops=row["loops"], money=row["money"])
+                for row in rows
+                if row["date"] in dates
+            ),
+            ignore_conflicts=True,
+        )
+        ReportDay.objects.bulk_create(
+            (ReportDay(caddy_master=caddy_master, date=date) for date in dates), ignore_conflicts=True
+        )
+
+
+def report(caddy_master, start, end, today=None):
+    """
+    Loops and money per caddy from ``start`` to ``end``, with totals,
+    averages and a line per day. Settled days come from their snapshots and
+    only the last SETTLE_DAYS are added up from Loop, so a season costs
+    about the same handful of queries as a day.
+    """
+    today = today or datetime.date.today()
+    end = min(end, today)
+    settled_end = min(end, today - datetime.timedelta(days=SETTLE_DAYS))
+
+    # (grouped queryset per caddy, grouped queryset per day) for each source
+    sources = []
+    if start <= settled_end:
+        have = set(
+            ReportDay.objects.filter(caddy_master=caddy_master, date__range=(start, settled_end)).values_list(
+                "date", flat=True
+            )
+        )
+        days = (start + datetime.timedelta(days=i) for i in range((settled_end - start).days + 1))
+        missing = [date for date in days if date not in have]
+        if missing:
+            snapshot(caddy_master, missing)
+        snapshots = ReportRow.objects.filter(caddy_master=caddy_master, date__range=(start, settled_end)).order_by()
+        sources.append((
+            snapshots.values("caddy", "caddy__username").annotate(loops=Sum("loops"), money=Sum("money"), days=Count("id")),
+            snapshots.values("date").annotate(loops=Sum("loops"), money=Sum("money"), caddies=Count("caddy")),
+        ))
+    if settled_end < end:
+        live = shack_loops(caddy_master, max(start, settled_end + datetime.timedelta(days=1)), end)
+        sources.append((
+            live.values("caddy", "caddy__username").annotate(
+                loops=Sum("num_loops"), money=Sum("money"), days=Count("date", distinct=True)
+            ),
+            live.values("date").annotate(loops=Sum("num_loops"), money=Sum("money"), caddies=Count("caddy", distinct=True)),
+        ))
+
+    caddies = defaultdict(lambda: {"loops": 0, "money": 0, "days": 0})
+    days = []
+    for per_caddy, per_day in sources:
+        for row in per_caddy:
+            caddy = caddies[row["caddy__username"]]
+            for field in ("loops", "money", "days"):
+                caddy[field] += row[field]
+        days += list(per_day)
+
+    rows = [{"username": username, **totals} for username, totals in caddies.items()]
+    rows.sort(key=lambda row: (-row["money"], row["username"]))
+    for row in rows:
+        row["money_per_loop"] = round(row["money"] / row["loops"], 2) if row["loops"] else 0
+
+    loops = sum(row["loops"] for row in rows)
+    money = sum(row["money"] for row in rows)
+    return {
+        "start": start,
+        "end": end,
+        "rows": rows,
+        "days": sorted(days, key=lambda day: day["date"]),
+        "totals": {
+            "caddies": len(rows),
+            "loops": loops,
+            "money": money,
+            "money_per_loop": round(money / loops, 2) if loops else 0,
+            "loops_per_caddy": round(loops / len(rows), 2) if rows else 0,
+            "money_per_caddy": round(money / len(rows), 2) if rows else 0,
+        },
+    }
+
+
+def csv_rows(result):
+    """Rows for a CSV of ``result``, one per caddy and a total."""
+    yield ["caddy", "days", "loops", "money", "money_per_loop"]
+    for row in result["rows"]:
+        yield [row["username"], row["days"], row["loops"], row["money"], row["money_per_loop"]]
+    totals = result["totals"]
+    yield ["total", "", totals["loops"], totals["money"], totals["money_per_loop"]]
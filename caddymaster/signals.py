@@ -0,0 +1,19 @@
+from django.db import transaction
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from . import history, live
+from .models import CaddyShack
+
+
+@receiver(post_save, sender=CaddyShack)
+def publish_board(sender, instance, **kwargs):
+    transaction.on_commit(lambda: live.shack_changed(instance))
+
+
+@receiver(post_save, sender=CaddyShack)
+def sync_assignments(sender, instance, created, update_fields=None, **kwargs):
+    if update_fields is not None and not {"golfer_groups", "date"} & set(update_fields):
+        return
+    # CaddyShack.save runs this in the save's transaction
+    history.rebuild(instance, created)
@@ -0,0 +1,218 @@
+import csv
+import datetime
+import re
+from collections import defaultdict
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+
+from .assignment import caddies_needed
+from .models import CaddyShack, validate_golfer_groups
+
+DATE_FORMATS = ("%Y-%m-%d", "%m/%d/%Y", "%m/%d/%y")
+TIME_FORMATS = ("%H:%M", "%H:%M:%S", "%I:%M %p", "%I:%M%p", "%I:%M:%S %p")
+# what tee sheet exports call the columns, after lower casing and spaces to _
+COLUMNS = {
+    "date": "date",
+    "day": "date",
+    "tee_time": "tee_time",
+    "time": "tee_time",
+    "tee": "tee",
+    "starting_tee": "tee",
+    "caddies_needed": "caddies_needed",
+    "caddies": "caddies_needed",
+}
+# player_1..player_4 or golfer1.., or one golfers column with names split by ;
+GOLFER_COLUMN = re.compile(r"^(player|golfer)s?_?\d*$")
+WHITESPACE = re.compile(r"\s+")
+DEFAULT_TITLE = "Caddy shack"
+# tees are "1", "10" or a course name like "North"
+TEE_MAX_LENGTH = 20
+
+
+class DayDiff:
+    def __init__(self, date):
+        self.date = date
+        self.added = []
+        self.removed = []
+        self.changed = []
+        self.unchanged = 0
+        # "created", "updated" or "unchanged"
+        self.action = "unchanged"
+
+
+class TeeSheetResult:
+    def __init__(self):
+        self.days = []
+        # (line number, error message, row) for every row that was skipped
+        self.errors = []
+
+
+def _column(name):
+    name = WHITESPACE.sub("_", (name or "").strip().lower())
+    if GOLFER_COLUMN.match(name):
+        return "golfers"
+    return COLUMNS.get(name)
+
+
+def _parse(value, formats, what):
+    value = value.strip()
+    for fmt in formats:
+        try:
+            return datetime.datetime.strptime(value, fmt)
+        except ValueError:
+            continue
+    raise ValueError(f"{what} {value!r} isn't one of the formats we know")
+
+
+def normalize(row, columns):
+    """(date, group) for a tee sheet row, or None for an empty tee time. Raises ValueError."""
+    golfers = []
+    fields = {}
+    for header, value in row.items():
+        column = columns.get(header)
+        value = (value or "").strip()
+        if column == "golfers":
+            golfers += [WHITESPACE.sub(" ", name).strip() for name in value.split(";")]
+        elif column and value:
+            fields[column] = value
+
+    group = {"tee_time": _parse(fields.get("tee_time", ""), TIME_FORMATS, "Tee time").strftime("%H:%M")}
+    date = _parse(fields.get("date", ""), DATE_FORMATS, "Date").date()
+    if "tee" in fields:
+        if len(fields["tee"]) > TEE_MAX_LENGTH:
+            raise ValueError(f"Tee {fields['tee'][:TEE_MAX_LENGTH]!r}... is longer than {TEE_MAX_LENGTH} characters")
+        group["tee"] = fields["tee"]
+    group["golfers"] = [name for name in golfers if name]
+    if "caddies_needed" in fields:
+        try:
+            group["caddies_needed"] = int(fields["caddies_needed"])
+        except ValueError:
+            raise ValueError(f"Caddies needed {fields['caddies_needed']!r} isn't a number")
+        if group["caddies_needed"] < 0:
+            raise ValueError("Caddies needed can't be negative")
+    if not group["golfers"] and "caddies_needed" not in group:
+        # an open slot on the sheet
+        return None
+    return date, group
+
+
+def slot(group):
+    return group["tee_time"], group.get("tee", "")
+
+
+def merge(existing, imported, diff):
+    """
+    The day's groups after importing ``imported`` over ``existing``, in tee
+    time order. Groups keep the caddies already assigned to their slot.
+    """
+    old = {slot(group): group for group in existing}
+    merged = []
+    for key in sorted(imported):
+        group = imported[key]
+        before = old.pop(key, None)
+        if before is None:
+            diff.added.append(group)
+            merged.append(group)
+            continue
+        if before.get("caddies"):
+            group["caddies"] = before["caddies"][:caddies_needed(group)]
+        if group == before:
+            diff.unchanged += 1
+        else:
+            diff.changed.append((before, group))
+        merged.append(group)
+    diff.removed = list(old.values())
+    return merged
+
+
+def import_teesheet(caddy_master, lines, title=DEFAULT_TITLE, dry_run=False):
+    """
+    Read a tee sheet from CSV ``lines`` into ``caddy_master``'s shacks, one
+    per date on the sheet. Rows are read one at a time and only their
+    normalized groups are kept, so a large sheet is in memory once. Each
+    day is written at most once and only when it changed, so importing the
+    same sheet again writes nothing. A day whose shack holds groups that
+    don't validate is skipped and reported in the errors. With ``dry_run``
+    nothing is written, the diff shows what would change.
+    """
+    result = TeeSheetResult()
+    reader = csv.DictReader(lines)
+    columns = {header: _column(header) for header in reader.fieldnames or []}
+    missing = [name for name in ("date", "tee_time", "golfers") if name not in columns.values()]
+    if missing:
+        result.errors.append((1, f"Missing columns: {', '.join(missing)}", {}))
+        return result
+
+    # date -> slot -> group
+    days = defaultdict(dict)
+    # date -> line it's first on, for errors about the whole day
+    first_line = {}
+    for row in reader:
+        try:
+            parsed = normalize(row, columns)
+        except ValueError as e:
+            result.errors.append((reader.line_num, str(e), row))
+            continue
+        if parsed is None:
+            continue
+        date, group = parsed
+        if slot(group) in days[date]:
+            result.errors.append((reader.line_num, f"{date} {group['tee_time']} is on the sheet twice", row))
+            continue
+        days[date][slot(group)] = group
+        first_line.setdefault(date, reader.line_num)
+
+    with transaction.atomic():
+        shacks = {}
+        for shack in CaddyShack.objects.select_for_update().filter(
+            caddy_master=caddy_master, date__in=list(days)
+        ).order_by("id"):
+            shacks.setdefault(shack.date, shack)
+
+        for date in sorted(days):
+            diff = DayDiff(date)
+            shack = shacks.get(date)
+            existing = (shack.golfer_groups or []) if shack else []
+            imported = days.pop(date)
+            try:
+                # shacks saved before golfer_groups was validated can hold anything
+                validate_golfer_groups(existing)
+                groups = merge(existing, imported, diff)
+                validate_golfer_groups(groups)
+            except ValidationError as e:
+                result.errors.append((first_line[date], f"{date} not imported: {' '.join(e.messages)}", {}))
+                continue
+            if shack is None:
+                diff.action = "created"
+                if not dry_run:
+                    CaddyShack.objects.create(
+                        caddy_shack_title=title, date=date, caddy_master=caddy_master, golfer_groups=groups
+                    )
+            elif groups != shack.golfer_groups:
+                diff.action = "updated"
+                if not dry_run:
+                    shack.golfer_groups = groups
+                    shack.save(update_fields=["golfer_groups"])
+            result.days.append(diff)
+    return result
+
+
+def _describe(group):
+    tee = f" tee {group['tee']}" if group.get("tee") else ""
+    return f"{group['tee_time']}{tee} {', '.join(group.get('golfers', [])) or '(no names)'}"
+
+
+def report_lines(result):
+    """What an import changed, day by day."""
+    for day in result.days:
+        yield (
+            f"{day.date}: {day.action}, {len(day.added)} added, {len(day.changed)} changed, "
+            f"{len(day.removed)} removed, {day.unchanged} unchanged"
+        )
+        for group in day.added:
+            yield f"  + {_describe(group)}"
+        for before, after in day.changed:
+            yield f"  ~ {_describe(before)} -> {_describe(after)}"
+        for group in day.removed:
+            yield f"  - {_describe(group)}"
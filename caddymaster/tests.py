@@ -1,3 +1,604 @@
+import asyncio
+import datetime
+import importlib
+import io
+import json
+import os
+import tempfile
+from unittest import mock
+
+from asgiref.sync import sync_to_async
+from django.apps import apps
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
 from django.test import TestCase
+from django.urls import reverse
+
+from loopers.models import Caddy, Loop, SeasonStats
+from loopers.tests.utils import QueryBudgetMixin
+
+from . import assignment, history, live, reports, teesheet
+from .models import Assignment, CaddyMaster, CaddyShack, ReportDay, validate_golfer_groups
+
+
+class AssignTest(TestCase):
+    def test_rotation_order(self):
+        groups = [
+            {"tee_time": "08:00", "golfers": ["a"]},
+            {"tee_time": "07:00", "golfers": ["b", "c"]},
+            {"tee_time": "09:00", "golfers": ["d"]},
+        ]
+        # 1 worked a loop already today, 2 has more loops this season than 3 and 4
+        result, unfilled = assignment.assign(groups, [1, 2, 3, 4], {1: 1}, {2: 40, 3: 10, 4: 10})
+        self.assertEqual(unfilled, 0)
+        self.assertEqual([group["caddies"] for group in result], [[2], [3, 4], [1]])
+        self.assertNotIn("caddies", groups[0])
+
+    def test_caddies_go_out_again(self):
+        groups = [
+            {"tee_time": "07:00", "caddies_needed": 2},
+            {"tee_time": "08:00", "caddies_needed": 1},
+            {"tee_time": "11:30", "caddies_needed": 2},
+        ]
+        result, unfilled = assignment.assign(groups, [1, 2, 3], {}, {})
+        self.assertEqual([group["caddies"] for group in result], [[1, 2], [3], [1, 2]])
+        self.assertEqual(unfilled, 0)
+
+        # 11:29 is before the first group is back
+        groups[2]["tee_time"] = "11:29"
+        result, unfilled = assignment.assign(groups, [1, 2, 3], {}, {})
+        self.assertEqual(result[2]["caddies"], [])
+        self.assertEqual(unfilled, 2)
+
+    def test_returning_caddies_wait_behind_fresh_ones(self):
+        groups = [
+            {"tee_time": "07:00", "caddies_needed": 1},
+            {"tee_time": "12:00", "caddies_needed": 1},
+        ]
+        result, _ = assignment.assign(groups, [1, 2], {}, {1: 0, 2: 50})
+        self.assertEqual([group["caddies"] for group in result], [[1], [2]])
+
+    def test_groups_already_out_keep_caddies(self):
+        groups = [
+            {"tee_time": "07:00", "caddies_needed": 1, "caddies": [3]},
+            {"tee_time": "10:00", "caddies_needed": 2, "caddies": [3, 1]},
+        ]
+        result, _ = assignment.assign(groups, [1, 2, 3], {}, {}, keep_before=9 * 60)
+        self.assertEqual(result[0]["caddies"], [3])
+        # 3 is still on the course
+        self.assertEqual(result[1]["caddies"], [1, 2])
+
+    def test_invalid_tee_time(self):
+        with self.assertRaisesMessage(ValueError, "Group 2 has no valid tee time"):
+            assignment.assign([{"tee_time": "07:00"}, {"tee_time": "7am"}], [1], {}, {})
+
+    def test_full_shack(self):
+        roster = list(range(1, 401))
+        groups = [
+            {"tee_time": f"{7 + minutes // 60:02d}:{minutes % 60:02d}", "golfers": ["a", "b", "c", "d"]}
+            for minutes in range(0, 10 * 60, 6)
+        ]
+        result, unfilled = assignment.assign(groups, roster, {}, {user_id: user_id % 7 for user_id in roster})
+        self.assertEqual(unfilled, 0)
+        out_until = {}
+        for group in result:
+            tee = assignment.tee_minutes(group, 0)
+            for user_id in group["caddies"]:
+                self.assertLessEqual(out_until.get(user_id, 0), tee)
+                out_until[user_id] = tee + assignment.ROUND_MINUTES
+
+
+class AssignViewTest(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        master_user = User.objects.create_user(username="master", password="Stset01@")
+        self.master = CaddyMaster.objects.create(user=master_user)
+        self.shack = CaddyShack.objects.create(
+            caddy_shack_title="Main shack",
+            date=datetime.date(2024, 6, 1),
+            caddy_master=self.master,
+            golfer_groups=[
+                {"tee_time": "07:00", "golfers": ["Smith", "Jones"]},
+                {"tee_time": "07:10", "golfers": ["Brown"]},
+            ],
+        )
+        for name in ("alpha", "bravo", "charlie"):
+            user = User.objects.create_user(username=name, password="Stset01@")
+            Caddy.objects.create(user=user)
+        alpha = User.objects.get(username="alpha")
+        Loop.objects.create(loop_title="Early", date=datetime.date(2024, 6, 1), money=80, caddy=alpha)
+        SeasonStats.objects.create(user=User.objects.get(username="charlie"), season=2024, total_loops=30)
+        self.client.login(username="master", password="Stset01@")
+        self.url = reverse("caddymaster:assign", kwargs={"pk": self.shack.pk})
+
+    def test_assign(self):
+        response = self.client.post(self.url, {"roster": "alpha\nBravo\n\ncharlie\n"})
+        self.assertRedirects(response, self.url, fetch_redirect_response=False)
+        self.assertWithinQueryBudget(response)
+
+        self.shack.refresh_from_db()
+        ids = dict(User.objects.values_list("username", "id"))
+        self.assertEqual(
+            [group["caddies"] for group in self.shack.golfer_groups],
+            [[ids["bravo"], ids["charlie"]], [ids["alpha"]]],
+        )
+
+        response = self.client.get(self.url)
+        self.assertWithinQueryBudget(response)
+        self.assertContains(response, "Every group has its caddies")
+        self.assertContains(response, "bravo, charlie")
+
+    def test_not_enough_caddies(self):
+        response = self.client.post(self.url, {"roster": "alpha"}, follow=True)
+        self.assertContains(response, "Not enough caddies, 2 bags have no caddy")
+
+    def test_unknown_caddy(self):
+        response = self.client.post(self.url, {"roster": "alpha\nnobody"})
+        self.assertContains(response, "No caddy called nobody")
+        self.shack.refresh_from_db()
+        self.assertNotIn("caddies", self.shack.golfer_groups[0])
+
+    def test_other_caddymasters_shack(self):
+        other = User.objects.create_user(username="other", password="Stset01@")
+        CaddyMaster.objects.create(user=other)
+        self.client.login(username="other", password="Stset01@")
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+
+
+class LiveBoardTest(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        master = CaddyMaster.objects.create(user=User.objects.create_user(username="master"))
+        self.shack = CaddyShack.objects.create(
+            caddy_shack_title="Main shack",
+            date=datetime.date(2024, 6, 1),
+            caddy_master=master,
+            golfer_groups=[{"tee_time": "07:00", "golfers": ["Smith"]}],
+        )
+        self.caddy = User.objects.create_user(username="alpha", password="Stset01@")
+        Caddy.objects.create(user=self.caddy)
+        self.events_url = reverse("caddymaster:events", kwargs={"pk": self.shack.pk})
+
+    def test_save_publishes(self):
+        self.shack.golfer_groups[0]["caddies"] = [self.caddy.id]
+        with mock.patch.object(live.LocalBackend, "has_subscribers", return_value=True), \
+                mock.patch.object(live.LocalBackend, "publish") as publish:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.shack.save()
+        channel, message = publish.call_args.args
+        self.assertEqual(channel, f"shack:{self.shack.pk}")
+        self.assertEqual(json.loads(message)["groups"][0]["caddy_names"], ["alpha"])
+
+    def test_save_without_subscribers(self):
+        self.shack.golfer_groups[0]["caddies"] = [self.caddy.id]
+        with mock.patch.object(live.LocalBackend, "publish") as publish:
+            with self.captureOnCommitCallbacks() as callbacks:
+                self.shack.save()
+            # the board isn't built, so the caddies' names aren't read
+            with self.assertNumQueries(0):
+                for callback in callbacks:
+                    callback()
+        publish.assert_not_called()
+
+    async def test_stream(self):
+        await self.async_client.aforce_login(self.caddy)
+        response = await self.async_client.get(self.events_url)
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        chunks = response.streaming_content
+        first = (await anext(chunks)).decode()
+        self.assertTrue(first.startswith("event: board\ndata: "))
+        self.assertEqual(json.loads(first.split("data: ", 1)[1])["groups"][0]["golfers"], ["Smith"])
+
+        # published from another thread, like a sync view's on_commit
+        await sync_to_async(live.backend().publish, thread_sensitive=False)(
+            live.channel(self.shack.pk), '{"groups": []}'
+        )
+        self.assertEqual(await anext(chunks), b'event: board\ndata: {"groups": []}\n\n')
+
+        with mock.patch("caddymaster.live.KEEPALIVE", 0.01):
+            self.assertEqual(await anext(chunks), b": keepalive\n\n")
+
+        # the ASGI handler cancels the stream when the client goes away
+        waiting = asyncio.ensure_future(anext(chunks))
+        await asyncio.sleep(0.01)
+        waiting.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await waiting
+        self.assertNotIn(live.channel(self.shack.pk), live.backend().subscribers)
+
+    async def test_slow_clients_keep_the_newest(self):
+        backend = live.LocalBackend()
+        async with backend.subscribe("board") as queue:
+            for i in range(live.QUEUE_SIZE + 5):
+                backend.publish("board", str(i))
+            await asyncio.sleep(0)
+            self.assertEqual(queue.qsize(), live.QUEUE_SIZE)
+            self.assertEqual(queue.get_nowait(), "5")
+        self.assertEqual(backend.subscribers, {})
+
+    def test_needs_login_and_asgi(self):
+        self.assertEqual(self.client.get(self.events_url).status_code, 403)
+        self.client.login(username="alpha", password="Stset01@")
+        response = self.client.get(self.events_url)
+        self.assertEqual(response.status_code, 501)
+        self.assertWithinQueryBudget(response)
+
+    def test_board_page(self):
+        self.client.login(username="alpha", password="Stset01@")
+        response = self.client.get(reverse("caddymaster:board", kwargs={"pk": self.shack.pk}))
+        self.assertContains(response, "Smith")
+        self.assertContains(response, self.events_url)
+        self.assertWithinQueryBudget(response)
+
+
+SHEET = """Date,Time,Tee,Player 1,Player 2,Player 3,Player 4
+06/01/2024,7:00 AM,1,Smith,Jones,,
+06/01/2024,7:10 AM,1,Brown,,,
+06/01/2024,7:20 AM,1,,,,
+2024-06-02,13:05,10,  Green   Sr. ,White,Black,Gray
+"""
+
+
+class TeeSheetImportTest(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        user = User.objects.create_user(username="master", password="Stset01@")
+        self.master = CaddyMaster.objects.create(user=user)
+        self.client.login(username="master", password="Stset01@")
+
+    def run_import(self, sheet, **kwargs):
+        return teesheet.import_teesheet(self.master, io.StringIO(sheet), **kwargs)
+
+    def test_import(self):
+        result = self.run_import(SHEET)
+        self.assertEqual(result.errors, [])
+        self.assertEqual([day.action for day in result.days], ["created", "created"])
+        first, second = CaddyShack.objects.order_by("date")
+        self.assertEqual(first.date, datetime.date(2024, 6, 1))
+        self.assertEqual(first.golfer_groups, [
+            {"tee_time": "07:00", "tee": "1", "golfers": ["Smith", "Jones"]},
+            {"tee_time": "07:10", "tee": "1", "golfers": ["Brown"]},
+        ])
+        self.assertEqual(second.golfer_groups[0]["golfers"], ["Green Sr.", "White", "Black", "Gray"])
+        self.assertEqual(second.golfer_groups[0]["tee_time"], "13:05")
+
+    def test_rerun_writes_nothing(self):
+        self.run_import(SHEET)
+        with self.assertNumQueries(3):
+            result = self.run_import(SHEET)
+        self.assertEqual([day.action for day in result.days], ["unchanged", "unchanged"])
+        self.assertEqual(result.days[0].unchanged, 2)
+
+    def test_update_keeps_caddies(self):
+        self.run_import(SHEET)
+        shack = CaddyShack.objects.get(date=datetime.date(2024, 6, 1))
+        shack.golfer_groups[0]["caddies"] = [7, 8]
+        shack.golfer_groups[1]["caddies"] = [9]
+        shack.save()
+
+        result = self.run_import(
+            "Date,Time,Tee,Golfers\n"
+            "2024-06-01,07:00,1,Smith;Jones\n"
+            "2024-06-01,07:10,1,Brown;Lee\n"
+            "2024-06-01,07:30,1,Park\n"
+        )
+        day = result.days[0]
+        self.assertEqual(day.action, "updated")
+        self.assertEqual(day.unchanged, 1)
+        self.assertEqual(len(day.changed), 1)
+        self.assertEqual(day.added, [{"tee_time": "07:30", "tee": "1", "golfers": ["Park"]}])
+        shack.refresh_from_db()
+        self.assertEqual([group.get("caddies") for group in shack.golfer_groups], [[7, 8], [9], None])
+        self.assertEqual(list(teesheet.report_lines(result)), [
+            "2024-06-01: updated, 1 added, 1 changed, 0 removed, 1 unchanged",
+            "  + 07:30 tee 1 Park",
+            "  ~ 07:10 tee 1 Brown -> 07:10 tee 1 Brown, Lee",
+        ])
+
+    def test_dry_run(self):
+        result = self.run_import(SHEET, dry_run=True)
+        self.assertEqual(len(result.days), 2)
+        self.assertFalse(CaddyShack.objects.exists())
+
+    def test_bad_rows(self):
+        result = self.run_import(
+            "Date,Time,Player 1,Caddies\n"
+            "2024-06-01,07:00,Smith,\n"
+            "June 1st,07:10,Brown,\n"
+            "2024-06-01,25:00,Lee,\n"
+            "2024-06-01,07:00,Park,\n"
+            "2024-06-01,07:20,Kim,two\n"
+        )
+        self.assertEqual([(line, message) for line, message, _ in result.errors], [
+            (3, "Date 'June 1st' isn't one of the formats we know"),
+            (4, "Tee time '25:00' isn't one of the formats we know"),
+            (5, "2024-06-01 07:00 is on the sheet twice"),
+            (6, "Caddies needed 'two' isn't a number"),
+        ])
+        self.assertEqual(len(CaddyShack.objects.get().golfer_groups), 1)
+
+    def test_long_tee(self):
+        result = self.run_import("Date,Time,Tee,Golfers\n2024-06-01,07:00,%s,Smith\n" % ("x" * 30))
+        self.assertEqual(result.errors[0][:2], (2, f"Tee {'x' * 20!r}... is longer than 20 characters"))
+        self.assertFalse(CaddyShack.objects.exists())
+
+    def test_malformed_shack_skipped(self):
+        self.run_import(SHEET)
+        # saved by hand before golfer_groups was validated
+        CaddyShack.objects.filter(date=datetime.date(2024, 6, 1)).update(
+            golfer_groups=[{"tee_time": "07:00", "tee": "1", "golfers": ["Smith"], "caddies": "alpha"}]
+        )
+        result = self.run_import(SHEET.replace("Brown", "Lee"))
+        self.assertEqual([(line, message) for line, message, _ in result.errors], [
+            (2, "2024-06-01 not imported: Group 1 caddies must be a list of user ids"),
+        ])
+        self.assertEqual([day.date for day in result.days], [datetime.date(2024, 6, 2)])
+
+        url = reverse("caddymaster:import_teesheet")
+        sheet = SimpleUploadedFile("sheet.csv", SHEET.encode())
+        response = self.client.post(url, {"csv_file": sheet, "title": "North shack"})
+        self.assertRedirects(response, url, fetch_redirect_response=False)
+        self.assertContains(self.client.get(url), "1 rows could not be imported")
+
+    def test_missing_columns(self):
+        result = self.run_import("Date,Name\n2024-06-01,Smith\n")
+        self.assertEqual(result.errors[0][1], "Missing columns: tee_time, golfers")
+
+    def test_schema(self):
+        validate_golfer_groups([{"tee_time": "07:00", "golfers": ["Smith"], "caddies_needed": 1, "caddies": [3]}])
+        for groups in (
+            {"tee_time": "07:00"},
+            [{"golfers": ["Smith"]}],
+            [{"tee_time": "7:00"}],
+            [{"tee_time": "07:00", "players": []}],
+            [{"tee_time": "07:00", "caddies": ["alpha"]}],
+            [{"tee_time": "07:00", "caddies_needed": True}],
+        ):
+            with self.assertRaises(ValidationError):
+                validate_golfer_groups(groups)
+
+    def test_upload(self):
+        url = reverse("caddymaster:import_teesheet")
+        sheet = SimpleUploadedFile("sheet.csv", SHEET.encode("utf-8-sig"))
+        response = self.client.post(url, {"csv_file": sheet, "title": "North shack"})
+        self.assertRedirects(response, url, fetch_redirect_response=False)
+        self.assertWithinQueryBudget(response)
+        self.assertEqual(CaddyShack.objects.filter(caddy_shack_title="North shack").count(), 2)
+
+        response = self.client.get(url)
+        self.assertWithinQueryBudget(response)
+        self.assertContains(response, "Read 2 days, 2 changed")
+        self.assertContains(response, "2024-06-02: created, 1 added")
+
+    def test_not_a_caddymaster(self):
+        User.objects.create_user(username="caddy", password="Stset01@")
+        self.client.login(username="caddy", password="Stset01@")
+        self.assertEqual(self.client.get(reverse("caddymaster:import_teesheet")).status_code, 404)
+
+    def test_command(self):
+        with tempfile.NamedTemporaryFile("w", suffix=".csv", delete=False) as f:
+            f.write(SHEET)
+        self.addCleanup(os.remove, f.name)
+        out = io.StringIO()
+        call_command("import_teesheet", "master", f.name, "--dry-run", stdout=out)
+        self.assertIn("Would change 2 of 2 days", out.getvalue())
+        call_command("import_teesheet", "master", f.name, stdout=io.StringIO())
+        out = io.StringIO()
+        call_command("import_teesheet", "master", f.name, stdout=out)
+        self.assertIn("Changed 0 of 2 days", out.getvalue())
+
+
+class AssignmentHistoryTest(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        master_user = User.objects.create_user(username="master", password="Stset01@")
+        self.master = CaddyMaster.objects.create(user=master_user)
+        self.alpha = User.objects.create_user(username="alpha", password="Stset01@")
+        self.bravo = User.objects.create_user(username="bravo", password="Stset01@")
+        self.shack = CaddyShack.objects.create(
+            caddy_shack_title="Main shack",
+            date=datetime.date(2024, 6, 1),
+            caddy_master=self.master,
+            golfer_groups=[
+                {"tee_time": "07:00", "golfers": ["Smith", "Jones"], "caddies": [self.alpha.id, self.bravo.id]},
+                {"tee_time": "12:00", "tee": "10", "golfers": ["Brown"], "caddies": [self.alpha.id]},
+                {"tee_time": "12:10", "golfers": ["Lee"]},
+            ],
+        )
+
+    def rows(self):
+        return list(
+            Assignment.objects.order_by("tee_time", "caddy__username").values_list("caddy__username", "tee_time", "tee")
+        )
+
+    def test_kept_in_sync(self):
+        self.assertEqual(self.rows(), [
+            ("alpha", datetime.time(7), ""),
+            ("bravo", datetime.time(7), ""),
+            ("alpha", datetime.time(12), "10"),
+        ])
+        self.shack.golfer_groups[2]["caddies"] = [self.bravo.id, 9999]
+        self.shack.golfer_groups[0]["caddies"] = [self.alpha.id]
+        self.shack.save(update_fields=["golfer_groups"])
+        self.assertEqual(self.rows(), [
+            ("alpha", datetime.time(7), ""),
+            ("alpha", datetime.time(12), "10"),
+            ("bravo", datetime.time(12, 10), ""),
+        ])
+
+        # the title alone doesn't touch the assignments
+        with self.assertNumQueries(1):
+            self.shack.caddy_shack_title = "Renamed"
+            self.shack.save(update_fields=["caddy_shack_title"])
+        self.shack.delete()
+        self.assertFalse(Assignment.objects.exists())
+
+    def test_assigning_updates_history(self):
+        assignment.assign_shack(self.shack.pk, [self.bravo.id])
+        self.assertEqual(
+            list(Assignment.objects.order_by("tee_time").values_list("caddy__username", "tee_time")),
+            [("bravo", datetime.time(7)), ("bravo", datetime.time(12))],
+        )
+
+    def test_backfill(self):
+        Assignment.objects.all().delete()
+        migration = importlib.import_module("caddymaster.migrations.0003_assignment")
+        migration.backfill_assignments(apps, None)
+        self.assertEqual(len(self.rows()), 3)
+
+    def test_legacy_groups_skipped(self):
+        # save() doesn't run the validator, shacks from before it hold anything
+        with self.assertLogs("caddymaster.models", "WARNING") as logs:
+            legacy = CaddyShack.objects.create(
+                caddy_shack_title="Old shack",
+                date=datetime.date(2024, 5, 1),
+                caddy_master=self.master,
+                golfer_groups=[
+                    "07:00",
+                    {"golfers": ["Smith"], "caddies": [self.alpha.id]},
+                    {"tee_time": "7am", "caddies": [self.alpha.id]},
+                    {"tee_time": "08:00", "caddies": [self.bravo.id]},
+                ],
+            )
+        self.assertEqual(len(logs.output), 3)
+        self.assertEqual(
+            list(legacy.assignments.values_list("caddy__username", "tee_time")), [("bravo", datetime.time(8))]
+        )
+
+        CaddyShack.objects.filter(pk=legacy.pk).update(golfer_groups={"07:00": "Smith"})
+        Assignment.objects.all().delete()
+        migration = importlib.import_module("caddymaster.migrations.0003_assignment")
+        with self.assertLogs("caddymaster.models", "WARNING"):
+            migration.backfill_assignments(apps, None)
+        self.assertEqual(len(self.rows()), 3)
+
+    def test_history_with_loops(self):
+        Loop.objects.create(loop_title="Double", date=datetime.date(2024, 6, 1), num_loops=2, money=150, caddy=self.alpha)
+        Loop.objects.create(loop_title="Other day", date=datetime.date(2024, 6, 2), money=90, caddy=self.alpha)
+        rows = history.caddy_history(self.alpha, datetime.date(2024, 6, 1), datetime.date(2024, 6, 30))
+        self.assertEqual(
+            [(row.tee_time, row.loops_logged, row.money_logged) for row in rows],
+            [(datetime.time(7), 2, 150), (datetime.time(12), 2, 150)],
+        )
+        bravo_rows = history.caddy_history(self.bravo, datetime.date(2024, 6, 1), datetime.date(2024, 6, 30))
+        self.assertEqual([row.loops_logged for row in bravo_rows], [0])
+
+    def test_history_page(self):
+        self.client.login(username="alpha", password="Stset01@")
+        url = reverse("caddymaster:history")
+        response = self.client.get(url, {"month": "2024-06"})
+        self.assertWithinQueryBudget(response)
+        self.assertContains(response, "Groups I caddied for in June 2024")
+        self.assertContains(response, "Smith, Jones")
+        self.assertContains(response, "?month=2024-07")
+        self.assertContains(response, "?month=2024-05")
+        self.assertNotContains(self.client.get(url, {"month": "2024-07"}), "Smith")
+        self.assertEqual(self.client.get(url, {"month": "June"}).status_code, 404)
+
+    def test_roster(self):
+        self.client.login(username="master", password="Stset01@")
+        response = self.client.get(reverse("caddymaster:roster"), {"date": "2024-06-01"})
+        self.assertWithinQueryBudget(response)
+        self.assertEqual(
+            [(row.caddy.username, row.tee_time) for row in response.context["assignments"]],
+            [("alpha", datetime.time(7)), ("alpha", datetime.time(12)), ("bravo", datetime.time(7))],
+        )
+        self.assertContains(response, "07:00 Smith, Jones<br>")
+
+        self.client.login(username="alpha", password="Stset01@")
+        self.assertEqual(self.client.get(reverse("caddymaster:roster")).status_code, 404)
+
+
+class ShackReportTest(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        master_user = User.objects.create_user(username="master", password="Stset01@")
+        self.master = CaddyMaster.objects.create(user=master_user)
+        self.alpha, self.bravo, self.charlie = (
+            User.objects.create_user(username=name, password="Stset01@") for name in ("alpha", "bravo", "charlie")
+        )
+        monday = datetime.date(2024, 6, 3)
+        for date, caddies in ((monday, [self.alpha.id, self.bravo.id]), (monday + datetime.timedelta(days=1), [self.alpha.id])):
+            CaddyShack.objects.create(
+                caddy_shack_title="Main shack",
+                date=date,
+                caddy_master=self.master,
+                golfer_groups=[{"tee_time": "07:00", "golfers": ["Smith"], "caddies": caddies}],
+            )
+        for caddy, day, num_loops, money in (
+            (self.alpha, 3, 2, 150),
+            (self.bravo, 3, 1, 80),
+            (self.alpha, 4, 1, 90),
+            # didn't go out from this shack those days
+            (self.charlie, 3, 1, 70),
+            (self.alpha, 5, 1, 60),
+        ):
+            Loop.objects.create(
+                loop_title="Loop", date=datetime.date(2024, 6, day), num_loops=num_loops, money=money, caddy=caddy
+            )
+        self.later = datetime.date(2024, 7, 1)
+
+    def report(self, period, date, today):
+        return reports.report(self.master, *reports.period_range(period, date), today=today)
+
+    def test_day(self):
+        result = self.report("day", datetime.date(2024, 6, 3), self.later)
+        self.assertEqual(
+            [(row["username"], row["loops"], row["money"], row["money_per_loop"]) for row in result["rows"]],
+            [("alpha", 2, 150, 75.0), ("bravo", 1, 80, 80.0)],
+        )
+        self.assertEqual(result["totals"], {
+            "caddies": 2, "loops": 3, "money": 230, "money_per_loop": 76.67, "loops_per_caddy": 1.5, "money_per_caddy": 115.0,
+        })
+
+    def test_week(self):
+        result = self.report("week", datetime.date(2024, 6, 5), self.later)
+        self.assertEqual((result["start"], result["end"]), (datetime.date(2024, 6, 3), datetime.date(2024, 6, 9)))
+        self.assertEqual(result["rows"][0], {"username": "alpha", "loops": 3, "money": 240, "days": 2, "money_per_loop": 80.0})
+        self.assertEqual(
+            [(day["date"].day, day["caddies"], day["loops"], day["money"]) for day in result["days"]],
+            [(3, 2, 3, 230), (4, 1, 1, 90)],
+        )
+        self.assertEqual(ReportDay.objects.count(), 7)
+
+    def test_settled_days_are_snapshots(self):
+        self.report("week", datetime.date(2024, 6, 3), self.later)
+        Loop.objects.create(loop_title="Late", date=datetime.date(2024, 6, 3), money=100, caddy=self.bravo)
+        result = self.report("day", datetime.date(2024, 6, 3), self.later)
+        self.assertEqual(result["totals"]["money"], 230)
+
+        # the last SETTLE_DAYS are still added up from the loops
+        result = self.report("day", datetime.date(2024, 6, 4), datetime.date(2024, 6, 5))
+        self.assertEqual(result["totals"]["money"], 90)
+        Loop.objects.create(loop_title="Late", date=datetime.date(2024, 6, 4), money=100, caddy=self.alpha)
+        result = self.report("day", datetime.date(2024, 6, 4), datetime.date(2024, 6, 5))
+        self.assertEqual(result["totals"]["money"], 190)
+
+    def test_season_costs_the_same_as_a_day(self):
+        next_year = datetime.date(2025, 2, 1)
+        self.report("season", datetime.date(2024, 6, 3), next_year)
+        self.assertEqual(ReportDay.objects.count(), 366)
+        with self.assertNumQueries(3):
+            day = self.report("day", datetime.date(2024, 6, 3), next_year)
+        with self.assertNumQueries(3):
+            season = self.report("season", datetime.date(2024, 6, 3), next_year)
+        self.assertEqual(day["totals"]["money"], 230)
+        self.assertEqual(season["totals"]["money"], 320)
+
+    def test_page(self):
+        self.client.login(username="master", password="Stset01@")
+        url = reverse("caddymaster:report")
+        response = self.client.get(url, {"period": "week", "date": "2024-06-05"})
+        self.assertWithinQueryBudget(response)
+        self.assertContains(response, "June 3, 2024 to June 9, 2024")
+        self.assertContains(response, "2 caddies, 4 loops, $320")
+
+        response = self.client.get(url, {"period": "week", "date": "2024-06-05", "format": "csv"})
+        self.assertEqual(response["Content-Type"], "text/csv")
+        self.assertEqual(response.content.decode().splitlines(), [
+            "caddy,days,loops,money,money_per_loop",
+            "alpha,2,3,240,80.0",
+            "bravo,1,1,80,80.0",
+            "total,,4,320,80.0",
+        ])
 
-# Create your tests here.
+        self.assertEqual(self.client.get(url, {"period": "month"}).status_code, 404)
+        self.client.login(username="alpha", password="Stset01@")
+        self.assertEqual(self.client.get(url).status_code, 404)
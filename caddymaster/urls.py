@@ -0,0 +1,14 @@
+from django.urls import path
+
+from . import views
+
+app_name = "caddymaster"
+urlpatterns = [
+    path("shack/<int:pk>/", views.shack_board, name="board"),
+    path("shack/<int:pk>/events/", views.shack_events, name="events"),
+    path("shack/<int:pk>/assign/", views.assign_caddies, name="assign"),
+    path("teesheet/import/", views.import_teesheet, name="import_teesheet"),
+    path("history/", views.caddy_history, name="history"),
+    path("roster/", views.roster, name="roster"),
+    path("report/", views.shack_report, name="report"),
+]
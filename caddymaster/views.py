@@ -1,3 +1,166 @@
-from django.shortcuts import render
+import csv
+import datetime
+import io
 
-# Create your views here.
+from django.contrib import messages
+from django.contrib.auth.decorators import login_required
+from django.core.handlers.asgi import ASGIRequest
+from django.http import Http404, HttpResponse, HttpResponseForbidden, StreamingHttpResponse
+from django.shortcuts import get_object_or_404, redirect, render
+from django.utils import timezone
+
+from . import assignment, history, live, reports, teesheet
+from .forms import RosterForm, TeeSheetForm
+from .models import CaddyMaster, CaddyShack
+
+
+@login_required()
+def assign_caddies(request, pk):
+    shack = get_object_or_404(CaddyShack, pk=pk, caddy_master__user=request.user)
+    if request.method == "POST":
+        form = RosterForm(request.POST)
+        if form.is_valid():
+            keep_before = None
+            if shack.date == datetime.date.today():
+                # groups already out keep their caddies
+                now = timezone.localtime()
+                keep_before = now.hour * 60 + now.minute
+            try:
+                shack, unfilled = assignment.assign_shack(shack.pk, form.cleaned_data["roster"], keep_before)
+            except ValueError as e:
+                form.add_error(None, str(e))
+            else:
+                if unfilled:
+                    messages.warning(request, f"Not enough caddies, {unfilled} bags have no caddy")
+                else:
+                    messages.success(request, "Every group has its caddies")
+                return redirect("caddymaster:assign", pk=shack.pk)
+    else:
+        form = RosterForm()
+
+    return render(
+        request,
+        "caddymaster/assign.html",
+        {"shack": shack, "form": form, "groups": assignment.named_groups(shack.golfer_groups or [])},
+    )
+
+
+@login_required()
+def shack_board(request, pk):
+    shack = get_object_or_404(CaddyShack, pk=pk)
+    return render(
+        request,
+        "caddymaster/board.html",
+        {"shack": shack, "groups": assignment.named_groups(shack.golfer_groups or [])},
+    )
+
+
+async def shack_events(request, pk):
+    # login_required can't wrap async views until django 5.1
+    user = await request.auser()
+    if not user.is_authenticated:
+        return HttpResponseForbidden("Log in to follow the board")
+    if not isinstance(request, ASGIRequest):
+        # a WSGI worker would buffer the endless stream and never answer
+        return HttpResponse("The live board needs the ASGI app", status=501)
+    if not await CaddyShack.objects.filter(pk=pk).aexists():
+        raise Http404("No such caddy shack")
+    return StreamingHttpResponse(
+        live.stream(pk),
+        content_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@login_required()
+def import_teesheet(request):
+    caddy_master = get_object_or_404(CaddyMaster, user=request.user)
+    if request.method == "POST":
+        form = TeeSheetForm(request.POST, request.FILES)
+        if form.is_valid():
+            lines = io.TextIOWrapper(request.FILES["csv_file"], encoding="utf-8-sig", newline="")
+            try:
+                result = teesheet.import_teesheet(caddy_master, lines, title=form.cleaned_data["title"])
+            except UnicodeDecodeError:
+                messages.error(request, "File must be a UTF-8 encoded CSV")
+                return redirect("caddymaster:import_teesheet")
+
+            written = sum(day.action != "unchanged" for day in result.days)
+            messages.success(request, f"Read {len(result.days)} days, {written} changed")
+            # shown once on the next page
+            request.session["teesheet_report"] = list(teesheet.report_lines(result)) + [
+                f"line {line}: {message}" for line, message, _ in result.errors
+            ]
+            if result.errors:
+                messages.error(request, f"{len(result.errors)} rows could not be imported")
+            return redirect("caddymaster:import_teesheet")
+    else:
+        form = TeeSheetForm()
+
+    return render(
+        request,
+        "caddymaster/import_teesheet.html",
+        {"form": form, "report": request.session.pop("teesheet_report", None)},
+    )
+
+
+@login_required()
+def caddy_history(request):
+    today = datetime.date.today()
+    try:
+        month = datetime.datetime.strptime(request.GET["month"], "%Y-%m").date() if "month" in request.GET else today
+    except ValueError:
+        raise Http404("Invalid month")
+    start = month.replace(day=1)
+    end = (start + datetime.timedelta(days=31)).replace(day=1) - datetime.timedelta(days=1)
+
+    return render(
+        request,
+        "caddymaster/history.html",
+        {
+            "start": start,
+            "previous": (start - datetime.timedelta(days=1)).strftime("%Y-%m"),
+            "next": (end + datetime.timedelta(days=1)).strftime("%Y-%m"),
+            "assignments": history.caddy_history(request.user, start, end),
+        },
+    )
+
+
+@login_required()
+def roster(request):
+    caddy_master = get_object_or_404(CaddyMaster, user=request.user)
+    try:
+        date = datetime.date.fromisoformat(request.GET.get("date") or datetime.date.today().isoformat())
+    except ValueError:
+        raise Http404("Invalid date")
+
+    return render(
+        request,
+        "caddymaster/roster.html",
+        {"date": date, "assignments": history.roster(caddy_master, date)},
+    )
+
+
+@login_required()
+def shack_report(request):
+    caddy_master = get_object_or_404(CaddyMaster, user=request.user)
+    period = request.GET.get("period", "day")
+    if period not in reports.PERIODS:
+        raise Http404("Unknown report")
+    try:
+        date = datetime.date.fromisoformat(request.GET.get("date") or datetime.date.today().isoformat())
+    except ValueError:
+        raise Http404("Invalid date")
+
+    result = reports.report(caddy_master, *reports.period_range(period, date))
+    if request.GET.get("format") == "csv":
+        response = HttpResponse(content_type="text/csv")
+        response["Content-Disposition"] = f'attachment; filename="shack_{period}_{date}.csv"'
+        csv.writer(response).writerows(reports.csv_rows(result))
+        return response
+
+    return render(
+        request,
+        "caddymaster/report.html",
+        {"period": period, "periods": reports.PERIODS, "date": date, "report": result},
+    )
@@ -2,6 +2,8 @@
 ASGI config for caddyshackhub project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Serve it with an ASGI server (uvicorn, daphne) for the live caddy shack
+boards, their event streams don't work under WSGI.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.0/howto/deployment/asgi/
@@ -56,18 +56,67 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'loopers.middleware.QueryInstrumentationMiddleware',
+    'loopers.middleware.ReplicaPinMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'loopers.middleware.ProfilerMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
 ROOT_URLCONF = 'caddyshackhub.urls'
 
+# most queries each view should need, see loopers.middleware
+QUERY_BUDGETS = {
+    'loopers:index': 6,
+    # the caddy, its activation token and an empty stats rollup
+    'loopers:register': 10,
+    'loopers:activate': 6,
+    'loopers:loops': 4,
+    'loopers:export_loops': 3,
+    # rollups upsert 100 buckets per query, so multi-season files need a few more
+    'loopers:import_loops': 30,
+    'loopers:import_errors': 2,
+    'loopers:loop-detail': 3,
+    # loop writes upsert the caddy, season and period rollups and fan the loop
+    # out to every follower's feed in one insert, none of it grows with followers
+    'loopers:new_loop': 17,
+    'loopers:edit_loop': 20,
+    'loopers:delete_loop': 16,
+    'loopers:settings': 2,
+    'loopers:change_password': 13,
+    'loopers:change_email': 10,
+    # one delete per table pointing at the user, plus recounting the follows
+    'loopers:delete_account': 24,
+    'loopers:email_verification': 7,
+    'loopers:friends': 14,
+    'loopers:unfollow_friend': 9,
+    'loopers:caddy_autocomplete': 3,
+    'loopers:followers': 4,
+    'loopers:feed': 3,
+    'loopers:leaderboard': 3,
+    'loopers:stats': 6,
+    'loopers:stats_json': 5,
+    'loopers:metrics': 3,
+    'loopers:terms_of_service': 2,
+    'loopers:privacy_policy': 2,
+    'caddymaster:board': 4,
+    'caddymaster:events': 3,
+    'caddymaster:assign': 13,
+    # a shack write per day on the sheet, this one grows with the days
+    'caddymaster:import_teesheet': 16,
+    'caddymaster:history': 3,
+    'caddymaster:roster': 4,
+    'caddymaster:report': 12,
+}
+# raise instead of logging a warning when a view goes over its budget
+QUERY_BUDGET_RAISE = config('QUERY_BUDGET_RAISE', default=DEBUG, cast=bool)
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
@@ -96,6 +145,44 @@ DATABASES = {
     ),
 }
 
+# optional read replica for the read-only loopers views, see loopers.routers.
+# two sqlite files work for trying it locally
+DATABASE_REPLICA_URL = config('DATABASE_REPLICA_URL', default='')
+if DATABASE_REPLICA_URL:
+    DATABASES['replica'] = dj_database_url.parse(DATABASE_REPLICA_URL)
+    # tests only create the primary, the replica reads from it
+    DATABASES['replica']['TEST'] = {'MIRROR': 'default'}
+
+DATABASE_ROUTERS = ['loopers.routers.ReplicaRouter']
+
+# how long a browser keeps reading from the primary after it writes
+REPLICA_STICKY_SECONDS = config('REPLICA_STICKY_SECONDS', default=5, cast=int)
+
+
+# Metrics, see loopers.metrics
+# with more than one process (gunicorn workers, the outbox worker) each writes
+# its numbers to a file in this shared directory and a scrape adds them up
+METRICS_DIR = config('METRICS_DIR', default='')
+# lets a scraper in with "Authorization: Bearer <token>", staff always can
+METRICS_TOKEN = config('METRICS_TOKEN', default='')
+
+
+# Live caddy shack boards, see caddymaster.live. the default only reaches
+# clients connected to the process that saved the shack
+LIVE_BOARD_BACKEND = config('LIVE_BOARD_BACKEND', default='caddymaster.live.LocalBackend')
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.0/topics/cache/
+# locmem is per process, point these at memcached or redis when running more than one worker
+
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('CACHE_LOCATION', default='caddyshackhub'),
+    }
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
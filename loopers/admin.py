@@ -1,6 +1,45 @@
 from django.contrib import admin
+from django.utils.html import format_html
 
-from .models import Caddy, Loop
+from .models import AccountToken, Caddy, CaddyStats, FeedEntry, Loop, OutgoingEmail, PeriodStats, RequestProfile, SeasonStats
 
 admin.site.register(Caddy)
-admin.site.register(Loop)
\ No newline at end of file
+admin.site.register(Loop)
+admin.site.register(CaddyStats)
+admin.site.register(SeasonStats)
+admin.site.register(FeedEntry)
+admin.site.register(OutgoingEmail)
+admin.site.register(AccountToken)
+admin.site.register(PeriodStats)
+
+
+@admin.register(RequestProfile)
+class RequestProfileAdmin(admin.ModelAdmin):
+    # written by loopers.middleware.ProfilerMiddleware, read only here
+    list_display = ["created_at", "method", "path", "user", "status_code", "duration_ms", "query_count", "db_ms"]
+    list_filter = ["view_name"]
+    search_fields = ["path", "user__username"]
+    fields = [
+        "created_at", "user", "method", "path", "view_name", "status_code", "duration_ms",
+        "query_count", "db_ms", "hot_functions_text", "allocations_text", "sql_text",
+    ]
+    readonly_fields = fields
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    # pre keeps the report's columns lined up
+    @admin.display(description="Hot functions")
+    def hot_functions_text(self, obj):
+        return format_html("<pre>{}</pre>", obj.hot_functions)
+
+    @admin.display(description="Allocations")
+    def allocations_text(self, obj):
+        return format_html("<pre>{}</pre>", obj.allocations)
+
+    @admin.display(description="SQL")
+    def sql_text(self, obj):
+        return format_html("<pre>{}</pre>", obj.sql)
@@ -0,0 +1,180 @@
+import datetime
+
+import numpy as np
+from django.core.cache import cache
+
+from . import stats
+from .models import Caddy, Loop
+
+# keyed on the caddy's last loop change, so it only has to expire to free memory
+TIMEOUT = 60 * 60 * 24
+WINDOWS = (7, 30)
+BEST_DAYS = 5
+
+
+def get_analytics(user, today=None):
+    """
+    Earnings breakdown for a caddy: $/loop, rolling averages, best days,
+    seasons and where they rank among the caddies they follow.
+    """
+    today = today or datetime.date.today()
+    # CaddyStats.updated_at moves on every loop change, see loopers.stats
+    changed = stats.get_stats(user).updated_at
+    key = f"analytics:{user.id}:{changed.timestamp()}:{today.isoformat()}"
+    result = cache.get(key)
+    if result is None:
+        rows = Loop.objects.filter(caddy=user).order_by().values_list("date", "num_loops", "money")
+        result = compute(list(rows), today)
+        cache.set(key, result, TIMEOUT)
+    # friends log loops without touching this caddy's key, so this part isn't memoized
+    return {**result, "friends": friends_rank(user, result["total_money"])}
+
+
+def compute(rows, today):
+    """Stats for a list of (date, num_loops, money) rows."""
+    if not rows:
+        return {
+            "total_loops": 0,
+            "total_money": 0,
+            "money_per_loop": None,
+            "rolling": [],
+            "best_days": [],
+            "seasons": [],
+            "season_to_date": None,
+        }
+
+    dates, loops, money = zip(*rows)
+    dates = np.array(dates, dtype="datetime64[D]")
+    loops = np.array(loops, dtype=np.int64)
+    money = np.array(money, dtype=np.int64)
+    today = np.datetime64(today, "D")
+
+    total_loops = int(loops.sum())
+    total_money = int(money.sum())
+    return {
+        "total_loops": total_loops,
+        "total_money": total_money,
+        "money_per_loop": _ratio(total_money, total_loops),
+        "rolling": _rolling(dates, money, loops, today),
+        "best_days": _best_days(dates, money, loops),
+        "seasons": _seasons(dates, money, loops),
+        "season_to_date": _season_to_date(dates, money, loops, today),
+    }
+
+
+def _ratio(money, loops):
+    return round(money / loops, 2) if loops else None
+
+
+def _rolling(dates, money, loops, today):
+    """Average money and loops per day over the last WINDOWS days, and the best stretch ever."""
+    first = dates.min()
+    days = (dates - first).astype(np.int64)
+    length = int((max(today, dates.max()) - first).astype(np.int64)) + 1
+    daily_money = np.bincount(days, weights=money, minlength=length)
+    daily_loops = np.bincount(days, weights=loops, minlength=length)
+
+    rolling = []
+    for window in WINDOWS:
+        # window sums from a running total, padded so windows can start before the first loop
+        money_sums = _window_sums(daily_money, window)
+        loop_sums = _window_sums(daily_loops, window)
+        best = int(money_sums.argmax())
+        rolling.append({
+            "days": window,
+            "money": round(float(money_sums[-1]) / window, 2),
+            "loops": round(float(loop_sums[-1]) / window, 2),
+            "best_money": round(float(money_sums[best]) / window, 2),
+            "best_end": (first + best).item(),
+        })
+    return rolling
+
+
+def _window_sums(daily, window):
+    totals = np.concatenate((np.zeros(window), np.cumsum(daily)))
+    return totals[window:] - totals[:-window]
+
+
+def _best_days(dates, money, loops):
+    days, inverse = np.unique(dates, return_inverse=True)
+    day_money = np.bincount(inverse, weights=money)
+    day_loops = np.bincount(inverse, weights=loops)
+    # stable so ties go to the earlier day
+    best = np.argsort(-day_money, kind="stable")[:BEST_DAYS]
+    return [
+        {"date": days[i].item(), "money": int(day_money[i]), "loops": int(day_loops[i])}
+        for i in best
+    ]
+
+
+def _seasons(dates, money, loops):
+    """Totals per season (calendar year), newest first, with the change on the season before."""
+    years = dates.astype("datetime64[Y]").astype(np.int64) + 1970
+    seasons, inverse = np.unique(years, return_inverse=True)
+    season_money = np.bincount(inverse, weights=money).astype(np.int64)
+    season_loops = np.bincount(inverse, weights=loops).astype(np.int64)
+
+    rows = []
+    for i, season in enumerate(seasons):
+        # only compare with the calendar year right before, not the last one worked
+        previous = i > 0 and seasons[i - 1] == season - 1
+        rows.append({
+            "season": int(season),
+            "money": int(season_money[i]),
+            "loops": int(season_loops[i]),
+            "money_per_loop": _ratio(int(season_money[i]), int(season_loops[i])),
+            "money_change": _change(season_money[i], season_money[i - 1]) if previous else None,
+        })
+    rows.reverse()
+    return rows
+
+
+def _change(now, before):
+    """Percent change from ``before`` to ``now``."""
+    return round(float((now - before) / before * 100), 1) if before else None
+
+
+def _season_to_date(dates, money, loops, today):
+    """This season so far against the last one up to the same day."""
+    today = today.item()
+    start = today.replace(month=1, day=1)
+    try:
+        last_year = today.replace(year=today.year - 1)
+    except ValueError:
+        # february 29th
+        last_year = today.replace(year=today.year - 1, day=28)
+
+    this_season = (dates >= np.datetime64(start)) & (dates <= np.datetime64(today))
+    last_season = (dates >= np.datetime64(start.replace(year=start.year - 1))) & (
+        dates <= np.datetime64(last_year)
+    )
+    now, before = int(money[this_season].sum()), int(money[last_season].sum())
+    return {
+        "through": today,
+        "money": now,
+        "loops": int(loops[this_season].sum()),
+        "last_season_money": before,
+        "last_season_loops": int(loops[last_season].sum()),
+        "money_change": _change(now, before),
+    }
+
+
+def friends_rank(user, total_money):
+    """
+    Percentile rank of the caddy's lifetime earnings among the caddies they
+    follow, the share of friends who have earned less. None without friends.
+    """
+    earnings = Caddy.objects.filter(caddy__user=user, user__isnull=False).values_list(
+        "user__stats__total_money", flat=True
+    )
+    # friends who never had stats built haven't logged anything through the site
+    earnings = np.array([amount or 0 for amount in earnings], dtype=np.int64)
+    if not len(earnings):
+        return None
+    below = int((earnings < total_money).sum())
+    tied = int((earnings == total_money).sum())
+    return {
+        "count": len(earnings),
+        "percentile": round((below + tied / 2) / len(earnings) * 100, 1),
+        "rank": len(earnings) - below - tied + 1,
+    }
@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class LoopersConfig(AppConfig):
     name = 'loopers'
+
+    def ready(self):
+        from . import signals  # noqa: F401
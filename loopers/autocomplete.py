@@ -0,0 +1,109 @@
+import bisect
+import threading
+import time
+
+from django.db import transaction
+
+from .models import Caddy
+
+LIMIT = 10
+# changes made in this process are applied as they happen, a full reload picks
+# up the ones made by other processes
+RELOAD_INTERVAL = 60 * 5
+
+
+class UsernameIndex:
+    """
+    Sorted usernames of every active, non-staff caddy, so a prefix search
+    is two bisects instead of a LIKE scan over auth_user.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.names = []
+        # username -> (user id, caddy id) and user id -> username
+        self.entries = {}
+        self.usernames = {}
+        self.loaded_at = None
+
+    def load(self):
+        rows = Caddy.objects.filter(user__is_active=True, user__is_staff=False).values_list(
+            "user__username", "user_id", "id"
+        )
+        entries = {username: (user_id, caddy_id) for username, user_id, caddy_id in rows}
+        with self.lock:
+            self.entries = entries
+            self.usernames = {user_id: username for username, (user_id, _) in entries.items()}
+            self.names = sorted(entries)
+            self.loaded_at = time.monotonic()
+
+    def _ensure_loaded(self):
+        if self.loaded_at is None or time.monotonic() - self.loaded_at > RELOAD_INTERVAL:
+            self.load()
+
+    def add(self, username, user_id, caddy_id):
+        if self.loaded_at is None:
+            return
+        with self.lock:
+            self._remove(user_id)
+            self.entries[username] = (user_id, caddy_id)
+            self.usernames[user_id] = username
+            bisect.insort(self.names, username)
+
+    def remove(self, user_id):
+        if self.loaded_at is None:
+            return
+        with self.lock:
+            self._remove(user_id)
+
+    def _remove(self, user_id):
+        username = self.usernames.pop(user_id, None)
+        if username is None:
+            return
+        del self.entries[username]
+        i = bisect.bisect_left(self.names, username)
+        del self.names[i]
+
+    def caddy_id(self, user_id):
+        """The caddy id of an indexed user, or None."""
+        self._ensure_loaded()
+        with self.lock:
+            username = self.usernames.get(user_id)
+            return self.entries[username][1] if username else None
+
+    def search(self, prefix, exclude=(), limit=LIMIT):
+        """Up to ``limit`` usernames starting with ``prefix``, skipping the caddy ids in ``exclude``."""
+        self._ensure_loaded()
+        prefix = prefix.lower()
+        matches = []
+        with self.lock:
+            i = bisect.bisect_left(self.names, prefix)
+            while i < len(self.names) and len(matches) < limit:
+                username = self.names[i]
+                if not username.startswith(prefix):
+                    break
+                if self.entries[username][1] not in exclude:
+                    matches.append(username)
+                i += 1
+        return matches
+
+
+index = UsernameIndex()
+
+
+def user_changed(user):
+    """Add, move or drop ``user`` in the index once the current transaction commits."""
+    def update():
+        caddy_id = None
+        if user.is_active and not user.is_staff:
+            caddy_id = Caddy.objects.filter(user=user).values_list("id", flat=True).first()
+        if caddy_id is None:
+            index.remove(user.id)
+        else:
+            index.add(user.username, user.id, caddy_id)
+
+    transaction.on_commit(update)
+
+
+def user_deleted(user_id):
+    transaction.on_commit(lambda: index.remove(user_id))
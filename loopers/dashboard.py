@@ -0,0 +1,67 @@
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+from . import leaderboard, stats
+from .routers import primary_reads
+from .models import Caddy, Loop
+
+# cached pieces are also found by version, so they only need to expire to free memory
+TIMEOUT = 60 * 60 * 24
+
+
+def version_key(user_id):
+    return f"dashboard:version:{user_id}"
+
+
+def get_version(user_id):
+    version = cache.get(version_key(user_id))
+    if version is None:
+        # a clock value instead of a counter so a version key that was evicted
+        # can't start over and match pieces cached under the old one
+        version = time.time_ns()
+        cache.set(version_key(user_id), version, None)
+    return version
+
+
+def get_dashboard(user):
+    """
+    Everything the dashboard shows for ``user``. Cached under the user's
+    current version, so a repeat visit doesn't touch the database.
+    """
+    key = f"dashboard:{user.id}:{get_version(user.id)}"
+    pieces = cache.get(key)
+    if pieces is None:
+        # a lagging replica would get cached under the new version
+        with primary_reads():
+            pieces = {
+                "recent_loops": list(Loop.objects.filter(caddy=user)[:5]),
+                "loop_count": Caddy.objects.get(user=user).loop_count,
+                "total_money": stats.get_stats(user).total_money,
+                "top_three_friends": leaderboard.top_friends(user),
+            }
+        cache.set(key, pieces, TIMEOUT)
+    return pieces
+
+
+def invalidate(user_ids):
+    """Move these users on to a new version once the current transaction commits."""
+    user_ids = list(user_ids)
+
+    def bump():
+        now = time.time_ns()
+        cache.set_many({version_key(user_id): now for user_id in user_ids}, None)
+        # their top friends are part of the dashboard, drop those too so the
+        # rebuild can't pick up a list cached before this change
+        cache.delete_many([leaderboard.friends_key(user_id) for user_id in user_ids])
+
+    transaction.on_commit(bump)
+
+
+def invalidate_caddy(user_id):
+    """A caddy's loops changed, which shows on their and their followers' dashboards."""
+    follower_ids = Caddy.objects.filter(friends__user_id=user_id, user__isnull=False).values_list(
+        "user_id", flat=True
+    )
+    invalidate([user_id, *follower_ids])
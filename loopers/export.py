@@ -0,0 +1,73 @@
+import csv
+import hashlib
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+
+from .models import Loop
+
+FIELDS = ["date", "loop_title", "num_loops", "money", "notes"]
+
+# rows read per query while streaming
+CHUNK_SIZE = 2000
+
+CONTENT_TYPES = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+}
+
+
+class Echo:
+    """File-like object whose write() hands back what it was given, so
+    csv.writer can produce one line at a time for a streaming response."""
+
+    def write(self, value):
+        return value
+
+
+def export_rows(user, start=None, end=None):
+    """
+    A caddy's loops oldest first as tuples of FIELDS. Each chunk is its own
+    query starting after the last (date, id) read, a range of
+    loop_caddy_date_id_idx. iterator() would do for sqlite and postgres, but
+    mysqlclient reads the whole result into memory whatever the chunk_size.
+    """
+    loops = Loop.objects.filter(caddy=user)
+    if start:
+        loops = loops.filter(date__gte=start)
+    if end:
+        loops = loops.filter(date__lte=end)
+    loops = loops.order_by("date", "id").values_list("id", *FIELDS)
+
+    chunk = list(loops[:CHUNK_SIZE])
+    while chunk:
+        for row in chunk:
+            yield row[1:]
+        if len(chunk) < CHUNK_SIZE:
+            return
+        last_id, last_date = chunk[-1][0], chunk[-1][1]
+        # written like KeysetPaginator._after so date still bounds the range
+        after = Q(date__gte=last_date) & (Q(date__gt=last_date) | Q(id__gt=last_id))
+        chunk = list(loops.filter(after)[:CHUNK_SIZE])
+
+
+def csv_lines(rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(FIELDS)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def ndjson_lines(rows):
+    for row in rows:
+        yield json.dumps(dict(zip(FIELDS, row)), cls=DjangoJSONEncoder) + "\n"
+
+
+def export_etag(stats, fmt, start=None, end=None):
+    """
+    ETag for an export. The rollup in CaddyStats is touched on every loop
+    add, edit and delete, so an unchanged rollup means an unchanged export.
+    """
+    parts = [fmt, start, end, stats.updated_at, stats.entry_count, stats.total_money]
+    return hashlib.sha256(repr(parts).encode("utf-8")).hexdigest()
@@ -0,0 +1,145 @@
+from django.db.models import F, Max, Window
+from django.db.models.functions import RowNumber
+
+from .models import Caddy, FeedEntry, Loop
+
+# how many entries each user's timeline keeps, older ones are trimmed
+FEED_SIZE = 200
+# feeds trim_new_entries trims per query
+TRIM_USERS_PER_QUERY = 500
+# followers whose entries loops_imported builds at once, up to FEED_SIZE each
+IMPORT_FOLLOWERS_PER_INSERT = 50
+
+
+def followed_users(user_id):
+    """Users whose loops show up in this user's feed."""
+    return Caddy.objects.filter(caddy__user_id=user_id, user__isnull=False).values("user_id")
+
+
+def trim_feeds(user_ids):
+    """Drop everything past the newest FEED_SIZE entries in each user's feed."""
+    ranked = (
+        FeedEntry.objects.filter(user_id__in=user_ids)
+        .annotate(
+            position=Window(
+                RowNumber(),
+                partition_by=F("user_id"),
+                order_by=[F("date").desc(), F("id").desc()],
+            )
+        )
+        .filter(position__gt=FEED_SIZE)
+        .values_list("id", flat=True)
+    )
+    stale = list(ranked)
+    if stale:
+        FeedEntry.objects.filter(id__in=stale).delete()
+
+
+def trim_new_entries(after_id=0):
+    """
+    Trim the feeds that got entries with an id above ``after_id`` and return
+    the newest id seen, to pass back in next time. Writes leave trimming to
+    the send_outbox worker, which calls this between batches, so a new loop
+    costs the same however many followers its caddy has.
+    """
+    last_id = FeedEntry.objects.aggregate(last=Max("id"))["last"] or 0
+    if last_id <= after_id:
+        return after_id
+    user_ids = list(
+        FeedEntry.objects.filter(id__gt=after_id, id__lte=last_id)
+        .order_by()
+        .values_list("user_id", flat=True)
+        .distinct()
+    )
+    for i in range(0, len(user_ids), TRIM_USERS_PER_QUERY):
+        trim_feeds(user_ids[i:i + TRIM_USERS_PER_QUERY])
+    return last_id
+
+
+def loop_added(loop):
+    """
+    Push a new loop onto the feed of everyone following its caddy and
+    return those followers' user ids. The feeds are trimmed later, see
+    trim_new_entries.
+    """
+    follower_ids = list(
+        Caddy.objects.filter(friends__user_id=loop.caddy_id, user__isnull=False).values_list(
+            "user_id", flat=True
+        )
+    )
+    if not follower_ids:
+        return follower_ids
+    FeedEntry.objects.bulk_create(
+        [FeedEntry(user_id=user_id, loop=loop, date=loop.date) for user_id in follower_ids],
+        ignore_conflicts=True,
+    )
+    return follower_ids
+
+
+def loop_changed(loop):
+    FeedEntry.objects.filter(loop=loop).update(date=loop.date)
+
+
+def backfill(user_id, author_ids=None):
+    """
+    Copy the newest loops of the given authors (everyone the user follows by
+    default) into the user's feed. Loops already there are left alone.
+    """
+    if author_ids is None:
+        author_ids = followed_users(user_id)
+    loops = Loop.objects.filter(caddy_id__in=author_ids).values_list("id", "date")[:FEED_SIZE]
+    FeedEntry.objects.bulk_create(
+        [FeedEntry(user_id=user_id, loop_id=loop_id, date=date) for loop_id, date in loops],
+        ignore_conflicts=True,
+    )
+    trim_feeds([user_id])
+
+
+def follows_changed(follower_caddy_ids, followed_caddy_ids, added):
+    """Bring feeds up to date after caddies were followed or unfollowed."""
+    users = dict(
+        Caddy.objects.filter(id__in=set(follower_caddy_ids) | set(followed_caddy_ids))
+        .exclude(user__isnull=True)
+        .values_list("id", "user_id")
+    )
+    follower_ids = [users[pk] for pk in follower_caddy_ids if pk in users]
+    author_ids = [users[pk] for pk in followed_caddy_ids if pk in users]
+    if not follower_ids or not author_ids:
+        return
+
+    for user_id in follower_ids:
+        if added:
+            backfill(user_id, author_ids)
+            continue
+
+        entries = FeedEntry.objects.filter(user_id=user_id)
+        was_full = entries.count() >= FEED_SIZE
+        entries.filter(loop__caddy_id__in=author_ids).delete()
+        if was_full:
+            # older loops from the caddies still followed may have been trimmed
+            # to make room for the ones just removed, bring them back
+            backfill(user_id)
+
+
+def loops_imported(user):
+    """
+    Refresh followers' feeds after a batch of the user's loops was written.
+    The user's newest loops are read once and copied to every follower,
+    one INSERT per IMPORT_FOLLOWERS_PER_INSERT followers. Trimmed later like
+    loop_added.
+    """
+    follower_ids = list(
+        Caddy.objects.filter(friends__user=user, user__isnull=False).values_list("user_id", flat=True)
+    )
+    if not follower_ids:
+        return
+    loops = list(Loop.objects.filter(caddy=user).values_list("id", "date")[:FEED_SIZE])
+    for i in range(0, len(follower_ids), IMPORT_FOLLOWERS_PER_INSERT):
+        FeedEntry.objects.bulk_create(
+            [
+                FeedEntry(user_id=user_id, loop_id=loop_id, date=date)
+                for user_id in follower_ids[i:i + IMPORT_FOLLOWERS_PER_INSERT]
+                for loop_id, date in loops
+            ],
+            ignore_conflicts=True,
+        )
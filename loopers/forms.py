@@ -67,12 +67,16 @@ class NewLoopForm(forms.ModelForm):
 class FollowCaddyForm(forms.Form):
     caddy_to_follow = forms.CharField(
         label="Follow other caddys:",
-        widget=forms.TextInput(attrs={"placeholder": "username"}),
+        widget=forms.TextInput(
+            attrs={"placeholder": "username", "autocomplete": "off", "list": "caddy-suggestions"}
+        ),
     )
 
     def clean_caddy_to_follow(self):
         caddy_to_follow = self.cleaned_data["caddy_to_follow"].lower()
-        if not User.objects.filter(username=caddy_to_follow).exists():
+        # kept on the form with their caddy so the view doesn't look them up again
+        self.user = User.objects.filter(username=caddy_to_follow).select_related("caddy").first()
+        if self.user is None:
             raise ValidationError("Username does not exist")
         return caddy_to_follow
 
@@ -86,4 +90,24 @@ class ChangeEmailForm(forms.Form):
         r = User.objects.filter(email=new_email)
         if r.count():
             raise ValidationError("Email already in use")
-        return new_email
\ No newline at end of file
+        return new_email
+
+class ExportLoopsForm(forms.Form):
+    format = forms.ChoiceField(choices=[("csv", "CSV"), ("ndjson", "JSON")], required=False)
+    start = forms.DateField(required=False)
+    end = forms.DateField(required=False)
+
+    def clean_format(self):
+        return self.cleaned_data["format"] or "csv"
+
+    def clean(self):
+        cleaned_data = super().clean()
+        start = cleaned_data.get("start")
+        end = cleaned_data.get("end")
+        if start and end and start > end:
+            raise ValidationError("Start date must be before end date")
+        return cleaned_data
+
+
+class ImportLoopsForm(forms.Form):
+    csv_file = forms.FileField(label="CSV file")
@@ -0,0 +1,152 @@
+import threading
+import time
+
+import numpy as np
+
+from .models import Caddy
+
+SUGGESTIONS = 5
+# follows made in this process are applied as they happen, a full reload picks
+# up the ones made by other processes
+RELOAD_INTERVAL = 60 * 5
+# changed follow lists are kept on the side until there are this many, then
+# merged back into the arrays
+COMPACT_AFTER = 1000
+
+EMPTY = np.zeros(0, dtype=np.int64)
+
+
+class FollowGraph:
+    """
+    Who follows who, kept in memory as CSR arrays: ``ids`` is every caddy id
+    in the graph sorted, and the caddies ids[i] follows are
+    ids[indices[indptr[i]:indptr[i + 1]]]. Follow lists changed since the
+    arrays were built live in ``changed`` until they are compacted.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.ids = self.indptr = self.indices = None
+        self.changed = {}
+        self.loaded_at = None
+
+    def load(self):
+        """(Re)build the arrays from every row of the friends table."""
+        Follow = Caddy.friends.through
+        edges = np.array(
+            list(Follow.objects.values_list("from_caddy_id", "to_caddy_id")), dtype=np.int64
+        ).reshape(-1, 2)
+        with self.lock:
+            self._build(edges[:, 0], edges[:, 1])
+            self.changed = {}
+            self.loaded_at = time.monotonic()
+
+    def _build(self, src, dst):
+        ids = np.unique(np.concatenate((src, dst)))
+        src = np.searchsorted(ids, src)
+        dst = np.searchsorted(ids, dst)
+        order = np.lexsort((dst, src))
+        self.ids = ids
+        self.indptr = np.concatenate(([0], np.cumsum(np.bincount(src, minlength=len(ids)))))
+        self.indices = dst[order]
+
+    def _ensure_loaded(self):
+        if self.loaded_at is None or time.monotonic() - self.loaded_at > RELOAD_INTERVAL:
+            self.load()
+
+    def _following(self, caddy_id):
+        """Ids ``caddy_id`` follows. Call with the lock held."""
+        if caddy_id in self.changed:
+            return self.changed[caddy_id]
+        i = np.searchsorted(self.ids, caddy_id)
+        if i == len(self.ids) or self.ids[i] != caddy_id:
+            return EMPTY
+        return self.ids[self.indices[self.indptr[i]:self.indptr[i + 1]]]
+
+    def _gather(self, caddy_ids):
+        """Everyone the unchanged caddies in ``caddy_ids`` follow, in one pass over the arrays."""
+        if self.changed:
+            caddy_ids = caddy_ids[~np.isin(caddy_ids, np.fromiter(self.changed, dtype=np.int64))]
+        rows = np.searchsorted(self.ids, caddy_ids)
+        found = rows < len(self.ids)
+        found[found] = self.ids[rows[found]] == caddy_ids[found]
+        rows = rows[found]
+        starts = self.indptr[rows]
+        lengths = self.indptr[rows + 1] - starts
+        # positions start..start+length of every row, laid end to end
+        offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+        return self.ids[self.indices[offsets]]
+
+    def following(self, caddy_id):
+        self._ensure_loaded()
+        with self.lock:
+            return self._following(caddy_id)
+
+    def follows_changed(self, follower_ids, followed_ids, added):
+        """Apply follows added or removed in this process."""
+        if self.loaded_at is None:
+            # loaded fresh on first use anyway
+            return
+        followed = np.array(sorted(followed_ids), dtype=np.int64)
+        with self.lock:
+            for follower_id in follower_ids:
+                current = self._following(follower_id)
+                if added:
+                    self.changed[follower_id] = np.union1d(current, followed)
+                else:
+                    self.changed[follower_id] = np.setdiff1d(current, followed)
+            if len(self.changed) >= COMPACT_AFTER:
+                self._compact()
+
+    def _compact(self):
+        """Merge the changed follow lists back into the arrays."""
+        src = np.repeat(self.ids, np.diff(self.indptr))
+        dst = self.ids[self.indices]
+        changed_ids = np.fromiter(self.changed, dtype=np.int64)
+        keep = ~np.isin(src, changed_ids)
+        src = [src[keep]] + [np.full(len(following), caddy_id) for caddy_id, following in self.changed.items()]
+        dst = [dst[keep]] + list(self.changed.values())
+        self._build(np.concatenate(src), np.concatenate(dst))
+        self.changed = {}
+
+    def suggestions(self, caddy_id, limit=SUGGESTIONS):
+        """
+        Caddies followed by the caddies ``caddy_id`` follows but not by
+        ``caddy_id`` itself, as (caddy id, mutual count) pairs with the most
+        mutual follows first. Ties go to whoever signed up first.
+        """
+        self._ensure_loaded()
+        with self.lock:
+            following = self._following(caddy_id)
+            if not len(following):
+                return []
+            candidates = [self._gather(following)]
+            candidates += [self.changed[f] for f in following.tolist() if f in self.changed]
+        candidates = np.concatenate(candidates)
+        if not len(candidates):
+            return []
+        ids, counts = np.unique(candidates, return_counts=True)
+        keep = (ids != caddy_id) & ~np.isin(ids, following)
+        ids, counts = ids[keep], counts[keep]
+        # ids are already sorted, a stable sort on the count keeps them in order within ties
+        best = np.argsort(-counts, kind="stable")[:limit]
+        return [(int(ids[i]), int(counts[i])) for i in best]
+
+
+graph = FollowGraph()
+
+
+def suggestions(caddy, limit=SUGGESTIONS):
+    """Caddies ``caddy`` may know, best first, with their mutual follow counts set as ``mutual``."""
+    # ask for extra in case some turn out to be staff
+    ranked = graph.suggestions(caddy.id, limit * 2)
+    caddies = Caddy.objects.filter(
+        id__in=[caddy_id for caddy_id, _ in ranked], user__isnull=False, user__is_staff=False
+    ).select_related("user").in_bulk()
+    result = []
+    for caddy_id, mutual in ranked:
+        # the graph can be a little behind on deleted accounts
+        if caddy_id in caddies:
+            caddies[caddy_id].mutual = mutual
+            result.append(caddies[caddy_id])
+    return result[:limit]
@@ -0,0 +1,96 @@
+import datetime
+import math
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Sum
+
+from .models import Loop
+
+# buckets are patched in place when loops change, so they can live a long time
+TIMEOUT = 60 * 60 * 24 * 7
+LEVELS = 4
+
+
+def year_key(user_id, year):
+    return f"heatmap:{user_id}:{year}"
+
+
+def _aggregate(loops):
+    # order_by() clears Loop's default ordering so it doesn't end up in the GROUP BY
+    rows = loops.order_by().values("date").annotate(loops=Sum("num_loops"), money=Sum("money"))
+    return {row["date"]: (row["loops"], row["money"]) for row in rows}
+
+
+def day_buckets(user_id, year):
+    """{date: (loops, money)} for each day of ``year`` the caddy logged loops."""
+    key = year_key(user_id, year)
+    buckets = cache.get(key)
+    if buckets is None:
+        buckets = _aggregate(Loop.objects.filter(caddy_id=user_id, date__year=year))
+        cache.set(key, buckets, TIMEOUT)
+    return buckets
+
+
+def days_changed(user_id, dates):
+    """Re-read the buckets for these days in the years that are cached, once the transaction commits."""
+    dates = set(dates)
+
+    def update():
+        keys = {year_key(user_id, year) for year in {date.year for date in dates}}
+        cached = cache.get_many(keys)
+        if not cached:
+            return
+        fresh = _aggregate(Loop.objects.filter(caddy_id=user_id, date__in=dates))
+        for date in dates:
+            buckets = cached.get(year_key(user_id, date.year))
+            if buckets is None:
+                continue
+            if date in fresh:
+                buckets[date] = fresh[date]
+            else:
+                buckets.pop(date, None)
+        cache.set_many(cached, TIMEOUT)
+
+    transaction.on_commit(update)
+
+
+def years_changed(user_id, years):
+    """Drop whole years, for imports that touch too many days to patch one by one."""
+    keys = [year_key(user_id, year) for year in years]
+    transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def calendar(user_id, year):
+    """
+    The year as a list of weeks, monday first, for the heatmap. Each day is
+    None when it falls outside the year, otherwise a dict with its loops,
+    money and a 0-LEVELS shade relative to the year's best day.
+    """
+    buckets = day_buckets(user_id, year)
+    best = max((money for _, money in buckets.values()), default=0)
+
+    first = datetime.date(year, 1, 1)
+    start = first - datetime.timedelta(days=first.weekday())
+    last = datetime.date(year, 12, 31)
+    weeks = []
+    day = start
+    while day <= last:
+        week = []
+        for _ in range(7):
+            if day.year != year:
+                week.append(None)
+            else:
+                loops, money = buckets.get(day, (0, 0))
+                level = math.ceil(money / best * LEVELS) if best > 0 and money > 0 else 0
+                week.append({"date": day, "loops": loops, "money": money, "level": level})
+            day += datetime.timedelta(days=1)
+        weeks.append(week)
+
+    return {
+        "year": year,
+        "weeks": weeks,
+        "loops": sum(loops for loops, _ in buckets.values()),
+        "money": sum(money for _, money in buckets.values()),
+        "days": len(buckets),
+    }
@@ -1,7 +1,51 @@
+import datetime
 import hashlib
-from django.utils.crypto import get_random_string
+import secrets
 
-def generate_activation_key(username):
-    chars = 'abcdefghijklmnopqrstuvwxyz0123456789!@#$%^&*(-_)=+'
-    secret_key = get_random_string(20, chars)
-    return hashlib.sha256((secret_key + username).encode('utf-8')).hexdigest()
\ No newline at end of file
+from django.utils import timezone
+
+from .models import AccountToken
+
+# how long the link in each kind of email stays valid
+TOKEN_TTL = {
+    AccountToken.ACTIVATION: datetime.timedelta(days=7),
+    AccountToken.CHANGE_EMAIL: datetime.timedelta(days=2),
+}
+
+
+def hash_key(key):
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+
+def generate_activation_key(user, purpose=AccountToken.ACTIVATION):
+    """
+    Create a single use token for ``user`` and return the key to email them.
+    Any earlier unused token for the same purpose stops working.
+    """
+    AccountToken.objects.filter(user=user, purpose=purpose, used_at__isnull=True).delete()
+    key = secrets.token_urlsafe(32)
+    AccountToken.objects.create(
+        user=user,
+        purpose=purpose,
+        key_hash=hash_key(key),
+        expires_at=timezone.now() + TOKEN_TTL[purpose],
+    )
+    return key
+
+
+def use_token(key, purpose, user=None):
+    """
+    Mark the token for ``key`` used and return it, or None if there's no such
+    unused, unexpired token. Only one caller can ever get a given token back.
+    """
+    now = timezone.now()
+    tokens = AccountToken.objects.filter(
+        key_hash=hash_key(key), purpose=purpose, used_at__isnull=True, expires_at__gt=now
+    )
+    if user is not None:
+        tokens = tokens.filter(user=user)
+    token = tokens.select_related("user").first()
+    # the conditional update is what makes it single use when two clicks race
+    if token is None or not tokens.filter(pk=token.pk).update(used_at=now):
+        return None
+    return token
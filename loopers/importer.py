@@ -0,0 +1,94 @@
+import csv
+
+from django.db import transaction
+from django.db.models import F
+
+from . import dashboard, feed, heatmap, stats
+from .export import Echo, FIELDS
+from .forms import NewLoopForm
+from .models import Caddy, Loop
+
+# loops inserted per INSERT statement
+BATCH_SIZE = 500
+
+REQUIRED_FIELDS = ["date", "loop_title", "num_loops", "money"]
+# skipped rows kept in the session for the error report, the rest are only counted
+SESSION_ERRORS = 100
+
+
+class ImportResult:
+    def __init__(self):
+        self.created = 0
+        # (line number, error message, row) for every row that was skipped
+        self.errors = []
+
+
+def _error_message(form):
+    return "; ".join(
+        f"{field}: {' '.join(messages)}" if field != "__all__" else " ".join(messages)
+        for field, messages in form.errors.items()
+    )
+
+
+def import_loops(user, lines, batch_size=BATCH_SIZE):
+    """
+    Read loops for ``user`` from CSV ``lines`` (the same columns the export
+    writes) and insert the valid ones in batches. Each row is checked with
+    NewLoopForm so it gets the same validation as the new loop page. The
+    caddy's loop_count, stats rollup and followers' feeds are updated once
+    for the whole import, all in one transaction.
+    """
+    result = ImportResult()
+    reader = csv.DictReader(lines)
+    missing = [field for field in REQUIRED_FIELDS if field not in (reader.fieldnames or [])]
+    if missing:
+        result.errors.append((1, f"Missing columns: {', '.join(missing)}", {}))
+        return result
+
+    total_loops = 0
+    years = set()
+    with transaction.atomic():
+        batch = []
+        for row in reader:
+            row = {field: row.get(field) or "" for field in FIELDS}
+            form = NewLoopForm(row)
+            if not form.is_valid():
+                result.errors.append((reader.line_num, _error_message(form), row))
+                continue
+
+            loop = form.save(commit=False)
+            loop.caddy = user
+            batch.append(loop)
+            years.add(loop.date.year)
+            if len(batch) >= batch_size:
+                total_loops += _insert(user, batch)
+                result.created += len(batch)
+                batch = []
+
+        if batch:
+            total_loops += _insert(user, batch)
+            result.created += len(batch)
+
+        if result.created:
+            Caddy.objects.filter(user=user).update(loop_count=F("loop_count") + total_loops)
+            feed.loops_imported(user)
+            # bulk_create doesn't send post_save
+            dashboard.invalidate_caddy(user.id)
+            heatmap.years_changed(user.id, years)
+    return result
+
+
+def _insert(user, loops):
+    Loop.objects.bulk_create(loops)
+    stats.update_stats(user, added=loops)
+    return sum(loop.num_loops for loop in loops)
+
+
+def error_report_lines(errors, more=0):
+    """CSV lines for the rows an import skipped, with the reason for each. ``more`` skipped rows weren't kept."""
+    writer = csv.writer(Echo())
+    yield writer.writerow(["line", "error"] + FIELDS)
+    for line, message, row in errors:
+        yield writer.writerow([line, message] + [row.get(field, "") for field in FIELDS])
+    if more:
+        yield writer.writerow(["", f"{more} more rows could not be imported and are not listed"])
@@ -0,0 +1,63 @@
+import datetime
+
+from django.core.cache import cache
+
+from .models import Caddy, PeriodStats, SeasonStats
+from .stats import period_start
+
+FRIENDS_SIZE = 3
+# the friends board is dropped by loopers.dashboard whenever it changes so it can live a long time
+FRIENDS_TIMEOUT = 60 * 60 * 24
+GLOBAL_SIZE = 10
+# the global boards change with every loop anyone logs, so they just expire
+GLOBAL_TIMEOUT = 60 * 5
+
+PERIODS = [PeriodStats.WEEK, PeriodStats.MONTH, "season"]
+
+
+def friends_key(user_id):
+    return f"leaderboard:friends:{user_id}"
+
+
+def top_friends(user):
+    """
+    The FRIENDS_SIZE followed caddies with the most loops as
+    (username, loop_count) pairs. Ties go to whoever signed up first.
+    """
+    key = friends_key(user.id)
+    board = cache.get(key)
+    if board is None:
+        board = list(
+            Caddy.objects.filter(caddy__user=user, user__isnull=False)
+            .order_by("-loop_count", "id")
+            .values_list("user__username", "loop_count")[:FRIENDS_SIZE]
+        )
+        cache.set(key, board, FRIENDS_TIMEOUT)
+    return board
+
+
+def top_caddies(period, today=None):
+    """
+    Every caddy ranked by loops logged in the current week, month or season
+    as (username, total_loops) pairs, best first.
+    """
+    today = today or datetime.date.today()
+    if period == "season":
+        start = today.replace(month=1, day=1)
+        rows = SeasonStats.objects.filter(season=today.year)
+    elif period in (PeriodStats.WEEK, PeriodStats.MONTH):
+        start = period_start(period, today)
+        rows = PeriodStats.objects.filter(period=period, start=start)
+    else:
+        raise ValueError(f"Unknown leaderboard period {period!r}")
+
+    key = f"leaderboard:{period}:{start.isoformat()}"
+    board = cache.get(key)
+    if board is None:
+        board = list(
+            rows.filter(total_loops__gt=0)
+            .order_by("-total_loops", "user_id")
+            .values_list("user__username", "total_loops")[:GLOBAL_SIZE]
+        )
+        cache.set(key, board, GLOBAL_TIMEOUT)
+    return board
@@ -0,0 +1,170 @@
+import json
+import math
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+from django.urls import get_resolver, reverse
+from django.utils import timezone
+
+from loopers.models import Caddy, Loop
+
+
+def percentile(samples, pct):
+    """Nearest rank percentile of an already sorted list."""
+    rank = max(1, math.ceil(pct / 100 * len(samples)))
+    return samples[rank - 1]
+
+
+def route_requests(user):
+    """
+    GET requests for each route, keyed by URL name. Routes that change
+    data or need a key from an email map to None and are skipped.
+    """
+    loop = Loop.objects.filter(caddy=user).first()
+    loop_kwargs = {"pk": loop.pk} if loop else None
+    routes = {
+        "index": ({}, {}),
+        "loops": ({}, {}),
+        "export_loops": ({}, {}),
+        "import_loops": ({}, {}),
+        "loop-detail": (loop_kwargs, {}),
+        "new_loop": ({}, {}),
+        "edit_loop": (loop_kwargs, {}),
+        "settings": ({}, {}),
+        "change_password": ({}, {}),
+        "change_email": ({}, {}),
+        "delete_account": ({"pk": user.pk}, {}),
+        "friends": ({}, {}),
+        "followers": ({}, {}),
+        "feed": ({}, {}),
+        "caddy_autocomplete": ({}, {"q": user.username[:2]}),
+        "leaderboard": ({}, {}),
+        "stats": ({}, {}),
+        "stats_json": ({}, {}),
+        "register": ({}, {}),
+        "terms_of_service": ({}, {}),
+        "privacy_policy": ({}, {}),
+    }
+    resolver = get_resolver().namespace_dict["loopers"][1]
+    for pattern in resolver.url_patterns:
+        kwargs, params = routes.get(pattern.name, (None, None))
+        if kwargs is None:
+            yield f"loopers:{pattern.name}", None
+        else:
+            path = reverse(f"loopers:{pattern.name}", kwargs=kwargs)
+            yield f"loopers:{pattern.name}", (path, params)
+
+
+def browser_client(user):
+    """A client logged in as ``user`` that gets past ALLOWED_HOSTS and SECURE_SSL_REDIRECT."""
+    hosts = [h for h in settings.ALLOWED_HOSTS if h and h != "*" and not h.startswith(".")]
+    client = Client(HTTP_HOST=hosts[0] if hosts else "localhost")
+    client.force_login(user)
+    return client
+
+
+def pick_user(username=None):
+    """The user to browse as, defaults to the caddy following the most caddies."""
+    if username:
+        user = User.objects.filter(username=username).first()
+    else:
+        caddy = Caddy.objects.filter(user__isnull=False).order_by("-following_count").first()
+        user = caddy.user if caddy else None
+    if user is None:
+        raise CommandError("No user to browse as, run seed_data first")
+    return user
+
+
+class Command(BaseCommand):
+    help = (
+        "Time every loopers route through the test client and report latency "
+        "percentiles and query counts"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--user", help="username to browse as, defaults to the caddy following the most caddies"
+        )
+        parser.add_argument("--runs", type=int, default=20, help="requests per route")
+        parser.add_argument("--output", help="save the results to this JSON file")
+        parser.add_argument("--compare", help="JSON file from an earlier run to compare against")
+        parser.add_argument(
+            "--threshold",
+            type=float,
+            default=20,
+            help="percent p95 slowdown that counts as a regression",
+        )
+
+    def handle(self, *args, **options):
+        user = pick_user(options["user"])
+        client = browser_client(user)
+
+        results = {
+            "created": timezone.now().isoformat(),
+            "user": user.username,
+            "runs": options["runs"],
+            "routes": {},
+            "skipped": [],
+        }
+        for name, request in route_requests(user):
+            if request is None:
+                results["skipped"].append(name)
+                continue
+            path, params = request
+            timings = []
+            queries = 0
+            for _ in range(options["runs"]):
+                start = time.perf_counter()
+                response = client.get(path, params, secure=True)
+                if response.streaming:
+                    b"".join(response.streaming_content)
+                timings.append((time.perf_counter() - start) * 1000)
+                queries = max(queries, response.wsgi_request.sql_queries.count)
+            timings.sort()
+            results["routes"][name] = {
+                "status": response.status_code,
+                "queries": queries,
+                "p50_ms": round(percentile(timings, 50), 3),
+                "p95_ms": round(percentile(timings, 95), 3),
+                "p99_ms": round(percentile(timings, 99), 3),
+            }
+
+        self.report(results)
+        if options["compare"]:
+            with open(options["compare"]) as f:
+                self.compare(json.load(f), results, options["threshold"])
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                json.dump(results, f, indent=2)
+
+    def report(self, results):
+        self.stdout.write(
+            f"{'route':32} {'status':>6} {'queries':>7} {'p50':>9} {'p95':>9} {'p99':>9}"
+        )
+        for name, row in results["routes"].items():
+            self.stdout.write(
+                f"{name:32} {row['status']:>6} {row['queries']:>7} "
+                f"{row['p50_ms']:>9.2f} {row['p95_ms']:>9.2f} {row['p99_ms']:>9.2f}"
+            )
+        if results["skipped"]:
+            self.stdout.write(f"skipped: {', '.join(results['skipped'])}")
+
+    def compare(self, old, new, threshold):
+        regressions = 0
+        for name, row in new["routes"].items():
+            before = old.get("routes", {}).get(name)
+            if before is None:
+                continue
+            slower = row["p95_ms"] > before["p95_ms"] * (1 + threshold / 100)
+            more_queries = row["queries"] > before["queries"]
+            if slower or more_queries:
+                regressions += 1
+                self.stdout.write(self.style.WARNING(
+                    f"REGRESSION {name}: p95 {before['p95_ms']:.2f} -> {row['p95_ms']:.2f} ms, "
+                    f"queries {before['queries']} -> {row['queries']}"
+                ))
+        if not regressions:
+            self.stdout.write(self.style.SUCCESS("No regressions"))
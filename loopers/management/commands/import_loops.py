@@ -0,0 +1,35 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from loopers import importer
+
+
+class Command(BaseCommand):
+    help = "Import a caddy's loops from a CSV file"
+
+    def add_arguments(self, parser):
+        parser.add_argument("username")
+        parser.add_argument("csv_file")
+        parser.add_argument(
+            "--errors", help="write the rows that could not be imported to this CSV file"
+        )
+        parser.add_argument("--batch-size", type=int, default=importer.BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options["username"])
+        except User.DoesNotExist:
+            raise CommandError(f"User {options['username']} does not exist")
+
+        with open(options["csv_file"], newline="", encoding="utf-8-sig") as lines:
+            result = importer.import_loops(user, lines, batch_size=options["batch_size"])
+
+        self.stdout.write(self.style.SUCCESS(f"Imported {result.created} loops"))
+        if result.errors:
+            self.stderr.write(f"{len(result.errors)} rows could not be imported")
+            if options["errors"]:
+                with open(options["errors"], "w", newline="") as report:
+                    report.writelines(importer.error_report_lines(result.errors))
+            else:
+                for line, message, row in result.errors:
+                    self.stderr.write(f"line {line}: {message}")
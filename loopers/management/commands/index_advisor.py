@@ -0,0 +1,283 @@
+import contextlib
+import hashlib
+import re
+
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, migrations, models
+from django.db.migrations.loader import MigrationLoader
+from django.db.migrations.writer import MigrationWriter
+
+from loopers.middleware import fingerprint
+
+from .benchmark_routes import browser_client, pick_user, route_requests
+
+# sqlite quotes names with ", mysql with `
+QUOTE = r'["`]'
+# "table"."column" compared against a parameter, the columns an index could be searched on
+FILTER_COLUMN = re.compile(
+    rf"{QUOTE}?(\w+){QUOTE}?\.{QUOTE}(\w+){QUOTE}\s*(?:=|<=|>=|<|>|IN\s*\()\s*%s", re.IGNORECASE
+)
+ORDER_BY = re.compile(r"\bORDER BY\b(.*?)(?:\bLIMIT\b|$)", re.IGNORECASE | re.DOTALL)
+COLUMN = re.compile(rf"{QUOTE}?(\w+){QUOTE}?\.{QUOTE}(\w+){QUOTE}")
+# joining a table a second time gives it an alias: INNER JOIN "loopers_caddy" T5
+TABLE_ALIAS = re.compile(rf"{QUOTE}(\w+){QUOTE}\s+(?:AS\s+)?(T\d+)\b")
+# "table"."column" = "other"."column", how two tables are joined
+JOIN_ON = re.compile(
+    rf"{QUOTE}?(\w+){QUOTE}?\.{QUOTE}(\w+){QUOTE}\s*=\s*{QUOTE}?(\w+){QUOTE}?\.{QUOTE}(\w+){QUOTE}"
+)
+
+
+class Capture:
+    """execute_wrapper keeping each distinct SELECT and the database it ran on."""
+
+    def __init__(self):
+        self.queries = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        if not many and sql.lstrip().upper().startswith("SELECT"):
+            self.queries.setdefault(fingerprint(sql), (context["connection"].alias, sql, params))
+        return execute(sql, params, many, context)
+
+
+def explain(alias, sql, params):
+    """
+    Problems in the query plan as (table, kind, detail) where kind is "scan",
+    "index scan", "filesort" or "temporary".
+    """
+    connection = connections[alias]
+    with connection.cursor() as cursor:
+        if connection.vendor == "sqlite":
+            cursor.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+            return list(_sqlite_problems(row[-1] for row in cursor.fetchall()))
+        if connection.vendor == "mysql":
+            cursor.execute(f"EXPLAIN {sql}", params)
+            columns = [col[0].lower() for col in cursor.description]
+            return list(_mysql_problems(dict(zip(columns, row)) for row in cursor.fetchall()))
+    raise CommandError(f"EXPLAIN isn't supported on {connection.vendor}, only sqlite and mysql")
+
+
+def _sqlite_problems(details):
+    for detail in details:
+        words = detail.split()
+        if words[0] == "SCAN" and words[1] != "CONSTANT":
+            # a covering index scan still reads every row, but off the smaller index
+            kind = "index scan" if "USING" in words else "scan"
+            yield words[1], kind, detail
+        elif detail.startswith("USE TEMP B-TREE"):
+            # the sort belongs to the query, not a table, see ordered_table
+            yield None, "filesort", detail
+
+
+def _mysql_problems(rows):
+    for row in rows:
+        table, extra = row.get("table"), row.get("extra") or ""
+        if row.get("type") == "ALL":
+            yield table, "scan", f"type=ALL possible_keys={row.get('possible_keys')}"
+        elif row.get("type") == "index":
+            yield table, "index scan", f"type=index key={row.get('key')}"
+        if "Using filesort" in extra:
+            yield table, "filesort", extra
+        if "Using temporary" in extra:
+            yield table, "temporary", extra
+
+
+def aliases(sql):
+    """{alias or table name: table name} for the tables in ``sql``."""
+    return {alias: table for table, alias in TABLE_ALIAS.findall(sql)}
+
+
+def ordered_table(sql):
+    """The table or alias the ORDER BY starts with."""
+    order = ORDER_BY.search(sql)
+    columns = COLUMN.findall(order.group(1)) if order else []
+    return columns[0][0] if columns else None
+
+
+def wanted_columns(sql, name):
+    """Columns of table or alias ``name`` the query filters on, and the ones it orders by."""
+    filters = [column for table, column in FILTER_COLUMN.findall(sql) if table == name]
+    order = ORDER_BY.search(sql)
+    orders = []
+    if order:
+        orders = [column for table, column in COLUMN.findall(order.group(1)) if table == name]
+    return list(dict.fromkeys(filters)), list(dict.fromkeys(orders))
+
+
+def filtered_tables(sql):
+    """Tables or aliases the query filters on, in the order they appear."""
+    return list(dict.fromkeys(table for table, column in FILTER_COLUMN.findall(sql)))
+
+
+def join_columns(sql, name, other):
+    """{column of ``name``: column of ``other``} for the conditions joining the two."""
+    pairs = {}
+    for left, left_column, right, right_column in JOIN_ON.findall(sql):
+        if (left, right) == (name, other):
+            pairs[left_column] = right_column
+        elif (left, right) == (other, name):
+            pairs[right_column] = left_column
+    return pairs
+
+
+def existing_indexes(model):
+    """Column lists of every index on ``model``, primary key and unique constraints included."""
+    indexes = [[model._meta.pk.column]]
+    for field in model._meta.local_fields:
+        if field.db_index or field.unique:
+            indexes.append([field.column])
+    for index in model._meta.indexes:
+        indexes.append([model._meta.get_field(name.lstrip("-")).column for name in index.fields])
+    for fields in model._meta.unique_together:
+        indexes.append([model._meta.get_field(name).column for name in fields])
+    for constraint in model._meta.constraints:
+        # a unique constraint is backed by an index, unless it's partial
+        if isinstance(constraint, models.UniqueConstraint) and constraint.fields and constraint.condition is None:
+            indexes.append([model._meta.get_field(name).column for name in constraint.fields])
+    return indexes
+
+
+class Command(BaseCommand):
+    help = (
+        "Replay every loopers route, EXPLAIN the queries each one runs and "
+        "report full scans, filesorts and indexes that look missing"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--user", help="username to browse as, defaults to the caddy following the most caddies"
+        )
+        parser.add_argument(
+            "--migration", help="write a migration adding the suggested loopers indexes to this file"
+        )
+
+    def handle(self, *args, **options):
+        user = pick_user(options["user"])
+        client = browser_client(user)
+        models_by_table = {
+            model._meta.db_table: model for model in apps.get_models(include_auto_created=True)
+        }
+
+        suggestions = {}
+        findings = 0
+        for name, request in route_requests(user):
+            if request is None:
+                continue
+            path, params = request
+            capture = Capture()
+            with contextlib.ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(capture))
+                response = client.get(path, params, secure=True)
+                if response.streaming:
+                    b"".join(response.streaming_content)
+
+            self.stdout.write(f"{name}: {len(capture.queries)} distinct queries")
+            for alias, sql, sql_params in capture.queries.values():
+                for table, kind, detail in explain(alias, sql, sql_params):
+                    findings += 1
+                    if kind == "filesort":
+                        table = ordered_table(sql)
+                    self.stdout.write(self.style.WARNING(f"  {kind} on {table}: {detail}"))
+                    self.stdout.write(f"    {fingerprint(sql)[:200]}")
+                    if kind == "temporary" or table is None:
+                        continue
+                    model, fields, reason = self.suggest(models_by_table, sql, table)
+                    self.stdout.write(f"    {reason}")
+                    if fields:
+                        suggestions[(model, tuple(fields))] = True
+
+        if not findings:
+            self.stdout.write(self.style.SUCCESS("No full scans or filesorts"))
+        if options["migration"]:
+            self.write_migration(options["migration"], list(suggestions))
+
+    def suggest(self, models_by_table, sql, name):
+        """
+        (model, fields to index or None, explanation) for a problem on table
+        or alias ``name``.
+        """
+        model = models_by_table.get(aliases(sql).get(name, name))
+        if model is None:
+            return None, None, "not a model table, nothing to suggest"
+        filters, orders = wanted_columns(sql, name)
+        joined = [table for table in filtered_tables(sql) if table != name]
+        if orders and not filters and joined:
+            # the planner starts from the filtered table, so that's where the
+            # rows have to come out in order
+            return self.suggest_join(models_by_table, sql, name, orders, joined[0])
+        # filtered and sorted on the same column (a range) goes with the sort
+        filters = [column for column in filters if column not in orders]
+        columns = filters + orders
+        if not columns:
+            return None, None, "reads the whole table on purpose, an index won't help"
+        for index in existing_indexes(model):
+            if set(index[: len(filters)]) != set(filters):
+                continue
+            covered = index[len(filters):len(columns)]
+            if covered == orders:
+                return None, None, (
+                    f"already indexed on ({', '.join(index)}), the planner skipped it, "
+                    "check the plan on production-sized data"
+                )
+            if orders and covered and covered == orders[: len(covered)]:
+                return None, None, (
+                    f"({', '.join(index)}) covers the filter and the start of the ORDER BY, "
+                    "only ties are sorted"
+                )
+        return self.new_index(model, columns)
+
+    def suggest_join(self, models_by_table, sql, name, orders, other):
+        """suggest() for a sort on ``name`` when the filter is on the joined ``other``."""
+        sorted_on = ", ".join(f"{name}.{column}" for column in orders)
+        table = aliases(sql).get(other, other)
+        filtered_on = other if table == other else f"{other} ({table})"
+        model = models_by_table.get(table)
+        if model is None:
+            return None, None, f"sorted on {sorted_on} but filtered on {filtered_on}, not a model table"
+        pairs = join_columns(sql, name, other)
+        if any(column not in pairs for column in orders):
+            return None, None, (
+                f"sorted on {sorted_on} but filtered on {filtered_on}, one index can't do both, "
+                "only the rows the filter finds are sorted"
+            )
+        joined = [pairs[column] for column in orders]
+        order_by = ", ".join(f"{other}.{column}" for column in joined)
+        filters = [column for column in wanted_columns(sql, other)[0] if column not in joined]
+        columns = filters + joined
+        for index in existing_indexes(model):
+            if set(index[: len(filters)]) == set(filters) and index[len(filters):len(columns)] == joined:
+                return None, None, (
+                    f"filtered on {filtered_on}, whose ({', '.join(index)}) index reads the rows in order, "
+                    f"but the sort is on {sorted_on}, order by {order_by} instead"
+                )
+        model, fields, reason = self.new_index(model, columns)
+        return model, fields, f"filtered on {filtered_on}: {reason} and order by {order_by}"
+
+    def new_index(self, model, columns):
+        if model._meta.app_label != "loopers":
+            return None, None, f"would need an index on ({', '.join(columns)}) outside loopers"
+        by_column = {field.column: field.name for field in model._meta.local_fields}
+        fields = [by_column[column] for column in columns if column in by_column]
+        return model, fields, f"suggest an index on {model.__name__}({', '.join(fields)})"
+
+    def write_migration(self, path, suggestions):
+        if not suggestions:
+            self.stdout.write("No indexes to suggest, migration not written")
+            return
+        loader = MigrationLoader(None, ignore_no_migrations=True)
+        migration = migrations.Migration("suggested_indexes", "loopers")
+        migration.dependencies = [("loopers", name) for _, name in loader.graph.leaf_nodes("loopers")]
+        for model, fields in suggestions:
+            digest = hashlib.md5(f"{model._meta.db_table}{fields}".encode()).hexdigest()[:6]
+            name = f"{model._meta.model_name[:12]}_{digest}_idx"
+            migration.operations.append(
+                migrations.AddIndex(
+                    model_name=model._meta.model_name,
+                    index=models.Index(fields=list(fields), name=name),
+                )
+            )
+        with open(path, "w") as f:
+            f.write(MigrationWriter(migration).as_string())
+        self.stdout.write(self.style.SUCCESS(f"Wrote {len(migration.operations)} indexes to {path}"))
+
@@ -0,0 +1,25 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.http import QueryDict
+
+from loopers import profiler
+
+
+class Command(BaseCommand):
+    help = (
+        "Print a link that profiles a caddy's requests to a page for a day, "
+        "the profiles show up under Request profiles in the admin"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("username")
+        parser.add_argument("--path", default="/", help="page to link to, defaults to the dashboard")
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options["username"])
+        except User.DoesNotExist:
+            raise CommandError(f"No user called {options['username']}")
+        query = QueryDict(mutable=True)
+        query[profiler.PARAM] = profiler.signed_flag(user)
+        self.stdout.write(f"{options['path']}?{query.urlencode()}")
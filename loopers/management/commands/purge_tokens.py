@@ -0,0 +1,44 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from django.utils import timezone
+
+from loopers.helpers import TOKEN_TTL
+from loopers.models import AccountToken
+
+
+class Command(BaseCommand):
+    help = "Delete used and expired tokens and accounts that were never activated"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dry-run", action="store_true", help="only report what would be deleted"
+        )
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        tokens = AccountToken.objects.filter(Q(expires_at__lte=now) | Q(used_at__isnull=False))
+
+        # signed up but never clicked the activation link before it expired
+        users = User.objects.filter(
+            is_active=False,
+            is_staff=False,
+            last_login__isnull=True,
+            caddy__email_validated=False,
+            date_joined__lte=now - TOKEN_TTL[AccountToken.ACTIVATION],
+        ).exclude(
+            id__in=AccountToken.objects.filter(
+                purpose=AccountToken.ACTIVATION, used_at__isnull=True, expires_at__gt=now
+            ).values("user_id")
+        )
+
+        if options["dry_run"]:
+            self.stdout.write(
+                f"Would delete {tokens.count()} tokens and {users.count()} unactivated accounts"
+            )
+            return
+
+        token_count, _ = tokens.delete()
+        user_count = users.count()
+        users.delete()
+        self.stdout.write(f"Deleted {token_count} tokens and {user_count} unactivated accounts")
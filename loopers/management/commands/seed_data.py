@@ -0,0 +1,154 @@
+import datetime
+import itertools
+import random
+import re
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+from loopers import feed, stats
+from loopers.models import Caddy, Follow, Loop
+from loopers.signals import recount_follows
+
+BATCH_SIZE = 5000
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(itertools.islice(iterator, size)):
+        yield batch
+
+
+class Command(BaseCommand):
+    help = "Fill the database with synthetic caddies, loops and follows for benchmarking"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--caddies", type=int, default=1000)
+        parser.add_argument("--loops", type=int, default=100, help="loops per caddy")
+        parser.add_argument(
+            "--follow-exponent",
+            type=float,
+            default=1.5,
+            help="pareto shape of the follows per caddy, lower means a longer tail",
+        )
+        parser.add_argument("--max-follows", type=int, default=500)
+        parser.add_argument("--prefix", default="seed", help="usernames are <prefix><n>")
+        parser.add_argument(
+            "--flush",
+            action="store_true",
+            help="delete the caddies an earlier run seeded with this prefix first",
+        )
+        parser.add_argument("--password", default="Benchmark1!")
+        parser.add_argument("--seed", type=int, default=0, help="random seed")
+
+    def handle(self, *args, **options):
+        rng = random.Random(options["seed"])
+        prefix = options["prefix"]
+        count = options["caddies"]
+
+        with transaction.atomic():
+            seeded = User.objects.filter(username__regex=rf"^{re.escape(prefix)}[0-9]+$")
+            if options["flush"]:
+                deleted = seeded.delete()[1].get("auth.User", 0)
+                self.stdout.write(f"Deleted {deleted} seeded caddies")
+            elif seeded.exists():
+                raise CommandError(
+                    f"Caddies named {prefix}<n> already exist, pass --flush to replace them "
+                    "or pick another --prefix"
+                )
+
+            # hashing once is what keeps this fast, every seeded caddy shares it
+            password = make_password(options["password"])
+            usernames = [f"{prefix}{i}" for i in range(count)]
+            for batch in batched(usernames, BATCH_SIZE):
+                User.objects.bulk_create(
+                    User(username=name, email=f"{name}@example.com", password=password)
+                    for name in batch
+                )
+            # re-read the ids, MySQL doesn't hand them back from bulk_create
+            user_ids = list(
+                User.objects.filter(username__in=usernames).order_by("id").values_list("id", flat=True)
+            )
+            Caddy.objects.bulk_create(
+                (Caddy(user_id=user_id, email_validated=True) for user_id in user_ids),
+                batch_size=BATCH_SIZE,
+            )
+            caddy_ids = list(
+                Caddy.objects.filter(user_id__in=user_ids).order_by("id").values_list("id", flat=True)
+            )
+            self.stdout.write(f"Created {len(user_ids)} caddies")
+
+            loops = self.generate_loops(rng, user_ids, options["loops"])
+            for batch in batched(loops, BATCH_SIZE):
+                Loop.objects.bulk_create(batch)
+            self.stdout.write(f"Created {len(user_ids) * options['loops']} loops")
+
+            follows = self.generate_follows(
+                rng, caddy_ids, options["follow_exponent"], options["max_follows"]
+            )
+            total = 0
+            for batch in batched(follows, BATCH_SIZE):
+                Follow.objects.bulk_create(
+                    Follow(from_caddy_id=a, to_caddy_id=b) for a, b in batch
+                )
+                total += len(batch)
+            self.stdout.write(f"Created {total} follows")
+
+            # bulk_create skips the signals and views that keep these in sync
+            loop_totals = (
+                Loop.objects.filter(caddy_id=OuterRef("user_id"))
+                .order_by()
+                .values("caddy_id")
+                .annotate(total=Sum("num_loops"))
+                .values("total")
+            )
+            Caddy.objects.filter(id__in=caddy_ids).update(
+                loop_count=Coalesce(Subquery(loop_totals), 0)
+            )
+            for batch in batched(caddy_ids, BATCH_SIZE):
+                recount_follows(batch)
+            for user in User.objects.filter(id__in=user_ids):
+                stats.rebuild_stats(user)
+            following = Caddy.objects.filter(id__in=caddy_ids, following_count__gt=0)
+            for user_id in following.values_list("user_id", flat=True):
+                feed.backfill(user_id)
+        self.stdout.write(self.style.SUCCESS("Rebuilt counts, stats and feeds"))
+
+    def generate_loops(self, rng, user_ids, per_caddy):
+        today = datetime.date.today()
+        for user_id in user_ids:
+            for i in range(per_caddy):
+                yield Loop(
+                    loop_title=f"Loop {i}",
+                    date=today - datetime.timedelta(days=rng.randrange(3 * 365)),
+                    num_loops=rng.choice([1, 1, 1, 2]),
+                    money=rng.randrange(40, 160),
+                    caddy_id=user_id,
+                )
+
+    def generate_follows(self, rng, caddy_ids, exponent, max_follows):
+        """
+        How many caddies each caddy follows is pareto distributed, and who
+        they follow is picked with zipf weights so a few caddies end up with
+        most of the followers, like a real social graph.
+        """
+        if len(caddy_ids) < 2:
+            return
+        cum_weights = list(itertools.accumulate(1 / (rank + 1) for rank in range(len(caddy_ids))))
+        popularity = caddy_ids[:]
+        rng.shuffle(popularity)
+        # leave plenty of caddies unfollowed or picking the last few by weight takes forever
+        limit = min(max_follows, max(1, (len(caddy_ids) - 1) // 2))
+        for caddy_id in caddy_ids:
+            wanted = min(limit, int(rng.paretovariate(exponent)))
+            followed = set()
+            while len(followed) < wanted:
+                other = rng.choices(popularity, cum_weights=cum_weights)[0]
+                if other != caddy_id:
+                    followed.add(other)
+            for other in followed:
+                yield caddy_id, other
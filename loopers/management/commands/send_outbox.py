@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from loopers import feed, outbox
+
+
+class Command(BaseCommand):
+    help = "Send the emails waiting in the outbox and trim the feeds that grew"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=outbox.BATCH_SIZE)
+        parser.add_argument(
+            "--forever", action="store_true", help="keep running and poll for new emails"
+        )
+        parser.add_argument(
+            "--interval", type=float, default=5, help="seconds to wait between polls"
+        )
+
+    def handle(self, *args, **options):
+        # from 0 so feeds that grew while no worker ran are trimmed too
+        trimmed_to = 0
+        while True:
+            count = outbox.drain(options["batch_size"])
+            if count:
+                self.stdout.write(f"Processed {count} emails")
+            trimmed_to = feed.trim_new_entries(trimmed_to)
+            if not options["forever"]:
+                break
+            time.sleep(options["interval"])
@@ -0,0 +1,240 @@
+import contextlib
+import fcntl
+import glob
+import json
+import os
+import tempfile
+import threading
+import time
+import uuid
+from collections import defaultdict
+
+from django.conf import settings
+
+PREFIX = "caddyshackhub_"
+# seconds, upper bounds of the histogram buckets
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+# how often a process writes its numbers out for the others to collect
+FLUSH_INTERVAL = 1.0
+# where the numbers of processes that exited end up, see _fold_exited
+AGGREGATE_FILE = "metrics-aggregate.json"
+
+HELP = {
+    "http_request_duration_seconds": ("histogram", "Request latency by URL name"),
+    "http_responses_total": ("counter", "Responses by URL name and status code"),
+    "db_queries_total": ("counter", "Database queries by URL name"),
+    "db_query_duration_seconds_total": ("counter", "Time spent in database queries by URL name"),
+    "email_send_duration_seconds": ("histogram", "Time to hand one outbox email to the mail server"),
+    "emails_sent_total": ("counter", "Outbox emails sent"),
+    "email_failures_total": ("counter", "Outbox email send attempts that failed"),
+    "outbox_pending": ("gauge", "Outbox emails waiting to be sent"),
+}
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+class Registry:
+    """
+    Counters and histograms for this process. With settings.METRICS_DIR set
+    each process writes them to its own file there, and collect() adds up
+    every file, so the numbers cover all the gunicorn workers and the outbox
+    worker. Files of processes that exit are folded into one aggregate file
+    so the totals never go back and the directory doesn't grow with restarts.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self.pid = os.getpid()
+        self.counters = defaultdict(float)
+        # key -> [count per bucket..., sum, count]
+        self.histograms = {}
+        self.path = None
+        self.flushed_at = 0.0
+
+    def _check_fork(self):
+        # a forked worker starts with its parent's numbers and file, drop them
+        if os.getpid() != self.pid:
+            self._reset()
+
+    def inc(self, name, labels=None, amount=1):
+        with self.lock:
+            self._check_fork()
+            self.counters[_key(name, labels or {})] += amount
+
+    def observe(self, name, value, labels=None):
+        with self.lock:
+            self._check_fork()
+            key = _key(name, labels or {})
+            row = self.histograms.get(key)
+            if row is None:
+                row = self.histograms[key] = [0] * (len(BUCKETS) + 2)
+            for i, bound in enumerate(BUCKETS):
+                if value <= bound:
+                    row[i] += 1
+                    break
+            row[-2] += value
+            row[-1] += 1
+
+    def snapshot(self):
+        with self.lock:
+            self._check_fork()
+            return {
+                "counters": [[name, dict(labels), value] for (name, labels), value in self.counters.items()],
+                "histograms": [[name, dict(labels), row[:]] for (name, labels), row in self.histograms.items()],
+            }
+
+    def flush(self, force=False):
+        directory = getattr(settings, "METRICS_DIR", "")
+        if not directory or (not force and time.monotonic() - self.flushed_at < FLUSH_INTERVAL):
+            return
+        data = self.snapshot()
+        if self.path is None:
+            # not just the pid, a new process can get the pid of one that exited
+            self.path = os.path.join(directory, f"metrics-{self.pid}-{uuid.uuid4().hex[:8]}.json")
+        fd, tmp = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump(data, f)
+        # replace is atomic, a reader never sees half a file
+        os.replace(tmp, self.path)
+        self.flushed_at = time.monotonic()
+
+
+registry = Registry()
+
+
+def _read(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        # removed or being replaced, it's counted on the next scrape
+        return None
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # someone else's process, but it's running
+        pass
+    return True
+
+
+@contextlib.contextmanager
+def _locked(directory, operation):
+    with open(os.path.join(directory, "metrics.lock"), "a") as lock:
+        fcntl.flock(lock, operation)
+        yield
+
+
+def _fold_exited(directory):
+    """Add the files of processes that have exited into AGGREGATE_FILE and remove them."""
+    exited = []
+    for path in glob.glob(os.path.join(directory, "metrics-*-*.json")):
+        pid = os.path.basename(path).split("-")[1]
+        # a reused pid only keeps a file around a little longer
+        if pid.isdigit() and int(pid) != os.getpid() and not _alive(int(pid)):
+            exited.append(path)
+    if not exited:
+        return
+
+    # one scrape at a time, two folding the same file would count it twice
+    with _locked(directory, fcntl.LOCK_EX):
+        # another scrape may have folded some while this one waited
+        exited = [path for path in exited if os.path.exists(path)]
+        if not exited:
+            return
+        aggregate = os.path.join(directory, AGGREGATE_FILE)
+        counters, histograms = _merge(filter(None, map(_read, [aggregate] + exited)))
+        fd, tmp = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump({
+                "counters": [[name, dict(labels), value] for (name, labels), value in counters.items()],
+                "histograms": [[name, dict(labels), row] for (name, labels), row in histograms.items()],
+            }, f)
+        os.replace(tmp, aggregate)
+        for path in exited:
+            os.remove(path)
+
+
+def collect():
+    """Every process's numbers added together, as (counters, histograms) dicts."""
+    directory = getattr(settings, "METRICS_DIR", "")
+    if directory:
+        registry.flush(force=True)
+        _fold_exited(directory)
+        # between a fold's replace of the aggregate and its removing the files
+        # they'd be counted twice, so read while no fold is running
+        with _locked(directory, fcntl.LOCK_SH):
+            snapshots = list(filter(None, map(_read, glob.glob(os.path.join(directory, "metrics-*.json")))))
+    else:
+        snapshots = [registry.snapshot()]
+    return _merge(snapshots)
+
+
+def _merge(snapshots):
+    counters = defaultdict(float)
+    histograms = {}
+    for snapshot in snapshots:
+        for name, labels, value in snapshot["counters"]:
+            counters[_key(name, labels)] += value
+        for name, labels, row in snapshot["histograms"]:
+            key = _key(name, labels)
+            if key in histograms:
+                histograms[key] = [a + b for a, b in zip(histograms[key], row)]
+            else:
+                histograms[key] = list(row)
+    return counters, histograms
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _number(value):
+    return repr(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def render(gauges=None):
+    """All metrics in the Prometheus text exposition format."""
+    counters, histograms = collect()
+    by_name = defaultdict(list)
+    for (name, labels), value in counters.items():
+        by_name[name].append((labels, value))
+    for (name, labels), row in histograms.items():
+        by_name[name].append((labels, row))
+    for name, value in (gauges or {}).items():
+        by_name[name].append(((), value))
+
+    lines = []
+    for name in sorted(by_name):
+        kind, help_text = HELP.get(name, ("untyped", name))
+        full = PREFIX + name
+        lines.append(f"# HELP {full} {help_text}")
+        lines.append(f"# TYPE {full} {kind}")
+        for labels, value in sorted(by_name[name]):
+            if kind != "histogram":
+                lines.append(f"{full}{_labels(labels)} {_number(value)}")
+                continue
+            cumulative = 0
+            for bound, count in zip(BUCKETS, value):
+                cumulative += count
+                lines.append(f"{full}_bucket{_labels(labels, [('le', bound)])} {cumulative}")
+            lines.append(f"{full}_bucket{_labels(labels, [('le', '+Inf')])} {value[-1]}")
+            lines.append(f"{full}_sum{_labels(labels)} {_number(value[-2])}")
+            lines.append(f"{full}_count{_labels(labels)} {value[-1]}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,185 @@
+import contextlib
+import logging
+import re
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.db import connections
+from django.urls import reverse
+
+from . import metrics, profiler, routers
+
+logger = logging.getLogger("loopers.sql")
+
+# "IN (%s, %s, %s)" and "IN (%s)" are the same query for duplicate detection
+IN_LIST = re.compile(r"\(\s*%s(?:\s*,\s*%s)*\s*\)")
+WHITESPACE = re.compile(r"\s+")
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+def fingerprint(sql):
+    return WHITESPACE.sub(" ", IN_LIST.sub("(...)", sql)).strip()
+
+
+class QueryRecorder:
+    """execute_wrapper that counts and times every query run through it."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.fingerprints = Counter()
+        # seconds per fingerprint
+        self.times = Counter()
+        self.paused = False
+
+    def __call__(self, execute, sql, params, many, context):
+        if self.paused:
+            return execute(sql, params, many, context)
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.duration += elapsed
+            self.count += 1
+            key = fingerprint(sql)
+            self.fingerprints[key] += 1
+            self.times[key] += elapsed
+
+    @contextlib.contextmanager
+    def pause(self):
+        """Queries run inside aren't counted, for work done about the request rather than for it."""
+        self.paused = True
+        try:
+            yield
+        finally:
+            self.paused = False
+
+    @property
+    def duplicates(self):
+        """Fingerprints of the queries that ran more than once."""
+        return {sql: count for sql, count in self.fingerprints.items() if count > 1}
+
+
+class QueryInstrumentationMiddleware:
+    """
+    Records how many queries each request ran and how long they took. The
+    numbers go out in a Server-Timing header and a "loopers.sql" log line,
+    and are kept on ``request.sql_queries`` for tests.
+
+    settings.QUERY_BUDGETS maps URL names ("loopers:index") to the most
+    queries the view should need. Going over is logged as a warning, or
+    raises QueryBudgetExceeded when settings.QUERY_BUDGET_RAISE is on.
+    Queries run while a StreamingHttpResponse is consumed aren't counted.
+
+    The latency, status and query numbers also go to loopers.metrics.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        start = time.perf_counter()
+        recorder = QueryRecorder()
+        request.sql_queries = recorder
+        # every database, reads can go to the replica
+        with contextlib.ExitStack() as stack:
+            for conn in connections.all():
+                stack.enter_context(conn.execute_wrapper(recorder))
+            response = self.get_response(request)
+
+        match = getattr(request, "resolver_match", None)
+        url_name = match.view_name if match else None
+        duplicates = recorder.duplicates
+        db_ms = recorder.duration * 1000
+
+        response["Server-Timing"] = f'db;dur={db_ms:.2f};desc="{recorder.count} queries"'
+        # URL names instead of paths keep the number of series down
+        labels = {"view": url_name or "unmatched"}
+        metrics.registry.observe("http_request_duration_seconds", time.perf_counter() - start, labels)
+        metrics.registry.inc("http_responses_total", {**labels, "status": response.status_code})
+        metrics.registry.inc("db_queries_total", labels, recorder.count)
+        metrics.registry.inc("db_query_duration_seconds_total", labels, recorder.duration)
+        metrics.registry.flush()
+        logger.info(
+            "path=%s url_name=%s status=%s queries=%d db_ms=%.2f duplicates=%d",
+            request.path,
+            url_name,
+            response.status_code,
+            recorder.count,
+            db_ms,
+            sum(duplicates.values()) - len(duplicates),
+            extra={
+                "url_name": url_name,
+                "queries": recorder.count,
+                "db_ms": db_ms,
+                "duplicate_queries": duplicates,
+            },
+        )
+
+        budget = getattr(settings, "QUERY_BUDGETS", {}).get(url_name)
+        if budget is not None and recorder.count > budget:
+            message = f"{url_name} ran {recorder.count} queries, budget is {budget}"
+            if getattr(settings, "QUERY_BUDGET_RAISE", False):
+                raise QueryBudgetExceeded(message)
+            logger.warning(message, extra={"duplicate_queries": duplicates})
+        return response
+
+
+class ReplicaPinMiddleware:
+    """
+    Read-your-writes for loopers.routers: once a request writes, the browser
+    gets a cookie that keeps its reads on the primary for
+    settings.REPLICA_STICKY_SECONDS, long enough for the replica to catch up.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        tokens = routers.start_request(pinned=routers.PIN_COOKIE in request.COOKIES)
+        try:
+            response = self.get_response(request)
+        finally:
+            wrote = routers.finish_request(tokens)
+        if wrote and routers.replica_configured():
+            response.set_cookie(
+                routers.PIN_COOKIE,
+                "1",
+                max_age=settings.REPLICA_STICKY_SECONDS,
+                secure=request.is_secure(),
+                httponly=True,
+                samesite="Lax",
+            )
+        return response
+
+
+class ProfilerMiddleware:
+    """
+    Profiles requests asked for with ?profile=, see profiler.wants_profile,
+    and stores what it found as a RequestProfile. The response gets an
+    X-Profile header with the profile's admin path. Goes after
+    AuthenticationMiddleware, other requests only pay for one GET lookup.
+    Storing the profile isn't counted against the request's query budget.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not profiler.wants_profile(request):
+            return self.get_response(request)
+
+        with profiler.Profile() as profile:
+            response = self.get_response(request)
+            if hasattr(response, "render") and not response.is_rendered:
+                response.render()
+        recorder = getattr(request, "sql_queries", None)
+        with recorder.pause() if recorder else contextlib.nullcontext():
+            stored = profiler.store(request, response, profile)
+        response["X-Profile"] = reverse("admin:loopers_requestprofile_change", args=[stored.pk])
+        return response
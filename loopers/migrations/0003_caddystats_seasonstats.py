@@ -0,0 +1,88 @@
+# Generated by Django 5.0.1 on 2026-10-17 16:23
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Max, Min, Sum
+
+
+def backfill_stats(apps, schema_editor):
+    Loop = apps.get_model("loopers", "Loop")
+    CaddyStats = apps.get_model("loopers", "CaddyStats")
+    SeasonStats = apps.get_model("loopers", "SeasonStats")
+
+    loops = Loop.objects.order_by()
+    totals = loops.values("caddy").annotate(
+        total_loops=Sum("num_loops"),
+        total_money=Sum("money"),
+        entry_count=Count("id"),
+        first_loop_date=Min("date"),
+        last_loop_date=Max("date"),
+    )
+    CaddyStats.objects.bulk_create(
+        (CaddyStats(user_id=row.pop("caddy"), **row) for row in totals), batch_size=500
+    )
+
+    seasons = loops.values("caddy", "date__year").annotate(
+        total_loops=Sum("num_loops"), total_money=Sum("money"), entry_count=Count("id")
+    )
+    SeasonStats.objects.bulk_create(
+        (
+            SeasonStats(
+                user_id=row["caddy"],
+                season=row["date__year"],
+                total_loops=row["total_loops"],
+                total_money=row["total_money"],
+                entry_count=row["entry_count"],
+            )
+            for row in seasons
+        ),
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loopers', '0002_alter_caddy_user'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CaddyStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total_loops', models.IntegerField(default=0)),
+                ('total_money', models.IntegerField(default=0)),
+                ('entry_count', models.IntegerField(default=0)),
+                ('first_loop_date', models.DateField(blank=True, null=True)),
+                ('last_loop_date', models.DateField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='stats', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name_plural': 'caddy stats',
+            },
+        ),
+        migrations.CreateModel(
+            name='SeasonStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('season', models.PositiveSmallIntegerField()),
+                ('total_loops', models.IntegerField(default=0)),
+                ('total_money', models.IntegerField(default=0)),
+                ('entry_count', models.IntegerField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='season_stats', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name_plural': 'season stats',
+                'ordering': ['-season'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='seasonstats',
+            constraint=models.UniqueConstraint(fields=('user', 'season'), name='unique_user_season'),
+        ),
+        migrations.RunPython(backfill_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.0.1 on 2026-10-17 16:25
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loopers', '0003_caddystats_seasonstats'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='loop',
+            options={'ordering': ['-date', '-id']},
+        ),
+        migrations.AddIndex(
+            model_name='loop',
+            index=models.Index(fields=['caddy', 'date', 'id'], name='loop_caddy_date_id_idx'),
+        ),
+    ]
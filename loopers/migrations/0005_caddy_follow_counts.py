@@ -0,0 +1,38 @@
+# Generated by Django 5.0.1 on 2026-10-17 16:26
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def backfill_follow_counts(apps, schema_editor):
+    Caddy = apps.get_model("loopers", "Caddy")
+    Follow = Caddy.friends.through
+
+    following = Follow.objects.order_by().values("from_caddy_id").annotate(total=Count("id"))
+    for row in following:
+        Caddy.objects.filter(id=row["from_caddy_id"]).update(following_count=row["total"])
+
+    followers = Follow.objects.order_by().values("to_caddy_id").annotate(total=Count("id"))
+    for row in followers:
+        Caddy.objects.filter(id=row["to_caddy_id"]).update(follower_count=row["total"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loopers', '0004_loop_caddy_date_id_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='caddy',
+            name='follower_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='caddy',
+            name='following_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_follow_counts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.0.1 on 2026-10-17 17:29
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+FEED_SIZE = 200
+
+
+def backfill_feeds(apps, schema_editor):
+    Caddy = apps.get_model("loopers", "Caddy")
+    Loop = apps.get_model("loopers", "Loop")
+    FeedEntry = apps.get_model("loopers", "FeedEntry")
+
+    for caddy in Caddy.objects.filter(user__isnull=False, following_count__gt=0):
+        followed = caddy.friends.filter(user__isnull=False).values("user_id")
+        loops = (
+            Loop.objects.filter(caddy_id__in=followed)
+            .order_by("-date", "-id")
+            .values_list("id", "date")[:FEED_SIZE]
+        )
+        FeedEntry.objects.bulk_create(
+            FeedEntry(user_id=caddy.user_id, loop_id=loop_id, date=date) for loop_id, date in loops
+        )
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loopers', '0005_caddy_follow_counts'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FeedEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('loop', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='feed_entries', to='loopers.loop')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='feed_entries', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name_plural': 'feed entries',
+                'ordering': ['-date', '-id'],
+                'indexes': [models.Index(fields=['user', 'date', 'id'], name='feed_user_date_id_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='feedentry',
+            constraint=models.UniqueConstraint(fields=('user', 'loop'), name='unique_feed_user_loop'),
+        ),
+        migrations.RunPython(backfill_feeds, migrations.RunPython.noop),
+    ]
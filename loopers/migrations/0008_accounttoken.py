@@ -0,0 +1,63 @@
+# Generated by Django 5.0.1 on 2026-10-17 17:42
+
+import datetime
+import hashlib
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def copy_pending_keys(apps, schema_editor):
+    # the old keys went out in emails as they were stored, so hashing them
+    # the same way helpers.use_token hashes a clicked key keeps the links valid
+    Caddy = apps.get_model("loopers", "Caddy")
+    AccountToken = apps.get_model("loopers", "AccountToken")
+
+    def token(caddy, key, purpose, ttl):
+        return AccountToken(
+            user_id=caddy.user_id,
+            purpose=purpose,
+            key_hash=hashlib.sha256(key.encode("utf-8")).hexdigest(),
+            expires_at=timezone.now() + ttl,
+        )
+
+    tokens = []
+    seen = set()
+    pending = Caddy.objects.filter(user__isnull=False, email_validated=False)
+    for caddy in pending.select_related("user"):
+        if not caddy.user.is_active and caddy.activation_key not in ("", "1"):
+            key, purpose, ttl = caddy.activation_key, "activation", datetime.timedelta(days=7)
+        elif caddy.change_email and caddy.change_email_key not in (None, "", "1"):
+            key, purpose, ttl = caddy.change_email_key, "change_email", datetime.timedelta(days=2)
+        else:
+            continue
+        if key not in seen:
+            seen.add(key)
+            tokens.append(token(caddy, key, purpose, ttl))
+    AccountToken.objects.bulk_create(tokens, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loopers', '0007_outgoingemail'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AccountToken',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('purpose', models.CharField(choices=[('activation', 'Account activation'), ('change_email', 'Email change')], max_length=20)),
+                ('key_hash', models.CharField(max_length=64, unique=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('expires_at', models.DateTimeField(db_index=True)),
+                ('used_at', models.DateTimeField(blank=True, null=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tokens', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.RunPython(copy_pending_keys, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,72 @@
+# Generated by Django 5.0.1 on 2026-10-17 17:55
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncMonth, TruncWeek
+
+
+def backfill_period_stats(apps, schema_editor):
+    Loop = apps.get_model("loopers", "Loop")
+    PeriodStats = apps.get_model("loopers", "PeriodStats")
+
+    loops = Loop.objects.order_by()
+    for period, trunc in (("week", TruncWeek), ("month", TruncMonth)):
+        rows = (
+            loops.annotate(start=trunc("date"))
+            .values("caddy", "start")
+            .annotate(total_loops=Sum("num_loops"), total_money=Sum("money"), entry_count=Count("id"))
+        )
+        PeriodStats.objects.bulk_create(
+            (PeriodStats(user_id=row.pop("caddy"), period=period, **row) for row in rows),
+            batch_size=500,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loopers', '0008_accounttoken'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PeriodStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('week', 'Week'), ('month', 'Month')], max_length=5)),
+                ('start', models.DateField()),
+                ('total_loops', models.IntegerField(default=0)),
+                ('total_money', models.IntegerField(default=0)),
+                ('entry_count', models.IntegerField(default=0)),
+            ],
+            options={
+                'verbose_name_plural': 'period stats',
+            },
+        ),
+        migrations.AlterField(
+            model_name='caddy',
+            name='loop_count',
+            field=models.IntegerField(db_index=True, default=0),
+        ),
+        migrations.AddIndex(
+            model_name='seasonstats',
+            index=models.Index(fields=['season', '-total_loops'], name='seasonstats_board_idx'),
+        ),
+        migrations.AddField(
+            model_name='periodstats',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='period_stats', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='periodstats',
+            index=models.Index(fields=['period', 'start', '-total_loops'], name='periodstats_board_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='periodstats',
+            constraint=models.UniqueConstraint(fields=('user', 'period', 'start'), name='unique_user_period'),
+        ),
+        migrations.RunPython(backfill_period_stats, migrations.RunPython.noop),
+    ]
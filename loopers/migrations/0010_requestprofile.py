@@ -0,0 +1,34 @@
+# Generated by Django 5.0.1 on 2026-10-17 18:54
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loopers', '0009_periodstats_leaderboard_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RequestProfile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('path', models.CharField(max_length=255)),
+                ('view_name', models.CharField(blank=True, max_length=100)),
+                ('method', models.CharField(max_length=10)),
+                ('status_code', models.IntegerField()),
+                ('duration_ms', models.FloatField()),
+                ('query_count', models.IntegerField(default=0)),
+                ('db_ms', models.FloatField(default=0)),
+                ('hot_functions', models.TextField(blank=True)),
+                ('allocations', models.TextField(blank=True)),
+                ('sql', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
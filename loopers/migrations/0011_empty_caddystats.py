@@ -0,0 +1,31 @@
+# Generated by Django 5.0.1 on 2026-10-17 20:40
+
+from django.db import migrations
+from django.db.models import Exists, OuterRef
+
+
+def create_empty_stats(apps, schema_editor):
+    # 0003 only backfilled caddies that had loops. the rest get an empty
+    # rollup like registration now creates, so nobody builds one on a request
+    Caddy = apps.get_model("loopers", "Caddy")
+    CaddyStats = apps.get_model("loopers", "CaddyStats")
+    Loop = apps.get_model("loopers", "Loop")
+
+    user_ids = (
+        Caddy.objects.filter(user__isnull=False)
+        .exclude(Exists(CaddyStats.objects.filter(user_id=OuterRef("user_id"))))
+        .exclude(Exists(Loop.objects.filter(caddy_id=OuterRef("user_id"))))
+        .values_list("user_id", flat=True)
+    )
+    CaddyStats.objects.bulk_create((CaddyStats(user_id=user_id) for user_id in user_ids), batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loopers', '0010_requestprofile'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_empty_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.0.1 on 2026-10-17 21:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loopers', '0011_empty_caddystats'),
+    ]
+
+    operations = [
+        # loopers_caddy_friends already exists as Caddy.friends' auto-created
+        # table, this only tells the state about it
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.CreateModel(
+                    name='Follow',
+                    fields=[
+                        ('id', models.AutoField(primary_key=True, serialize=False)),
+                        ('from_caddy', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='loopers.caddy')),
+                        ('to_caddy', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='loopers.caddy')),
+                    ],
+                    options={
+                        'db_table': 'loopers_caddy_friends',
+                        'unique_together': {('from_caddy', 'to_caddy')},
+                    },
+                ),
+                migrations.AlterField(
+                    model_name='caddy',
+                    name='friends',
+                    field=models.ManyToManyField(blank=True, through='loopers.Follow', to='loopers.caddy'),
+                ),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='follow',
+            index=models.Index(fields=['to_caddy', 'from_caddy'], name='follow_to_from_idx'),
+        ),
+    ]
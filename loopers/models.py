@@ -2,6 +2,7 @@ import datetime
 
 from django.db import models
 from django.urls import reverse
+from django.utils import timezone
 
 from django.core.exceptions import ValidationError
 from django.contrib.auth.models import User
@@ -12,22 +13,46 @@ class Caddy(models.Model):
     # SET_NULL: the reference to a user will be null
     user = models.OneToOneField(User, null=True, blank=True, on_delete=models.CASCADE)
 
+    # superseded by AccountToken, no longer read or written. migration 0008
+    # copied outstanding keys over so links already sent keep working
     activation_key = models.CharField(max_length=255, default=1)
     email_validated = models.BooleanField(default=False)
-    loop_count = models.IntegerField(default=0)
+    # indexed for the leaderboards in loopers.leaderboard
+    loop_count = models.IntegerField(default=0, db_index=True)
 
     # this field is used for when a caddy wants to change their email
     # save the 'new' email here, then once its verified, set the email field
     # in their user object to it
     change_email = models.EmailField(max_length=254, null=True, blank=True)
+    # superseded by AccountToken like activation_key
     change_email_key = models.CharField(max_length=255, null=True, blank=True, default=1)
 
-    friends = models.ManyToManyField("Caddy", symmetrical=False, blank=True)
+    friends = models.ManyToManyField("Caddy", symmetrical=False, blank=True, through="Follow")
+
+    # denormalized sizes of both sides of the friends graph, kept in sync by
+    # the m2m_changed handler in loopers.signals
+    follower_count = models.IntegerField(default=0)
+    following_count = models.IntegerField(default=0)
 
     def __str__(self):
         return self.user.username
 
 
+class Follow(models.Model):
+    # the table Django made for Caddy.friends, spelled out for its indexes
+    id = models.AutoField(primary_key=True)
+    from_caddy = models.ForeignKey(Caddy, on_delete=models.CASCADE, related_name="+")
+    to_caddy = models.ForeignKey(Caddy, on_delete=models.CASCADE, related_name="+")
+
+    class Meta:
+        db_table = "loopers_caddy_friends"
+        unique_together = [("from_caddy", "to_caddy")]
+        indexes = [
+            # a caddy's followers newest first, see the followers view
+            models.Index(fields=["to_caddy", "from_caddy"], name="follow_to_from_idx"),
+        ]
+
+
 def no_future_loop_date(value):
     today = datetime.date.today()
     if value > today:
@@ -49,10 +74,175 @@ class Loop(models.Model):
     caddy = models.ForeignKey(User, on_delete=models.CASCADE)
 
     class Meta:
-        ordering = ["-date"]
+        ordering = ["-date", "-id"]
+        indexes = [
+            # covers a caddy's loops newest first and the keyset pagination on it
+            models.Index(fields=["caddy", "date", "id"], name="loop_caddy_date_id_idx"),
+        ]
 
     def __str__(self):
         return self.loop_title
 
     def get_absolute_url(self):
         return reverse("loopers:loop-detail", kwargs={"pk": self.pk})
+
+
+class CaddyStats(models.Model):
+    # running totals for a caddy's loops so the dashboard reads one row
+    # instead of summing every loop. kept up to date by loopers.stats
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name="stats")
+
+    total_loops = models.IntegerField(default=0)
+    total_money = models.IntegerField(default=0)
+    entry_count = models.IntegerField(default=0)
+    first_loop_date = models.DateField(null=True, blank=True)
+    last_loop_date = models.DateField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name_plural = "caddy stats"
+
+    def __str__(self):
+        return f"{self.user.username} stats"
+
+
+class SeasonStats(models.Model):
+    # same totals as CaddyStats but split by season (calendar year)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="season_stats")
+    season = models.PositiveSmallIntegerField()
+
+    total_loops = models.IntegerField(default=0)
+    total_money = models.IntegerField(default=0)
+    entry_count = models.IntegerField(default=0)
+
+    class Meta:
+        ordering = ["-season"]
+        verbose_name_plural = "season stats"
+        constraints = [
+            models.UniqueConstraint(fields=["user", "season"], name="unique_user_season"),
+        ]
+        indexes = [
+            models.Index(fields=["season", "-total_loops"], name="seasonstats_board_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} {self.season}"
+
+
+class PeriodStats(models.Model):
+    # same totals again per week (starting monday) and per month, only kept
+    # for the leaderboards
+    WEEK = "week"
+    MONTH = "month"
+    PERIOD_CHOICES = [(WEEK, "Week"), (MONTH, "Month")]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="period_stats")
+    period = models.CharField(max_length=5, choices=PERIOD_CHOICES)
+    start = models.DateField()
+
+    total_loops = models.IntegerField(default=0)
+    total_money = models.IntegerField(default=0)
+    entry_count = models.IntegerField(default=0)
+
+    class Meta:
+        verbose_name_plural = "period stats"
+        constraints = [
+            models.UniqueConstraint(fields=["user", "period", "start"], name="unique_user_period"),
+        ]
+        indexes = [
+            models.Index(fields=["period", "start", "-total_loops"], name="periodstats_board_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} {self.period} of {self.start}"
+
+
+class FeedEntry(models.Model):
+    # one row per (follower, loop) so reading a feed is a range scan over
+    # the follower's own rows. written on new_loop and trimmed to
+    # loopers.feed.FEED_SIZE per user by the send_outbox worker, see loopers.feed
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="feed_entries")
+    loop = models.ForeignKey(Loop, on_delete=models.CASCADE, related_name="feed_entries")
+    # copy of loop.date so the timeline can be ordered without joining Loop
+    date = models.DateField()
+
+    class Meta:
+        ordering = ["-date", "-id"]
+        verbose_name_plural = "feed entries"
+        indexes = [
+            models.Index(fields=["user", "date", "id"], name="feed_user_date_id_idx"),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=["user", "loop"], name="unique_feed_user_loop"),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username}: {self.loop.loop_title}"
+
+
+class OutgoingEmail(models.Model):
+    # emails are queued here by the request and sent later by the
+    # send_outbox command, see loopers.outbox
+    PENDING = "pending"
+    SENT = "sent"
+    FAILED = "failed"
+    STATUS_CHOICES = [(PENDING, "Pending"), (SENT, "Sent"), (FAILED, "Failed")]
+
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    from_email = models.CharField(max_length=255, null=True, blank=True)
+    to = models.EmailField(max_length=254)
+
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.IntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # the worker's "what is due" query
+            models.Index(fields=["status", "next_attempt_at"], name="outbox_status_due_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.subject} to {self.to}"
+
+
+class AccountToken(models.Model):
+    # single use keys sent out by email. only a sha256 of the key is stored,
+    # see helpers.generate_activation_key and helpers.use_token
+    ACTIVATION = "activation"
+    CHANGE_EMAIL = "change_email"
+    PURPOSE_CHOICES = [(ACTIVATION, "Account activation"), (CHANGE_EMAIL, "Email change")]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="tokens")
+    purpose = models.CharField(max_length=20, choices=PURPOSE_CHOICES)
+    key_hash = models.CharField(max_length=64, unique=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+    used_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.user.username} {self.purpose}"
+
+
+class RequestProfile(models.Model):
+    # what loopers.profiler found in one profiled request, browsed in the
+    # admin. only the newest profiler.KEEP are kept
+    user = models.ForeignKey(User, null=True, blank=True, on_delete=models.SET_NULL)
+    path = models.CharField(max_length=255)
+    view_name = models.CharField(max_length=100, blank=True)
+    method = models.CharField(max_length=10)
+    status_code = models.IntegerField()
+    duration_ms = models.FloatField()
+    query_count = models.IntegerField(default=0)
+    db_ms = models.FloatField(default=0)
+    hot_functions = models.TextField(blank=True)
+    allocations = models.TextField(blank=True)
+    sql = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.method} {self.path} {self.duration_ms:.0f} ms"
@@ -0,0 +1,105 @@
+import datetime
+import logging
+import time
+
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import metrics
+from .models import OutgoingEmail
+
+logger = logging.getLogger(__name__)
+
+# emails sent over one SMTP connection before it's closed
+BATCH_SIZE = 50
+MAX_ATTEMPTS = 5
+# first retry waits this long, doubling after every failed attempt
+RETRY_DELAY = datetime.timedelta(minutes=1)
+MAX_RETRY_DELAY = datetime.timedelta(hours=1)
+
+
+def queue_mail(subject, message, from_email, recipient_list):
+    """Drop in for send_mail that only writes the emails to the outbox."""
+    OutgoingEmail.objects.bulk_create(
+        OutgoingEmail(subject=subject, body=message, from_email=from_email, to=to)
+        for to in recipient_list
+    )
+
+
+def retry_delay(attempts):
+    return min(RETRY_DELAY * 2 ** (attempts - 1), MAX_RETRY_DELAY)
+
+
+def _failed(email, error):
+    metrics.registry.inc("email_failures_total")
+    email.attempts += 1
+    email.last_error = str(error)
+    if email.attempts >= MAX_ATTEMPTS:
+        email.status = OutgoingEmail.FAILED
+        logger.error("Giving up on outbox email %s: %s", email.pk, error)
+    else:
+        email.next_attempt_at = timezone.now() + retry_delay(email.attempts)
+    email.save(update_fields=["attempts", "last_error", "status", "next_attempt_at"])
+
+
+def send_pending(batch_size=BATCH_SIZE):
+    """
+    Send up to ``batch_size`` due emails over a single connection and return
+    how many were picked up. The rows stay locked while they're sent so two
+    workers never send the same email.
+    """
+    with transaction.atomic():
+        batch = list(
+            OutgoingEmail.objects.select_for_update(skip_locked=True)
+            .filter(status=OutgoingEmail.PENDING, next_attempt_at__lte=timezone.now())
+            .order_by("next_attempt_at", "id")[:batch_size]
+        )
+        if not batch:
+            return 0
+
+        connection = get_connection(fail_silently=False)
+        try:
+            connection.open()
+        except Exception as e:
+            logger.exception("Could not open mail connection")
+            for email in batch:
+                _failed(email, e)
+            metrics.registry.flush()
+            return len(batch)
+
+        sent = []
+        try:
+            for email in batch:
+                message = EmailMessage(
+                    email.subject, email.body, email.from_email, [email.to], connection=connection
+                )
+                start = time.perf_counter()
+                try:
+                    message.send()
+                except Exception as e:
+                    logger.exception("Send email failure")
+                    _failed(email, e)
+                else:
+                    sent.append(email.pk)
+                metrics.registry.observe("email_send_duration_seconds", time.perf_counter() - start)
+        finally:
+            connection.close()
+
+        OutgoingEmail.objects.filter(pk__in=sent).update(
+            status=OutgoingEmail.SENT, sent_at=timezone.now(), attempts=F("attempts") + 1
+        )
+    metrics.registry.inc("emails_sent_total", amount=len(sent))
+    metrics.registry.flush()
+    return len(batch)
+
+
+def drain(batch_size=BATCH_SIZE):
+    """Keep sending batches until nothing is due, returns the number picked up."""
+    total = 0
+    while True:
+        count = send_pending(batch_size)
+        total += count
+        if count < batch_size:
+            return total
@@ -0,0 +1,85 @@
+import base64
+import json
+
+from django.core.paginator import InvalidPage
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+
+
+class KeysetPage:
+    def __init__(self, object_list, next_cursor, is_first):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.is_first = is_first
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return not self.is_first
+
+
+class KeysetPaginator:
+    """
+    Cursor based paginator. Instead of OFFSET and a COUNT(*) it remembers the
+    ordering values of the last row on the page and starts the next page right
+    after them, so every page is an index range scan no matter how deep it is.
+
+    ``ordering`` must end in a unique field (usually the pk) so rows sharing
+    the other values still have a stable position. Only descending orderings
+    are supported since that's what every list in the app uses.
+    """
+
+    def __init__(self, object_list, per_page, ordering=("-date", "-id")):
+        self.object_list = object_list
+        self.per_page = per_page
+        self.ordering = ordering
+        self.fields = [o.lstrip("-") for o in ordering]
+        if any(not o.startswith("-") for o in ordering):
+            raise ValueError("KeysetPaginator only supports descending orderings")
+
+    def encode_cursor(self, obj):
+        values = [getattr(obj, field) for field in self.fields]
+        data = json.dumps(values, cls=DjangoJSONEncoder).encode("utf-8")
+        return base64.urlsafe_b64encode(data).decode("ascii").rstrip("=")
+
+    def decode_cursor(self, cursor):
+        try:
+            padded = cursor + "=" * (-len(cursor) % 4)
+            values = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+            if len(values) != len(self.fields):
+                raise ValueError
+            model = self.object_list.model
+            return [
+                model._meta.get_field(field).to_python(value)
+                for field, value in zip(self.fields, values)
+            ]
+        except Exception:
+            raise InvalidPage("Invalid cursor")
+
+    def _after(self, values):
+        # (a, b) < (x, y) written as a <= x AND (a < x OR (a = x AND b < y)) so
+        # the leading column still gives the database an index range to scan
+        condition = Q(**{f"{self.fields[-1]}__lt": values[-1]})
+        for field, value in zip(reversed(self.fields[:-1]), reversed(values[:-1])):
+            condition = Q(**{f"{field}__lt": value}) | (Q(**{field: value}) & condition)
+        return Q(**{f"{self.fields[0]}__lte": values[0]}) & condition
+
+    def page(self, cursor=None):
+        queryset = self.object_list.order_by(*self.ordering)
+        if cursor:
+            queryset = queryset.filter(self._after(self.decode_cursor(cursor)))
+
+        # one extra row tells us whether there's a next page without counting
+        rows = list(queryset[: self.per_page + 1])
+        next_cursor = None
+        if len(rows) > self.per_page:
+            rows = rows[: self.per_page]
+            next_cursor = self.encode_cursor(rows[-1])
+        return KeysetPage(rows, next_cursor, is_first=not cursor)
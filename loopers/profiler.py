@@ -0,0 +1,187 @@
+import linecache
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+
+from django.core import signing
+
+from .models import RequestProfile
+
+# ?profile=1 for staff, ?profile=<signed_flag(user)> for anyone else
+PARAM = "profile"
+SALT = "loopers.profiler"
+# how long a link from signed_flag works
+FLAG_MAX_AGE = 60 * 60 * 24
+# seconds between samples of the request's stack
+INTERVAL = 0.005
+# frames kept per traceback, more costs more while allocating
+TRACEMALLOC_FRAMES = 10
+TOP = 25
+# profiles kept, the oldest go first
+KEEP = 200
+
+
+def signed_flag(user):
+    """A ``profile`` value that turns profiling on for ``user``'s requests, see wants_profile."""
+    return signing.dumps(user.pk, salt=SALT)
+
+
+def wants_profile(request):
+    """
+    Whether to profile ``request``. The parameter is checked first so that
+    every other request skips the session and user lookups.
+    """
+    flag = request.GET.get(PARAM)
+    if not flag:
+        return False
+    user = getattr(request, "user", None)
+    if user is None or not user.is_authenticated:
+        return False
+    if user.is_staff and flag == "1":
+        return True
+    try:
+        return signing.loads(flag, salt=SALT, max_age=FLAG_MAX_AGE) == user.pk
+    except signing.BadSignature:
+        return False
+
+
+def _describe(code, lineno):
+    return f"{code.co_name} ({os.path.relpath(code.co_filename)}:{lineno})"
+
+
+class Sampler:
+    """
+    Samples the stack of one thread from a background thread every
+    INTERVAL seconds. ``own`` counts the function that was running,
+    ``total`` every function on the stack.
+    """
+
+    def __init__(self, thread_id, interval=INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.own = Counter()
+        self.total = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="loopers-profiler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.sample(frame)
+
+    def sample(self, frame):
+        self.samples += 1
+        self.own[_describe(frame.f_code, frame.f_lineno)] += 1
+        seen = set()
+        while frame is not None:
+            # a recursive function counts once per sample
+            name = _describe(frame.f_code, frame.f_code.co_firstlineno)
+            if name not in seen:
+                seen.add(name)
+                self.total[name] += 1
+            frame = frame.f_back
+
+
+def hot_functions(sampler, interval=INTERVAL):
+    lines = [f"{sampler.samples} samples every {interval * 1000:g} ms", "", "own time:"]
+    for name, count in sampler.own.most_common(TOP):
+        lines.append(f"  {count * interval * 1000:8.1f} ms  {count:5d}  {name}")
+    lines += ["", "including callees:"]
+    for name, count in sampler.total.most_common(TOP):
+        lines.append(f"  {count * interval * 1000:8.1f} ms  {count:5d}  {name}")
+    return "\n".join(lines)
+
+
+def allocation_sites(snapshot):
+    snapshot = snapshot.filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, __file__),
+    ))
+    stats = snapshot.statistics("lineno")
+    lines = [f"{sum(stat.size for stat in stats) / 1024:.1f} KiB still allocated at the end of the request", ""]
+    for stat in stats[:TOP]:
+        frame = stat.traceback[0]
+        source = linecache.getline(frame.filename, frame.lineno).strip()
+        lines.append(f"  {stat.size / 1024:8.1f} KiB  {stat.count:6d} blocks  {os.path.relpath(frame.filename)}:{frame.lineno}")
+        if source:
+            lines.append(f"      {source}")
+    return "\n".join(lines)
+
+
+def sql_summary(recorder):
+    """The queries ``recorder`` saw, slowest first."""
+    if recorder is None:
+        return ""
+    lines = [f"{recorder.count} queries, {recorder.duration * 1000:.2f} ms", ""]
+    for sql, seconds in recorder.times.most_common(TOP):
+        lines.append(f"  {seconds * 1000:8.2f} ms  x{recorder.fingerprints[sql]}  {sql}")
+    return "\n".join(lines)
+
+
+# tracemalloc is process wide, it runs while any profiled request does
+_tracing_lock = threading.Lock()
+_tracing = 0
+
+
+class Profile:
+    """
+    Context manager running the sampler and tracemalloc around the current
+    thread's work. Allocations made by other threads at the same time show
+    up in the snapshot too.
+    """
+
+    def __enter__(self):
+        global _tracing
+        with _tracing_lock:
+            if not _tracing:
+                tracemalloc.start(TRACEMALLOC_FRAMES)
+            _tracing += 1
+        self.sampler = Sampler(threading.get_ident())
+        self.start = time.perf_counter()
+        self.sampler.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        global _tracing
+        self.sampler.stop()
+        self.duration = time.perf_counter() - self.start
+        with _tracing_lock:
+            self.snapshot = tracemalloc.take_snapshot()
+            _tracing -= 1
+            if not _tracing:
+                tracemalloc.stop()
+
+
+def store(request, response, profile):
+    """Save ``profile`` of ``request`` and drop the ones past KEEP."""
+    recorder = getattr(request, "sql_queries", None)
+    match = request.resolver_match
+    stored = RequestProfile.objects.create(
+        user=request.user if request.user.is_authenticated else None,
+        path=request.get_full_path()[:255],
+        view_name=match.view_name if match else "",
+        method=request.method,
+        status_code=response.status_code,
+        duration_ms=profile.duration * 1000,
+        query_count=recorder.count if recorder else 0,
+        db_ms=recorder.duration * 1000 if recorder else 0,
+        hot_functions=hot_functions(profile.sampler),
+        allocations=allocation_sites(profile.snapshot),
+        sql=sql_summary(recorder),
+    )
+    oldest_kept = RequestProfile.objects.order_by("-id").values_list("id", flat=True)[KEEP - 1:KEEP].first()
+    if oldest_kept is not None:
+        RequestProfile.objects.filter(id__lt=oldest_kept).delete()
+    return stored
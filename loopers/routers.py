@@ -0,0 +1,100 @@
+import contextlib
+import contextvars
+import functools
+
+from django.conf import settings
+
+REPLICA = "replica"
+# set on a browser after it writes so it reads its own writes from the primary
+PIN_COOKIE = "pin_primary"
+
+_use_replica = contextvars.ContextVar("use_replica", default=False)
+_pinned = contextvars.ContextVar("pinned", default=False)
+_wrote = contextvars.ContextVar("wrote", default=False)
+
+
+def replica_configured():
+    return REPLICA in settings.DATABASES
+
+
+class ReplicaRouter:
+    """
+    Sends reads of loopers models to the "replica" database while a view
+    wrapped in replica_reads runs. Everything else, including sessions and
+    auth, stays on "default". Does nothing unless a replica is configured.
+    """
+
+    def db_for_read(self, model, **hints):
+        if (
+            _use_replica.get()
+            and not _pinned.get()
+            and model._meta.app_label == "loopers"
+            and replica_configured()
+        ):
+            return REPLICA
+        return None
+
+    def db_for_write(self, model, **hints):
+        _wrote.set(True)
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # same data on both sides
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # the replica gets its schema from replication
+        return db != REPLICA
+
+
+@contextlib.contextmanager
+def replica_reads():
+    token = _use_replica.set(True)
+    try:
+        yield
+    finally:
+        _use_replica.reset(token)
+
+
+@contextlib.contextmanager
+def primary_reads():
+    """Read from the primary even inside a replica view, for data that gets cached."""
+    token = _use_replica.set(False)
+    try:
+        yield
+    finally:
+        _use_replica.reset(token)
+
+
+def replica_view(view):
+    """
+    Let GET and HEAD requests to ``view`` read from the replica. Template
+    responses are rendered inside so the lazy querysets they evaluate are
+    routed too.
+    """
+
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if request.method not in ("GET", "HEAD"):
+            return view(request, *args, **kwargs)
+        with replica_reads():
+            response = view(request, *args, **kwargs)
+            if hasattr(response, "render") and not response.is_rendered:
+                response.render()
+        return response
+
+    return wrapper
+
+
+def start_request(pinned):
+    """Reset the per-request state, returning tokens for finish_request."""
+    return _pinned.set(pinned), _wrote.set(False)
+
+
+def finish_request(tokens):
+    """Undo start_request and return whether the request wrote anything."""
+    wrote = _wrote.get()
+    pinned_token, wrote_token = tokens
+    _wrote.reset(wrote_token)
+    _pinned.reset(pinned_token)
+    return wrote
@@ -0,0 +1,144 @@
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Count, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from . import autocomplete, dashboard, feed
+from .graph import graph
+from .models import Caddy, Loop
+
+
+def _count_subquery(column):
+    Follow = Caddy.friends.through
+    counts = (
+        Follow.objects.filter(**{column: OuterRef("pk")})
+        .order_by()
+        .values(column)
+        .annotate(total=Count("id"))
+        .values("total")
+    )
+    return Coalesce(Subquery(counts), 0)
+
+
+def recount_follows(caddy_ids):
+    """Recompute follower/following counts for the given caddies in one UPDATE."""
+    Caddy.objects.filter(id__in=caddy_ids).update(
+        follower_count=_count_subquery("to_caddy_id"),
+        following_count=_count_subquery("from_caddy_id"),
+    )
+
+
+@receiver(m2m_changed, sender=Caddy.friends.through)
+def update_follow_counts(sender, instance, action, reverse, model, pk_set, **kwargs):
+    if action == "pre_clear":
+        # remember who was on the other side so post_clear can recount them
+        column = "to_caddy_id" if reverse else "from_caddy_id"
+        other = "from_caddy_id" if reverse else "to_caddy_id"
+        instance._cleared_follow_ids = set(
+            sender.objects.filter(**{column: instance.pk}).values_list(other, flat=True)
+        )
+        return
+
+    if action in ("post_add", "post_remove"):
+        affected = set(pk_set or ())
+    elif action == "post_clear":
+        affected = getattr(instance, "_cleared_follow_ids", set())
+    else:
+        return
+
+    # recounting instead of +/- 1 keeps the counts right even when remove() is
+    # handed ids that weren't actually followed
+    recount_follows(affected | {instance.pk})
+
+
+@receiver(pre_delete, sender=Caddy)
+def remember_follows(sender, instance, **kwargs):
+    # the cascade deletes the friends rows without m2m_changed, note both
+    # sides while they're still there
+    rows = Caddy.friends.through.objects.filter(
+        Q(from_caddy_id=instance.pk) | Q(to_caddy_id=instance.pk)
+    ).values_list("from_caddy_id", "to_caddy_id", "from_caddy__user_id")
+    instance._followers, instance._followed, instance._follower_user_ids = set(), set(), set()
+    for from_id, to_id, from_user_id in rows:
+        if to_id == instance.pk:
+            instance._followers.add(from_id)
+            if from_user_id is not None:
+                instance._follower_user_ids.add(from_user_id)
+        if from_id == instance.pk:
+            instance._followed.add(to_id)
+
+
+@receiver(post_delete, sender=Caddy)
+def caddy_deleted(sender, instance, **kwargs):
+    # the pk is cleared once the delete finishes, before the commit
+    caddy_id = instance.pk
+    followers = getattr(instance, "_followers", set()) - {caddy_id}
+    followed = getattr(instance, "_followed", set()) - {caddy_id}
+    if followers | followed:
+        recount_follows(followers | followed)
+    # the caddy is on their followers' dashboards and friends boards, and
+    # in the graph the suggestions come from
+    dashboard.invalidate(getattr(instance, "_follower_user_ids", set()))
+
+    def unlink():
+        graph.follows_changed(followers, {caddy_id}, added=False)
+        graph.follows_changed({caddy_id}, followed, added=False)
+
+    transaction.on_commit(unlink)
+
+
+@receiver(m2m_changed, sender=Caddy.friends.through)
+def update_feeds_graph_and_dashboards(sender, instance, action, reverse, model, pk_set, **kwargs):
+    if action in ("post_add", "post_remove"):
+        others = set(pk_set or ())
+    elif action == "post_clear":
+        # filled in by update_follow_counts on pre_clear
+        others = getattr(instance, "_cleared_follow_ids", set())
+    else:
+        return
+
+    if reverse:
+        followers, followed = others, {instance.pk}
+    else:
+        followers, followed = {instance.pk}, others
+    feed.follows_changed(followers, followed, added=action == "post_add")
+    # after commit so a rolled back follow never reaches the in-memory graph
+    transaction.on_commit(
+        lambda: graph.follows_changed(followers, followed, added=action == "post_add")
+    )
+    dashboard.invalidate(
+        Caddy.objects.filter(id__in=followers, user__isnull=False).values_list("user_id", flat=True)
+    )
+
+
+@receiver(post_save, sender=Loop)
+def loop_saved(sender, instance, **kwargs):
+    dashboard.invalidate_caddy(instance.caddy_id)
+
+
+@receiver(post_delete, sender=Loop)
+def loop_deleted(sender, instance, origin=None, **kwargs):
+    # deleting an account cascades to every loop, the dashboard goes with it
+    if isinstance(origin, Loop):
+        dashboard.invalidate_caddy(instance.caddy_id)
+
+
+@receiver(post_save, sender=User)
+def index_username(sender, instance, update_fields=None, **kwargs):
+    # logging in saves last_login, which happens far too often to look the caddy up
+    if update_fields and set(update_fields) <= {"last_login"}:
+        return
+    autocomplete.user_changed(instance)
+
+
+@receiver(post_save, sender=Caddy)
+def index_new_caddy(sender, instance, created, **kwargs):
+    if created and instance.user_id:
+        autocomplete.user_changed(instance.user)
+
+
+@receiver(post_delete, sender=User)
+def unindex_username(sender, instance, **kwargs):
+    autocomplete.user_deleted(instance.id)
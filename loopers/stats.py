@@ -0,0 +1,185 @@
+import datetime
+import functools
+import operator
+from collections import defaultdict
+
+from django.db.models import Case, Count, F, IntegerField, Max, Min, Q, Sum, Value, When
+from django.utils import timezone
+
+from .models import CaddyStats, Loop, PeriodStats, SeasonStats
+
+
+# rows matched by one UPDATE in _add_totals, keeps the statement well under
+# the databases' parameter limits
+BUCKETS_PER_QUERY = 100
+
+
+def period_start(period, date):
+    """First day of the week (monday) or month that ``date`` falls in."""
+    if period == PeriodStats.WEEK:
+        return date - datetime.timedelta(days=date.weekday())
+    return date.replace(day=1)
+
+
+def _buckets(seasons, periods, date):
+    """The season, week and month totals ``date`` counts towards."""
+    return [seasons[date.year]] + [
+        periods[(period, period_start(period, date))] for period in (PeriodStats.WEEK, PeriodStats.MONTH)
+    ]
+
+
+def rebuild_stats(user):
+    """
+    Recompute a caddy's rollup rows from scratch out of their loops. The
+    loops are read once, grouped by day, and the seasons, weeks and months
+    are added up from those, so the cost doesn't grow with the history.
+    """
+    # order_by() clears Loop's default ordering so it doesn't end up in the GROUP BY
+    days = (
+        Loop.objects.filter(caddy=user)
+        .order_by()
+        .values("date")
+        .annotate(total_loops=Sum("num_loops"), total_money=Sum("money"), entry_count=Count("id"))
+    )
+    seasons = defaultdict(lambda: [0, 0, 0])
+    periods = defaultdict(lambda: [0, 0, 0])
+    dates = []
+    for day in days:
+        dates.append(day["date"])
+        for bucket in _buckets(seasons, periods, day["date"]):
+            bucket[0] += day["total_loops"]
+            bucket[1] += day["total_money"]
+            bucket[2] += day["entry_count"]
+
+    stats, _ = CaddyStats.objects.update_or_create(
+        user=user,
+        defaults={
+            "total_loops": sum(s[0] for s in seasons.values()),
+            "total_money": sum(s[1] for s in seasons.values()),
+            "entry_count": sum(s[2] for s in seasons.values()),
+            "first_loop_date": min(dates, default=None),
+            "last_loop_date": max(dates, default=None),
+        },
+    )
+
+    SeasonStats.objects.filter(user=user).delete()
+    SeasonStats.objects.bulk_create(
+        SeasonStats(user=user, season=season, total_loops=loops, total_money=money, entry_count=entries)
+        for season, (loops, money, entries) in seasons.items()
+    )
+
+    PeriodStats.objects.filter(user=user).delete()
+    PeriodStats.objects.bulk_create(
+        PeriodStats(user=user, period=period, start=start, total_loops=loops, total_money=money, entry_count=entries)
+        for (period, start), (loops, money, entries) in periods.items()
+    )
+    return stats
+
+
+def get_stats(user):
+    """Return the caddy's rollup, building it first if they don't have one yet."""
+    stats = CaddyStats.objects.filter(user=user).first()
+    if stats is None:
+        stats = rebuild_stats(user)
+    return stats
+
+
+def loop_added(loop):
+    update_stats(loop.caddy, added=[loop])
+
+
+def loop_removed(loop):
+    update_stats(loop.caddy, removed=[loop])
+
+
+def loop_changed(old_loop, loop):
+    update_stats(loop.caddy, added=[loop], removed=[old_loop])
+
+
+def update_stats(user, added=(), removed=()):
+    """
+    Apply loops that were just added to or removed from the Loop table to the
+    caddy's rollup. Must be called inside a transaction after the loops have
+    been written so the row lock is held until the loop change commits.
+    """
+    stats = CaddyStats.objects.select_for_update().filter(user=user).first()
+    if stats is None:
+        # the table already includes this change, so a rebuild covers it
+        rebuild_stats(user)
+        return
+
+    seasons = defaultdict(lambda: [0, 0, 0])
+    periods = defaultdict(lambda: [0, 0, 0])
+    for loop, sign in [(l, 1) for l in added] + [(l, -1) for l in removed]:
+        for bucket in _buckets(seasons, periods, loop.date):
+            bucket[0] += sign * loop.num_loops
+            bucket[1] += sign * loop.money
+            bucket[2] += sign
+
+    # only go back to the table when a boundary date may have been removed,
+    # an edit that keeps the date leaves a loop on it
+    removed_dates = {loop.date for loop in removed} - {loop.date for loop in added}
+    if stats.first_loop_date in removed_dates or stats.last_loop_date in removed_dates:
+        bounds = Loop.objects.filter(caddy=user).aggregate(first=Min("date"), last=Max("date"))
+        first_loop_date, last_loop_date = bounds["first"], bounds["last"]
+    else:
+        dates = [loop.date for loop in added]
+        dates += [d for d in (stats.first_loop_date, stats.last_loop_date) if d]
+        first_loop_date = min(dates, default=None)
+        last_loop_date = max(dates, default=None)
+
+    CaddyStats.objects.filter(pk=stats.pk).update(
+        total_loops=F("total_loops") + sum(s[0] for s in seasons.values()),
+        total_money=F("total_money") + sum(s[1] for s in seasons.values()),
+        entry_count=F("entry_count") + sum(s[2] for s in seasons.values()),
+        first_loop_date=first_loop_date,
+        last_loop_date=last_loop_date,
+        updated_at=timezone.now(),
+    )
+
+    _add_totals(SeasonStats, user, ["season"], {(season,): totals for season, totals in seasons.items()})
+    _add_totals(PeriodStats, user, ["period", "start"], periods)
+
+    # only rows that lost an entry can have emptied
+    if any(totals[2] < 0 for totals in seasons.values()):
+        SeasonStats.objects.filter(user=user, entry_count__lte=0).delete()
+    if any(totals[2] < 0 for totals in periods.values()):
+        PeriodStats.objects.filter(user=user, entry_count__lte=0).delete()
+
+
+def _add_totals(model, user, key_fields, buckets):
+    """
+    Add ``buckets``, {key: [loops, money, entries]} with a key per row of
+    ``model``, to the caddy's rows. One UPDATE covers every row, and rows
+    that aren't there yet cost one SELECT and one INSERT more, so a whole
+    import batch costs what a single loop does.
+    """
+    buckets = {key: totals for key, totals in buckets.items() if any(totals)}
+    keys = list(buckets)
+    for i in range(0, len(keys), BUCKETS_PER_QUERY):
+        chunk = {key: buckets[key] for key in keys[i:i + BUCKETS_PER_QUERY]}
+        matches = {key: Q(**dict(zip(key_fields, key))) for key in chunk}
+        rows = model.objects.filter(functools.reduce(operator.or_, matches.values()), user=user)
+
+        def delta(column):
+            return Case(
+                *[When(matches[key], then=Value(totals[column])) for key, totals in chunk.items()],
+                default=Value(0),
+                output_field=IntegerField(),
+            )
+
+        updated = rows.update(
+            total_loops=F("total_loops") + delta(0),
+            total_money=F("total_money") + delta(1),
+            entry_count=F("entry_count") + delta(2),
+        )
+        if updated == len(chunk):
+            continue
+        # update_stats holds the CaddyStats row lock, so no one else adds
+        # this caddy's rows in between
+        existing = set(rows.values_list(*key_fields))
+        model.objects.bulk_create(
+            model(user=user, total_loops=loops, total_money=money, entry_count=entries, **dict(zip(key_fields, key)))
+            for key, (loops, money, entries) in chunk.items()
+            if key not in existing
+        )
@@ -0,0 +1,184 @@
+import datetime
+import io
+import json
+import os
+import tempfile
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.management import CommandError, call_command
+from django.http import QueryDict
+from django.test import TestCase
+from django.utils import timezone
+
+from loopers import graph, helpers, stats
+from loopers.management.commands import index_advisor
+from loopers.models import AccountToken, Caddy, FeedEntry, Follow, Loop, SeasonStats
+from loopers.tests.utils import url_names
+
+
+class PurgeTokensCommandTest(TestCase):
+    def setUp(self):
+        self.test_user = User.objects.create_user(
+            username="test_user", password="Stset01@", email="test2@test.com", is_active=False
+        )
+        Caddy.objects.create(user=self.test_user, email_validated=0)
+        helpers.generate_activation_key(self.test_user)
+
+    def test_purge_tokens(self):
+        other = User.objects.create_user(username="other", password="Stset01@")
+        Caddy.objects.create(user=other, email_validated=1)
+        helpers.generate_activation_key(other, AccountToken.CHANGE_EMAIL)
+        User.objects.filter(pk=self.test_user.pk).update(
+            date_joined=timezone.now() - datetime.timedelta(days=8)
+        )
+
+        # the activation link is still live so the account stays
+        call_command("purge_tokens", stdout=io.StringIO())
+        self.assertTrue(User.objects.filter(pk=self.test_user.pk).exists())
+
+        AccountToken.objects.filter(user=self.test_user).update(expires_at=timezone.now())
+        call_command("purge_tokens", stdout=io.StringIO())
+        self.assertFalse(User.objects.filter(pk=self.test_user.pk).exists())
+        self.assertEqual(list(AccountToken.objects.values_list("user", flat=True)), [other.pk])
+
+
+class BenchmarkCommandsTest(TestCase):
+    def test_seed_and_benchmark(self):
+        call_command("seed_data", caddies=8, loops=3, prefix="bench", stdout=io.StringIO())
+        self.assertEqual(Caddy.objects.filter(user__username__startswith="bench").count(), 8)
+        self.assertEqual(Loop.objects.count(), 24)
+        caddy = Caddy.objects.order_by("-following_count").first()
+        self.assertGreater(caddy.following_count, 0)
+        self.assertEqual(caddy.following_count, caddy.friends.count())
+        self.assertEqual(
+            caddy.loop_count, sum(loop.num_loops for loop in Loop.objects.filter(caddy=caddy.user))
+        )
+        self.assertTrue(FeedEntry.objects.filter(user=caddy.user).exists())
+
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        path = os.path.join(tmp.name, "bench.json")
+        call_command("benchmark_routes", runs=2, output=path, stdout=io.StringIO())
+        with open(path) as f:
+            results = json.load(f)
+        self.assertEqual(results["user"], caddy.user.username)
+        self.assertEqual(set(results["routes"]) | set(results["skipped"]), url_names("loopers"))
+        for name, row in results["routes"].items():
+            self.assertEqual(row["status"], 200, name)
+            self.assertLessEqual(row["p50_ms"], row["p99_ms"])
+
+        out = io.StringIO()
+        call_command("benchmark_routes", runs=1, compare=path, threshold=10000, stdout=out)
+        self.assertIn("No regressions", out.getvalue())
+
+    def test_seed_twice(self):
+        call_command("seed_data", caddies=4, loops=2, prefix="bench", stdout=io.StringIO())
+        # another prefix doesn't clash, and "benchmark" isn't one of the seeded names
+        User.objects.create_user(username="benchmark", password="Stset01@")
+        call_command("seed_data", caddies=4, loops=2, prefix="other", stdout=io.StringIO())
+        with self.assertRaisesMessage(CommandError, "pass --flush"):
+            call_command("seed_data", caddies=4, loops=2, prefix="bench", stdout=io.StringIO())
+
+        call_command("seed_data", caddies=3, loops=1, prefix="bench", flush=True, stdout=io.StringIO())
+        self.assertEqual(Caddy.objects.filter(user__username__regex=r"^bench[0-9]+$").count(), 3)
+        self.assertTrue(User.objects.filter(username="benchmark").exists())
+        self.assertEqual(Loop.objects.count(), 3 + 4 * 2)
+
+
+class IndexAdvisorTest(TestCase):
+    def test_flags_scan_and_suggests_index(self):
+        sql, params = Caddy.objects.filter(change_email="x@test.com").query.sql_with_params()
+        problems = index_advisor.explain("default", sql, params)
+        self.assertIn(("loopers_caddy", "scan", "SCAN loopers_caddy"), problems)
+
+        models_by_table = {"loopers_caddy": Caddy}
+        model, fields, reason = index_advisor.Command().suggest(models_by_table, sql, "loopers_caddy")
+        self.assertEqual((model, fields), (Caddy, ["change_email"]))
+
+        sql, params = Loop.objects.filter(caddy_id=1).query.sql_with_params()
+        self.assertEqual(index_advisor.explain("default", sql, params), [])
+
+    def test_parses_mysql_quoting(self):
+        sql = (
+            "SELECT `loopers_caddy`.`id` FROM `loopers_caddy` "
+            "INNER JOIN `loopers_caddy_friends` T3 ON (`loopers_caddy`.`id` = T3.`to_caddy_id`) "
+            "WHERE `loopers_caddy`.`change_email` = %s ORDER BY `loopers_caddy`.`loop_count` DESC LIMIT 3"
+        )
+        self.assertEqual(index_advisor.aliases(sql), {"T3": "loopers_caddy_friends"})
+        self.assertEqual(index_advisor.ordered_table(sql), "loopers_caddy")
+        self.assertEqual(index_advisor.wanted_columns(sql, "loopers_caddy"), (["change_email"], ["loop_count"]))
+        model, fields, reason = index_advisor.Command().suggest({"loopers_caddy": Caddy}, sql, "loopers_caddy")
+        self.assertEqual(fields, ["change_email", "loop_count"])
+
+    def test_unique_constraints_count_as_indexes(self):
+        self.assertIn(["user_id", "season"], index_advisor.existing_indexes(SeasonStats))
+        sql, params = SeasonStats.objects.filter(user_id=1, season=2024).query.sql_with_params()
+        model, fields, reason = index_advisor.Command().suggest(
+            {"loopers_seasonstats": SeasonStats}, sql, "loopers_seasonstats"
+        )
+        self.assertIsNone(fields)
+        self.assertIn("already indexed on (user_id, season)", reason)
+
+    def test_sort_on_joined_table(self):
+        # how the followers route used to read a page: filtered on the follow
+        # table, sorted on the caddy's id
+        caddy = Caddy.objects.create()
+        sql, params = Caddy.objects.filter(friends=caddy).order_by("-id").query.sql_with_params()
+        self.assertIn((None, "filesort", "USE TEMP B-TREE FOR ORDER BY"), index_advisor.explain("default", sql, params))
+        self.assertEqual(index_advisor.ordered_table(sql), "loopers_caddy")
+        models_by_table = {"loopers_caddy": Caddy, "loopers_caddy_friends": Follow}
+
+        model, fields, reason = index_advisor.Command().suggest(models_by_table, sql, "loopers_caddy")
+        self.assertIsNone(fields)
+        self.assertEqual(reason, (
+            "filtered on loopers_caddy_friends, whose (to_caddy_id, from_caddy_id) index reads the rows "
+            "in order, but the sort is on loopers_caddy.id, order by loopers_caddy_friends.from_caddy_id instead"
+        ))
+
+        # without follow_to_from_idx it's the follow table that needs the index
+        with mock.patch.object(index_advisor, "existing_indexes", return_value=[["id"], ["from_caddy_id", "to_caddy_id"]]):
+            model, fields, reason = index_advisor.Command().suggest(models_by_table, sql, "loopers_caddy")
+        self.assertEqual((model, fields), (Follow, ["to_caddy", "from_caddy"]))
+        self.assertIn("order by loopers_caddy_friends.from_caddy_id", reason)
+
+    def test_report_and_migration(self):
+        call_command("seed_data", caddies=8, loops=3, prefix="bench", stdout=io.StringIO())
+        out = io.StringIO()
+        # make the friends page load the follow graph again
+        with mock.patch.object(graph.graph, "loaded_at", None):
+            call_command("index_advisor", stdout=out)
+        report = out.getvalue()
+        self.assertIn("loopers:index: ", report)
+        self.assertIn("loopers:followers: ", report)
+        # the follow graph loads the whole table and says so
+        self.assertIn("scan on loopers_caddy_friends", report)
+        self.assertIn("reads the whole table on purpose", report)
+        # followers pages off follow_to_from_idx, nothing to sort
+        followers = report.split("loopers:followers: ")[1].split("\nloopers:")[0]
+        self.assertNotIn("filesort", followers)
+
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        path = os.path.join(tmp.name, "0100_suggested.py")
+        index_advisor.Command(stdout=io.StringIO()).write_migration(path, [(Caddy, ("change_email",))])
+        with open(path) as f:
+            migration = f.read()
+        self.assertIn("dependencies = [\n        ('loopers', ", migration)
+        self.assertIn("model_name='caddy'", migration)
+        self.assertIn("fields=['change_email']", migration)
+
+
+class ProfileLinkCommandTest(TestCase):
+    def setUp(self):
+        test_user = User.objects.create_user(username="test_user1", password="Stset01@")
+        Caddy.objects.create(user=test_user)
+        stats.rebuild_stats(test_user)
+
+    def test_profile_link(self):
+        out = io.StringIO()
+        call_command("profile_link", "test_user1", "--path", "/stats/", stdout=out)
+        path, query = out.getvalue().strip().split("?")
+        self.assertEqual(path, "/stats/")
+        self.client.login(username="test_user1", password="Stset01@")
+        self.assertIn("X-Profile", self.client.get(path, QueryDict(query)))
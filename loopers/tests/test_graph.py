@@ -0,0 +1,53 @@
+from django.contrib.auth.models import User
+from django.test import TestCase
+
+from loopers import graph
+from loopers.models import Caddy
+
+
+class FollowGraphTest(TestCase):
+    def setUp(self):
+        self.caddies = {}
+        for name in ["me", "a", "b", "c", "d", "e", "staff"]:
+            user = User.objects.create_user(username=name, password="Testpw21!", is_staff=name == "staff")
+            self.caddies[name] = Caddy.objects.create(user=user, email_validated=1)
+        self.follow("me", "a", "b")
+        self.follow("a", "c", "d", "me", "staff")
+        self.follow("b", "c", "staff")
+        self.follow("c", "e")
+        graph.graph.load()
+
+    def follow(self, name, *others):
+        self.caddies[name].friends.add(*[self.caddies[other] for other in others])
+
+    def ids(self, *names):
+        return [self.caddies[name].id for name in names]
+
+    def test_ranked_by_mutual_follows(self):
+        ranked = graph.graph.suggestions(self.caddies["me"].id)
+        self.assertEqual(ranked, list(zip(self.ids("c", "staff", "d"), [2, 2, 1])))
+
+    def test_suggestions_skip_staff(self):
+        suggestions = graph.suggestions(self.caddies["me"])
+        self.assertEqual([caddy.user.username for caddy in suggestions], ["c", "d"])
+        self.assertEqual(suggestions[0].mutual, 2)
+
+    def test_follows_applied_in_place(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.follow("me", "c")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.caddies["a"].friends.remove(self.caddies["d"])
+        with self.assertNumQueries(0):
+            ranked = graph.graph.suggestions(self.caddies["me"].id)
+        self.assertEqual(ranked, list(zip(self.ids("staff", "e"), [2, 1])))
+
+    def test_compact_keeps_edges(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.follow("me", "c")
+            self.caddies["c"].friends.clear()
+        before = graph.graph.suggestions(self.caddies["me"].id)
+        with graph.graph.lock:
+            graph.graph._compact()
+        self.assertEqual(graph.graph.changed, {})
+        self.assertEqual(graph.graph.suggestions(self.caddies["me"].id), before)
+        self.assertEqual(graph.graph.following(self.caddies["a"].id).tolist(), sorted(self.ids("c", "d", "me", "staff")))
@@ -0,0 +1,96 @@
+import fcntl
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+from unittest import mock
+
+from django.test import TestCase, override_settings
+
+from loopers import metrics, outbox
+
+
+class MetricsTest(TestCase):
+    def setUp(self):
+        patcher = mock.patch.object(metrics, "registry", metrics.Registry())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_render(self):
+        metrics.registry.inc("http_responses_total", {"view": "loopers:index", "status": 200}, 2)
+        metrics.registry.observe("http_request_duration_seconds", 0.02, {"view": "loopers:index"})
+        metrics.registry.observe("http_request_duration_seconds", 20, {"view": "loopers:index"})
+        text = metrics.render({"outbox_pending": 3})
+        self.assertIn("# TYPE caddyshackhub_http_responses_total counter", text)
+        self.assertIn('caddyshackhub_http_responses_total{status="200",view="loopers:index"} 2', text)
+        self.assertIn('caddyshackhub_http_request_duration_seconds_bucket{view="loopers:index",le="0.01"} 0', text)
+        self.assertIn('caddyshackhub_http_request_duration_seconds_bucket{view="loopers:index",le="0.025"} 1', text)
+        self.assertIn('caddyshackhub_http_request_duration_seconds_bucket{view="loopers:index",le="10"} 1', text)
+        self.assertIn('caddyshackhub_http_request_duration_seconds_bucket{view="loopers:index",le="+Inf"} 2', text)
+        self.assertIn('caddyshackhub_http_request_duration_seconds_count{view="loopers:index"} 2', text)
+        self.assertIn("caddyshackhub_outbox_pending 3", text)
+
+    def test_processes_added_up(self):
+        with tempfile.TemporaryDirectory() as directory, override_settings(METRICS_DIR=directory):
+            other = metrics.Registry()
+            other.inc("emails_sent_total", amount=4)
+            other.observe("email_send_duration_seconds", 0.3)
+            other.flush()
+            metrics.registry.inc("emails_sent_total", amount=1)
+            metrics.registry.observe("email_send_duration_seconds", 0.2)
+
+            counters, histograms = metrics.collect()
+            self.assertEqual(len([name for name in os.listdir(directory) if name.endswith(".json")]), 2)
+
+        self.assertEqual(counters[("emails_sent_total", ())], 5)
+        row = histograms[("email_send_duration_seconds", ())]
+        self.assertEqual(row[-1], 2)
+        self.assertAlmostEqual(row[-2], 0.5)
+
+    def test_exited_processes_folded(self):
+        process = subprocess.Popen([sys.executable, "-c", ""])
+        process.wait()
+        with tempfile.TemporaryDirectory() as directory, override_settings(METRICS_DIR=directory):
+            for amount in (2, 3):
+                exited = metrics.Registry()
+                exited.inc("emails_sent_total", amount=amount)
+                exited.flush()
+                os.rename(exited.path, os.path.join(directory, f"metrics-{process.pid}-{amount}.json"))
+            metrics.registry.inc("emails_sent_total", amount=1)
+
+            counters, _ = metrics.collect()
+            self.assertEqual(counters[("emails_sent_total", ())], 6)
+            files = {name for name in os.listdir(directory) if name.endswith(".json")}
+            self.assertEqual(len(files), 2)
+            self.assertIn(metrics.AGGREGATE_FILE, files)
+
+            # the next scrape reads the aggregate instead of counting them again
+            counters, _ = metrics.collect()
+            self.assertEqual(counters[("emails_sent_total", ())], 6)
+
+    def test_collect_waits_for_a_fold(self):
+        with tempfile.TemporaryDirectory() as directory, override_settings(METRICS_DIR=directory):
+            metrics.registry.inc("emails_sent_total", amount=1)
+            result = []
+            with open(os.path.join(directory, "metrics.lock"), "a") as lock:
+                # a fold in another worker, between replacing the aggregate and removing files
+                fcntl.flock(lock, fcntl.LOCK_EX)
+                reader = threading.Thread(target=lambda: result.append(metrics.collect()))
+                reader.start()
+                reader.join(0.2)
+                self.assertTrue(reader.is_alive())
+                fcntl.flock(lock, fcntl.LOCK_UN)
+            reader.join()
+        self.assertEqual(result[0][0][("emails_sent_total", ())], 1)
+
+    def test_outbox_counted(self):
+        outbox.queue_mail("Hi", "Body", "from@test.com", ["a@test.com", "b@test.com"])
+        with mock.patch("django.core.mail.EmailMessage.send", side_effect=[1, OSError("down")]):
+            with self.assertLogs("loopers.outbox", "ERROR"):
+                outbox.send_pending()
+
+        counters, histograms = metrics.collect()
+        self.assertEqual(counters[("emails_sent_total", ())], 1)
+        self.assertEqual(counters[("email_failures_total", ())], 1)
+        self.assertEqual(histograms[("email_send_duration_seconds", ())][-1], 2)
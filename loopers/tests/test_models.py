@@ -1,7 +1,8 @@
 from django.test import TestCase
 from django.contrib.auth.models import User
 
-from loopers.models import Caddy, Loop
+from loopers import helpers
+from loopers.models import AccountToken, Caddy, Loop
 
 
 class CaddyModelTests(TestCase):
@@ -94,4 +95,13 @@ class LoopModelTests(TestCase):
     def test_notes_label(self):
         loop = Loop.objects.get(id=1)
         field_label = loop._meta.get_field("notes").verbose_name
-        self.assertEqual(field_label, "notes")
\ No newline at end of file
+        self.assertEqual(field_label, "notes")
+
+
+class AccountTokenTests(TestCase):
+    def test_only_hash_is_stored(self):
+        user = User.objects.create_user(username="test_user", password="Stset01@", is_active=False)
+        key = helpers.generate_activation_key(user)
+        token = AccountToken.objects.get(user=user)
+        self.assertEqual(len(token.key_hash), 64)
+        self.assertNotEqual(token.key_hash, key)
@@ -0,0 +1,53 @@
+import io
+from unittest import mock
+
+from django.core import mail
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+
+from loopers import outbox
+from loopers.models import OutgoingEmail
+
+
+class OutboxTest(TestCase):
+    def setUp(self):
+        outbox.queue_mail("Subject", "Body", None, ["a@test.com", "b@test.com"])
+
+    def test_send_outbox_command(self):
+        call_command("send_outbox", stdout=io.StringIO())
+        self.assertEqual(sorted(m.to[0] for m in mail.outbox), ["a@test.com", "b@test.com"])
+        self.assertEqual(OutgoingEmail.objects.filter(status=OutgoingEmail.SENT).count(), 2)
+
+        # sent emails aren't picked up again
+        call_command("send_outbox", stdout=io.StringIO())
+        self.assertEqual(len(mail.outbox), 2)
+
+    def test_batches_share_one_connection(self):
+        with mock.patch("loopers.outbox.get_connection", wraps=outbox.get_connection) as get_connection:
+            self.assertEqual(outbox.drain(batch_size=1), 2)
+        self.assertEqual(get_connection.call_count, 2)
+        with mock.patch("loopers.outbox.get_connection", wraps=outbox.get_connection) as get_connection:
+            outbox.queue_mail("Subject", "Body", None, ["c@test.com", "d@test.com"])
+            outbox.drain(batch_size=10)
+        self.assertEqual(get_connection.call_count, 1)
+
+    def test_failed_send_backs_off(self):
+        with mock.patch("loopers.outbox.EmailMessage.send", side_effect=OSError("down")), \
+                self.assertLogs("loopers.outbox", "ERROR"):
+            outbox.drain()
+        email = OutgoingEmail.objects.first()
+        self.assertEqual(email.status, OutgoingEmail.PENDING)
+        self.assertEqual(email.attempts, 1)
+        self.assertEqual(email.last_error, "down")
+        self.assertGreater(email.next_attempt_at, timezone.now())
+
+        # not due yet
+        self.assertEqual(outbox.drain(), 0)
+
+        OutgoingEmail.objects.update(next_attempt_at=timezone.now(), attempts=outbox.MAX_ATTEMPTS - 1)
+        with mock.patch("loopers.outbox.EmailMessage.send", side_effect=OSError("down")), \
+                self.assertLogs("loopers.outbox", "ERROR"):
+            outbox.drain()
+        self.assertEqual(OutgoingEmail.objects.filter(status=OutgoingEmail.FAILED).count(), 2)
+        self.assertEqual(len(mail.outbox), 0)
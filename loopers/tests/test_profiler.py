@@ -0,0 +1,76 @@
+import sys
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from loopers import profiler, stats
+from loopers.models import Caddy, RequestProfile
+
+
+class ProfilerTest(TestCase):
+    def setUp(self):
+        self.test_user = User.objects.create_user(username="test_user1", password="Stset01@")
+        Caddy.objects.create(user=self.test_user)
+        stats.rebuild_stats(self.test_user)
+        self.other = User.objects.create_user(username="other", password="Stset01@")
+        self.staff = User.objects.create_superuser(username="staff", password="Stset01@")
+        Caddy.objects.create(user=self.staff)
+
+    def test_staff(self):
+        self.client.login(username="staff", password="Stset01@")
+        response = self.client.get(reverse("loopers:settings"), {"profile": "1"})
+        profile = RequestProfile.objects.get()
+        self.assertEqual(response["X-Profile"], reverse("admin:loopers_requestprofile_change", args=[profile.pk]))
+        self.assertEqual(profile.user, self.staff)
+        self.assertEqual(profile.view_name, "loopers:settings")
+        self.assertEqual(profile.status_code, 200)
+        self.assertIn("samples every 5 ms", profile.hot_functions)
+        self.assertIn("still allocated", profile.allocations)
+        self.assertIn("FROM \"django_session\"", profile.sql)
+
+        page = self.client.get(response["X-Profile"])
+        self.assertEqual(page.status_code, 200)
+        self.assertContains(page, "samples every 5 ms")
+
+    @override_settings(QUERY_BUDGET_RAISE=True)
+    def test_store_not_counted(self):
+        self.client.login(username="staff", password="Stset01@")
+        plain = self.client.get(reverse("loopers:settings")).wsgi_request.sql_queries.count
+        response = self.client.get(reverse("loopers:settings"), {"profile": "1"})
+        self.assertEqual(response.wsgi_request.sql_queries.count, plain)
+        self.assertIn(f'desc="{plain} queries"', response["Server-Timing"])
+        self.assertTrue(RequestProfile.objects.exists())
+
+    def test_not_asked(self):
+        self.client.login(username="staff", password="Stset01@")
+        response = self.client.get(reverse("loopers:settings"))
+        self.assertNotIn("X-Profile", response)
+        self.assertFalse(RequestProfile.objects.exists())
+
+    def test_signed_flag(self):
+        self.client.login(username="test_user1", password="Stset01@")
+        self.client.get(reverse("loopers:settings"), {"profile": "1"})
+        self.client.get(reverse("loopers:settings"), {"profile": profiler.signed_flag(self.other)})
+        self.client.get(reverse("loopers:settings"), {"profile": "tampered"})
+        self.assertFalse(RequestProfile.objects.exists())
+
+        response = self.client.get(reverse("loopers:settings"), {"profile": profiler.signed_flag(self.test_user)})
+        self.assertIn("X-Profile", response)
+        self.assertEqual(RequestProfile.objects.get().user, self.test_user)
+
+    def test_capped(self):
+        self.client.login(username="staff", password="Stset01@")
+        with mock.patch("loopers.profiler.KEEP", 2):
+            for _ in range(3):
+                self.client.get(reverse("loopers:settings"), {"profile": "1"})
+        self.assertEqual(RequestProfile.objects.count(), 2)
+
+    def test_sampler(self):
+        sampler = profiler.Sampler(None)
+        sampler.sample(sys._getframe())
+        self.assertEqual(sampler.samples, 1)
+        own = next(iter(sampler.own))
+        self.assertTrue(own.startswith("test_sampler (loopers/tests/test_profiler.py:"))
+        self.assertIn(own, profiler.hot_functions(sampler))
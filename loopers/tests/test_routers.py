@@ -0,0 +1,30 @@
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.contrib.sessions.models import Session
+from django.test import SimpleTestCase
+
+from loopers import routers
+from loopers.models import Loop
+
+
+class ReplicaRouterTest(SimpleTestCase):
+    def setUp(self):
+        self.router = routers.ReplicaRouter()
+
+    @mock.patch("loopers.routers.replica_configured", return_value=True)
+    def test_reads_go_to_replica_in_replica_views(self, configured):
+        self.assertIsNone(self.router.db_for_read(Loop))
+        with routers.replica_reads():
+            self.assertEqual(self.router.db_for_read(Loop), routers.REPLICA)
+            # sessions and auth stay on the primary
+            self.assertIsNone(self.router.db_for_read(Session))
+            self.assertIsNone(self.router.db_for_read(User))
+            with routers.primary_reads():
+                self.assertIsNone(self.router.db_for_read(Loop))
+
+    def test_nothing_routed_without_replica(self):
+        with routers.replica_reads():
+            self.assertIsNone(self.router.db_for_read(Loop))
+        self.assertFalse(self.router.allow_migrate(routers.REPLICA, "loopers"))
+        self.assertTrue(self.router.allow_migrate("default", "loopers"))
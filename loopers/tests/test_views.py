@@ -1,10 +1,27 @@
+import copy
 import datetime
-
-from django.test import TestCase
+import io
+import json
+import os
+import tempfile
+from unittest import mock
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core import mail
+from django.core.cache import cache
+from django.core.management import call_command
+from django.conf import settings
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.contrib.auth.models import User
+from django.utils import timezone
 
-from loopers.models import Loop, Caddy
+from loopers import analytics, autocomplete, export, feed, graph, heatmap, helpers, metrics, routers, stats
+from loopers.middleware import QueryBudgetExceeded
+from loopers.models import AccountToken, Loop, Caddy, CaddyStats, FeedEntry, OutgoingEmail, PeriodStats, SeasonStats
+from loopers.tests.utils import QueryBudgetMixin, url_names
 
 
 class LoopListViewTest(TestCase):
@@ -81,6 +98,32 @@ class LoopListViewTest(TestCase):
                 self.assertTrue(last_date >= loop.date)
                 last_date = loop.date
 
+    def test_cursor_pages_cover_all_loops(self):
+        self.client.login(username="test_user2", password="Stset01@")
+        response = self.client.get(reverse("loopers:loops"))
+        self.assertTrue(response.context["cursor_paging"])
+        page_obj = response.context["page_obj"]
+        self.assertTrue(page_obj.has_next())
+        titles = [loop.loop_title for loop in response.context["loop_list"]]
+
+        response = self.client.get(reverse("loopers:loops") + "?after=" + page_obj.next_cursor)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context["loop_list"]), 3)
+        self.assertFalse(response.context["page_obj"].has_next())
+        titles += [loop.loop_title for loop in response.context["loop_list"]]
+        self.assertEqual(titles, [f"Loop {i}" for i in reversed(range(13))])
+
+    def test_cursor_page_skips_count_query(self):
+        self.client.login(username="test_user2", password="Stset01@")
+        with self.assertNumQueries(3):
+            # session, user and the page itself
+            self.client.get(reverse("loopers:loops"))
+
+    def test_invalid_cursor(self):
+        self.client.login(username="test_user2", password="Stset01@")
+        response = self.client.get(reverse("loopers:loops") + "?after=garbage")
+        self.assertEqual(response.status_code, 404)
+
 class FriendsListViewTest(TestCase):
     def setUp(self):
         test_user = User.objects.create_user(
@@ -172,8 +215,18 @@ class FriendsListViewTest(TestCase):
         response2 = self.client.get(reverse("loopers:friends"))
         self.assertEqual(response2.context["total_following"], 2)
 
+    def test_suggestions(self):
+        friend = Caddy.objects.get(user__username="Friend 0")
+        friend.friends.add(Caddy.objects.get(user__username="test_friend"))
+        graph.graph.load()
+        self.client.login(username="test_user1", password="Stset01@")
+        response = self.client.get(reverse("loopers:friends"))
+        self.assertEqual([caddy.user.username for caddy in response.context["suggestions"]], ["test_friend"])
+        self.assertContains(response, "followed by 1 of your friends")
+
 class IndexViewTest(TestCase):
     def setUp(self):
+        cache.clear()
         test_user = User.objects.create_user(
             username="test_user1", password="Stset01@", email="test2@test.com"
         )
@@ -193,7 +246,8 @@ class IndexViewTest(TestCase):
             email_validated=1,
         )
         test_caddy.friends.add(self.test_caddy2)
-        
+        stats.rebuild_stats(test_user)
+
     def test_redirect_if_not_logged_in(self):
         response = self.client.get("")
         self.assertRedirects(response, "/accounts/login/?next=/")
@@ -217,7 +271,7 @@ class IndexViewTest(TestCase):
         self.assertEqual(response.context["total_money"], 0)
         self.assertTrue('top_three_friends' in response.context)
         top_three_friends = response.context['top_three_friends']
-        self.assertEqual(top_three_friends, {0: self.test_caddy2})
+        self.assertEqual(top_three_friends, [("test_friend", 0)])
 
 class NewLoopViewTest(TestCase):
     def setUp(self):
@@ -230,6 +284,7 @@ class NewLoopViewTest(TestCase):
             activation_key="347efab47cd89fabd",
             email_validated=1,
         )
+        stats.rebuild_stats(test_user)
 
     def test_redirect_if_not_logged_in(self):
         response = self.client.get(reverse("loopers:new_loop"))
@@ -272,6 +327,635 @@ class NewLoopViewTest(TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertTemplateUsed(response, "loopers/new_loop.html")
 
+class CaddyStatsViewTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.test_user = User.objects.create_user(
+            username="test_user1", password="Stset01@", email="test2@test.com"
+        )
+        Caddy.objects.create(
+            user=self.test_user,
+            loop_count=0,
+            activation_key="347efab47cd89fabd",
+            email_validated=1,
+        )
+        stats.rebuild_stats(self.test_user)
+        self.client.login(username="test_user1", password="Stset01@")
+
+    def new_loop(self, date, num_loops, money):
+        self.client.post(reverse('loopers:new_loop'),
+            {
+                'loop_title': 'test',
+                'date': date,
+                'num_loops': num_loops,
+                'money': money,
+                'notes': '',
+            })
+        return Loop.objects.filter(caddy=self.test_user).latest("id")
+
+    def test_new_loop_updates_stats(self):
+        self.new_loop('2023-06-01', 1, 100)
+        self.new_loop('2024-02-05', 2, 150)
+        stats = CaddyStats.objects.get(user=self.test_user)
+        self.assertEqual(stats.total_loops, 3)
+        self.assertEqual(stats.total_money, 250)
+        self.assertEqual(stats.entry_count, 2)
+        self.assertEqual(stats.first_loop_date, datetime.date(2023, 6, 1))
+        self.assertEqual(stats.last_loop_date, datetime.date(2024, 2, 5))
+        seasons = {s.season: s.total_money for s in SeasonStats.objects.filter(user=self.test_user)}
+        self.assertEqual(seasons, {2023: 100, 2024: 150})
+
+    def test_edit_loop_updates_stats_and_loop_count(self):
+        loop = self.new_loop('2023-06-01', 1, 100)
+        self.client.post(reverse("loopers:edit_loop", kwargs={"pk": loop.id}),
+            {
+                'loop_title': 'test edit',
+                'date': '2024-02-05',
+                'num_loops': '3',
+                'money': '180',
+                'notes': '',
+            })
+        self.assertEqual(Caddy.objects.get(user=self.test_user).loop_count, 3)
+        stats = CaddyStats.objects.get(user=self.test_user)
+        self.assertEqual(stats.total_loops, 3)
+        self.assertEqual(stats.total_money, 180)
+        self.assertEqual(stats.first_loop_date, datetime.date(2024, 2, 5))
+        seasons = {s.season: s.total_loops for s in SeasonStats.objects.filter(user=self.test_user)}
+        self.assertEqual(seasons, {2024: 3})
+
+    def test_delete_loop_updates_stats(self):
+        self.new_loop('2023-06-01', 1, 100)
+        loop = self.new_loop('2024-02-05', 2, 150)
+        self.client.get(reverse("loopers:delete_loop", kwargs={"loop_id": loop.id}))
+        stats = CaddyStats.objects.get(user=self.test_user)
+        self.assertEqual(stats.total_loops, 1)
+        self.assertEqual(stats.total_money, 100)
+        self.assertEqual(stats.last_loop_date, datetime.date(2023, 6, 1))
+        self.assertFalse(SeasonStats.objects.filter(user=self.test_user, season=2024).exists())
+
+    def test_dashboard_reads_stats(self):
+        self.new_loop('2024-02-05', 2, 150)
+        self.new_loop('2024-02-06', 1, 80)
+        response = self.client.get(reverse("loopers:index"))
+        self.assertEqual(response.context["loop_count"], 3)
+        self.assertEqual(response.context["total_money"], 230)
+
+class ExportLoopsViewTest(TestCase):
+    def setUp(self):
+        self.test_user = User.objects.create_user(
+            username="test_user1", password="Stset01@", email="test2@test.com"
+        )
+        Caddy.objects.create(user=self.test_user, email_validated=1)
+        for day in range(1, 4):
+            Loop.objects.create(
+                loop_title=f"Loop {day}",
+                date=datetime.date(2024, 2, day),
+                num_loops=1,
+                money=60,
+                notes="a, b",
+                caddy=self.test_user,
+            )
+        stats.rebuild_stats(self.test_user)
+        self.client.login(username="test_user1", password="Stset01@")
+
+    def test_redirect_if_not_logged_in(self):
+        self.client.logout()
+        response = self.client.get(reverse("loopers:export_loops"))
+        self.assertRedirects(response, "/accounts/login/?next=/loops/export/")
+
+    def test_csv_export(self):
+        response = self.client.get(reverse("loopers:export_loops"))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response["Content-Type"], "text/csv")
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0], "date,loop_title,num_loops,money,notes")
+        self.assertEqual(lines[1], '2024-02-01,Loop 1,1,60,"a, b"')
+        self.assertEqual(len(lines), 4)
+
+    def test_export_read_in_keyset_chunks(self):
+        # ties on the date have to carry over between chunks too
+        Loop.objects.create(loop_title="Loop 2b", date=datetime.date(2024, 2, 2), money=60, caddy=self.test_user)
+        with mock.patch("loopers.export.CHUNK_SIZE", 2), self.assertNumQueries(3):
+            rows = list(export.export_rows(self.test_user))
+        self.assertEqual([row[1] for row in rows], ["Loop 1", "Loop 2", "Loop 2b", "Loop 3"])
+
+    def test_ndjson_export_with_date_range(self):
+        response = self.client.get(
+            reverse("loopers:export_loops"),
+            {"format": "ndjson", "start": "2024-02-02", "end": "2024-02-03"},
+        )
+        rows = [json.loads(line) for line in b"".join(response.streaming_content).splitlines()]
+        self.assertEqual([row["loop_title"] for row in rows], ["Loop 2", "Loop 3"])
+        self.assertEqual(rows[0]["date"], "2024-02-02")
+
+    def test_invalid_options(self):
+        response = self.client.get(
+            reverse("loopers:export_loops"), {"start": "2024-02-03", "end": "2024-02-01"}
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_conditional_get(self):
+        response = self.client.get(reverse("loopers:export_loops"))
+        etag = response["ETag"]
+        response = self.client.get(reverse("loopers:export_loops"), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        # a different range is a different download
+        response = self.client.get(
+            reverse("loopers:export_loops"), {"start": "2024-02-02"}, HTTP_IF_NONE_MATCH=etag
+        )
+        self.assertEqual(response.status_code, 200)
+
+        loop = Loop.objects.get(loop_title="Loop 1")
+        self.client.get(reverse("loopers:delete_loop", kwargs={"loop_id": loop.id}))
+        response = self.client.get(reverse("loopers:export_loops"), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+class ImportLoopsViewTest(TestCase):
+    def setUp(self):
+        self.test_user = User.objects.create_user(
+            username="test_user1", password="Stset01@", email="test2@test.com"
+        )
+        Caddy.objects.create(user=self.test_user, loop_count=1, email_validated=1)
+        self.client.login(username="test_user1", password="Stset01@")
+
+    def upload(self, content):
+        csv_file = SimpleUploadedFile("loops.csv", content.encode("utf-8"), content_type="text/csv")
+        return self.client.post(reverse("loopers:import_loops"), {"csv_file": csv_file})
+
+    def test_redirect_if_not_logged_in(self):
+        self.client.logout()
+        response = self.client.get(reverse("loopers:import_loops"))
+        self.assertRedirects(response, "/accounts/login/?next=/loops/import/")
+
+    def test_import_valid_rows(self):
+        tomorrow = datetime.date.today() + datetime.timedelta(days=1)
+        response = self.upload(
+            "date,loop_title,num_loops,money,notes\n"
+            "2024-02-05,Morning,2,150,\n"
+            "2024-02-06,Afternoon,1,80,windy\n"
+            f"{tomorrow},Future,1,80,\n"
+            "2024-02-07,,1,80,\n"
+        )
+        self.assertRedirects(response, reverse("loopers:import_loops"))
+        self.assertEqual(Loop.objects.filter(caddy=self.test_user).count(), 2)
+        self.assertEqual(Caddy.objects.get(user=self.test_user).loop_count, 4)
+        stats = CaddyStats.objects.get(user=self.test_user)
+        self.assertEqual(stats.total_money, 230)
+
+        response = self.client.get(reverse("loopers:import_errors"))
+        lines = response.content.decode().splitlines()
+        self.assertEqual(len(lines), 3)
+        self.assertTrue(lines[1].startswith("4,date: Loop date cannot be in the future."))
+        self.assertTrue(lines[2].startswith("5,loop_title:"))
+
+    def test_import_feeds_followers_in_constant_queries(self):
+        me = Caddy.objects.get(user=self.test_user)
+        followers = []
+        for i in range(3):
+            user = User.objects.create_user(username=f"follower{i}", password="Testpw21!")
+            Caddy.objects.create(user=user).friends.add(me)
+            followers.append(user)
+        Loop.objects.create(loop_title="a", date=datetime.date(2024, 2, 5), money=80, caddy=self.test_user)
+        Loop.objects.create(loop_title="b", date=datetime.date(2024, 2, 6), money=80, caddy=self.test_user)
+        # the followers, the loops and one insert
+        with self.assertNumQueries(3):
+            feed.loops_imported(self.test_user)
+        for user in followers:
+            self.assertEqual(FeedEntry.objects.filter(user=user).count(), 2)
+
+    def test_error_report_capped(self):
+        with mock.patch("loopers.importer.SESSION_ERRORS", 2):
+            self.upload("date,loop_title,num_loops,money,notes\n" + "2024-02-05,,1,80,\n" * 5)
+        self.assertEqual(len(self.client.session["import_errors"]), 2)
+        lines = self.client.get(reverse("loopers:import_errors")).content.decode().splitlines()
+        self.assertEqual(len(lines), 4)
+        self.assertEqual(lines[3], ",3 more rows could not be imported and are not listed")
+
+    def test_import_missing_columns(self):
+        self.upload("date,loop_title\n2024-02-05,Morning\n")
+        self.assertFalse(Loop.objects.filter(caddy=self.test_user).exists())
+        self.assertEqual(Caddy.objects.get(user=self.test_user).loop_count, 1)
+
+    def test_no_error_report(self):
+        self.upload("date,loop_title,num_loops,money,notes\n2024-02-05,Morning,2,150,\n")
+        response = self.client.get(reverse("loopers:import_errors"))
+        self.assertEqual(response.status_code, 404)
+
+    def test_import_command(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        path = os.path.join(tmp.name, "loops.csv")
+        with open(path, "w") as f:
+            f.write("date,loop_title,num_loops,money,notes\n")
+            for day in range(1, 8):
+                f.write(f"2024-02-0{day},Loop {day},1,60,\n")
+            f.write("bad,Loop,1,60,\n")
+
+        errors_path = os.path.join(tmp.name, "errors.csv")
+        call_command(
+            "import_loops", "test_user1", path, batch_size=3, errors=errors_path,
+            stdout=io.StringIO(), stderr=io.StringIO(),
+        )
+        self.assertEqual(Loop.objects.filter(caddy=self.test_user).count(), 7)
+        self.assertEqual(Caddy.objects.get(user=self.test_user).loop_count, 8)
+        self.assertEqual(CaddyStats.objects.get(user=self.test_user).entry_count, 7)
+        with open(errors_path) as f:
+            self.assertEqual(len(f.read().splitlines()), 2)
+
+class LeaderboardTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.test_user = User.objects.create_user(
+            username="test_user1", password="Stset01@", email="test2@test.com"
+        )
+        self.test_caddy = Caddy.objects.create(user=self.test_user, email_validated=1)
+        for i, loop_count in enumerate([5, 9, 5, 1]):
+            user = User.objects.create_user(username=f"friend{i}", password="Testpw21!")
+            friend = Caddy.objects.create(user=user, loop_count=loop_count)
+            self.test_caddy.friends.add(friend)
+            stats.rebuild_stats(user)
+        stats.rebuild_stats(self.test_user)
+        self.client.login(username="test_user1", password="Stset01@")
+
+    def test_top_friends_keeps_ties(self):
+        response = self.client.get(reverse("loopers:index"))
+        self.assertEqual(
+            response.context["top_three_friends"],
+            [("friend1", 9), ("friend0", 5), ("friend2", 5)],
+        )
+
+    def test_top_friends_cached_until_friend_logs_loop(self):
+        self.client.get(reverse("loopers:index"))
+        Caddy.objects.filter(user__username="friend3").update(loop_count=20)
+        response = self.client.get(reverse("loopers:index"))
+        self.assertEqual(response.context["top_three_friends"][0], ("friend1", 9))
+
+        friend = User.objects.get(username="friend3")
+        self.client.login(username="friend3", password="Testpw21!")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse("loopers:new_loop"), {
+                "loop_title": "test",
+                "date": "2024-02-05",
+                "num_loops": "1",
+                "money": "100",
+                "notes": "",
+            })
+        self.client.login(username="test_user1", password="Stset01@")
+        response = self.client.get(reverse("loopers:index"))
+        self.assertEqual(response.context["top_three_friends"][0], (friend.username, 21))
+
+    def test_unfollow_drops_board(self):
+        self.client.get(reverse("loopers:index"))
+        friend = Caddy.objects.get(user__username="friend1")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.test_caddy.friends.remove(friend)
+        response = self.client.get(reverse("loopers:index"))
+        self.assertEqual(response.context["top_three_friends"][0], ("friend0", 5))
+
+    def test_global_boards(self):
+        today = datetime.date.today()
+        for i, num_loops in enumerate([2, 3]):
+            user = User.objects.get(username=f"friend{i}")
+            loop = Loop.objects.create(
+                loop_title="test", date=today, num_loops=num_loops, money=60, caddy=user
+            )
+            stats.loop_added(loop)
+        last_year = Loop.objects.create(
+            loop_title="old", date=today.replace(year=today.year - 1), num_loops=9, money=60,
+            caddy=self.test_user,
+        )
+        stats.loop_added(last_year)
+
+        for period in ["week", "month", "season"]:
+            response = self.client.get(reverse("loopers:leaderboard"), {"period": period})
+            self.assertEqual(response.context["board"], [("friend1", 3), ("friend0", 2)])
+
+        response = self.client.get(reverse("loopers:leaderboard"), {"period": "decade"})
+        self.assertEqual(response.status_code, 404)
+
+    def test_period_stats_follow_edits(self):
+        loop = Loop.objects.create(
+            loop_title="test", date=datetime.date(2024, 2, 29), num_loops=2, money=60,
+            caddy=self.test_user,
+        )
+        stats.loop_added(loop)
+        old_loop = copy.copy(loop)
+        loop.date = datetime.date(2024, 3, 1)
+        loop.save()
+        stats.loop_changed(old_loop, loop)
+        rows = {
+            (row.period, row.start): row.total_loops
+            for row in PeriodStats.objects.filter(user=self.test_user)
+        }
+        self.assertEqual(rows, {
+            ("week", datetime.date(2024, 2, 26)): 2,
+            ("month", datetime.date(2024, 3, 1)): 2,
+        })
+
+        stats.rebuild_stats(self.test_user)
+        self.assertEqual(PeriodStats.objects.filter(user=self.test_user).count(), 2)
+
+class DashboardCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.test_user = User.objects.create_user(
+            username="test_user1", password="Stset01@", email="test@test.com"
+        )
+        self.test_caddy = Caddy.objects.create(user=self.test_user, email_validated=1)
+        self.friend = User.objects.create_user(username="friend", password="Testpw21!")
+        self.friend_caddy = Caddy.objects.create(user=self.friend, loop_count=2)
+        self.test_caddy.friends.add(self.friend_caddy)
+        self.loop = Loop.objects.create(loop_title="first", money=80, caddy=self.test_user)
+        stats.rebuild_stats(self.test_user)
+        self.client.login(username="test_user1", password="Stset01@")
+
+    def test_repeat_visit_only_loads_session(self):
+        self.client.get(reverse("loopers:index"))
+        # the session and the user
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse("loopers:index"))
+        self.assertEqual(list(response.context["all_loops"]), [self.loop])
+        self.assertContains(response, "first")
+
+    def test_saving_loop_invalidates_owner(self):
+        self.client.get(reverse("loopers:index"))
+        with self.captureOnCommitCallbacks(execute=True):
+            Loop.objects.create(loop_title="second", money=20, caddy=self.test_user)
+        response = self.client.get(reverse("loopers:index"))
+        self.assertEqual(response.context["all_loops"][0].loop_title, "second")
+
+    def test_deleting_loop_invalidates_owner(self):
+        self.client.get(reverse("loopers:index"))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.loop.delete()
+        response = self.client.get(reverse("loopers:index"))
+        self.assertEqual(list(response.context["all_loops"]), [])
+
+    def test_friend_loop_invalidates_followers(self):
+        self.client.get(reverse("loopers:index"))
+        Caddy.objects.filter(user=self.friend).update(loop_count=3)
+        with self.captureOnCommitCallbacks(execute=True):
+            Loop.objects.create(loop_title="friend", money=20, caddy=self.friend)
+        response = self.client.get(reverse("loopers:index"))
+        self.assertEqual(response.context["top_three_friends"], [("friend", 3)])
+
+    def test_follow_invalidates_follower(self):
+        self.client.get(reverse("loopers:index"))
+        other = Caddy.objects.create(
+            user=User.objects.create_user(username="other", password="Testpw21!"), loop_count=5
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            self.test_caddy.friends.add(other)
+        response = self.client.get(reverse("loopers:index"))
+        self.assertEqual(response.context["top_three_friends"], [("other", 5), ("friend", 2)])
+
+    def test_deleting_friend_invalidates_followers(self):
+        other = Caddy.objects.create(user=User.objects.create_user(username="other", password="Testpw21!"))
+        self.friend_caddy.friends.add(other)
+        graph.graph.load()
+        self.assertEqual(graph.graph.suggestions(self.test_caddy.id), [(other.id, 1)])
+        self.client.get(reverse("loopers:index"))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.friend.delete()
+        response = self.client.get(reverse("loopers:index"))
+        self.assertEqual(response.context["top_three_friends"], [])
+        self.assertEqual(graph.graph.suggestions(self.test_caddy.id), [])
+
+    def test_other_dashboards_kept(self):
+        self.client.get(reverse("loopers:index"))
+        stranger = User.objects.create_user(username="stranger", password="Testpw21!")
+        with self.captureOnCommitCallbacks(execute=True):
+            Loop.objects.create(loop_title="stranger", money=20, caddy=stranger)
+        with self.assertNumQueries(2):
+            self.client.get(reverse("loopers:index"))
+
+
+class AnalyticsTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.test_user = User.objects.create_user(
+            username="test_user1", password="Stset01@", email="test@test.com"
+        )
+        self.test_caddy = Caddy.objects.create(user=self.test_user, email_validated=1)
+        self.today = datetime.date(2024, 3, 10)
+        for date, num_loops, money in [
+            ("2023-03-01", 1, 50),
+            ("2023-03-05", 2, 150),
+            ("2024-03-01", 1, 80),
+            ("2024-03-01", 1, 70),
+            ("2024-03-09", 2, 120),
+        ]:
+            Loop.objects.create(
+                loop_title="test", date=date, num_loops=num_loops, money=money, caddy=self.test_user
+            )
+        stats.rebuild_stats(self.test_user)
+        for i, money in enumerate([100, 470, 900]):
+            user = User.objects.create_user(username=f"friend{i}", password="Testpw21!")
+            self.test_caddy.friends.add(Caddy.objects.create(user=user))
+            Loop.objects.create(loop_title="test", money=money, caddy=user)
+            stats.rebuild_stats(user)
+        self.client.login(username="test_user1", password="Stset01@")
+
+    def test_stats(self):
+        result = analytics.get_analytics(self.test_user, today=self.today)
+        self.assertEqual(result["total_money"], 470)
+        self.assertEqual(result["money_per_loop"], 67.14)
+        week, month = result["rolling"]
+        self.assertEqual(week["money"], round(120 / 7, 2))
+        self.assertEqual(month["money"], round(270 / 30, 2))
+        self.assertEqual(month["best_money"], round(270 / 30, 2))
+        self.assertEqual(result["best_days"][0], {"date": datetime.date(2023, 3, 5), "money": 150, "loops": 2})
+        self.assertEqual(result["best_days"][1], {"date": datetime.date(2024, 3, 1), "money": 150, "loops": 2})
+        self.assertEqual(
+            result["seasons"][0],
+            {"season": 2024, "money": 270, "loops": 4, "money_per_loop": 67.5, "money_change": 35.0},
+        )
+        self.assertEqual(result["season_to_date"]["money"], 270)
+        self.assertEqual(result["season_to_date"]["last_season_money"], 200)
+        self.assertEqual(result["friends"], {"count": 3, "percentile": 50.0, "rank": 2})
+
+    def test_no_loops(self):
+        user = User.objects.create_user(username="empty", password="Testpw21!")
+        result = analytics.get_analytics(user)
+        self.assertEqual(result["total_money"], 0)
+        self.assertIsNone(result["money_per_loop"])
+        self.assertIsNone(result["friends"])
+
+    def test_memoized_until_loop_changes(self):
+        analytics.get_analytics(self.test_user, today=self.today)
+        # the stats row and the friends
+        with self.assertNumQueries(2):
+            analytics.get_analytics(self.test_user, today=self.today)
+
+        loop = Loop.objects.create(
+            loop_title="test", date=self.today, money=30, caddy=self.test_user
+        )
+        stats.loop_added(loop)
+        result = analytics.get_analytics(self.test_user, today=self.today)
+        self.assertEqual(result["total_money"], 500)
+
+    def test_pages(self):
+        response = self.client.get(reverse("loopers:stats"))
+        self.assertTemplateUsed(response, "loopers/stats.html")
+        self.assertContains(response, "$470 from 7 loops")
+
+        response = self.client.get(reverse("loopers:stats_json"))
+        data = response.json()
+        self.assertEqual(data["total_loops"], 7)
+        self.assertEqual(data["best_days"][0]["date"], "2023-03-05")
+
+
+class HeatmapTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.test_user = User.objects.create_user(
+            username="test_user1", password="Stset01@", email="test@test.com"
+        )
+        Caddy.objects.create(user=self.test_user, email_validated=1)
+        self.loop = Loop.objects.create(
+            loop_title="test", date=datetime.date(2023, 6, 1), num_loops=1, money=50, caddy=self.test_user
+        )
+        Loop.objects.create(
+            loop_title="test", date=datetime.date(2023, 6, 1), num_loops=2, money=150, caddy=self.test_user
+        )
+        Loop.objects.create(
+            loop_title="test", date=datetime.date(2023, 6, 3), num_loops=1, money=100, caddy=self.test_user
+        )
+        stats.rebuild_stats(self.test_user)
+        self.client.login(username="test_user1", password="Stset01@")
+
+    def loop_data(self, date):
+        return {"loop_title": "test", "date": date, "num_loops": "1", "money": "60", "notes": ""}
+
+    def test_buckets_from_one_query(self):
+        with self.assertNumQueries(1):
+            buckets = heatmap.day_buckets(self.test_user.id, 2023)
+        self.assertEqual(
+            buckets, {datetime.date(2023, 6, 1): (3, 200), datetime.date(2023, 6, 3): (1, 100)}
+        )
+        with self.assertNumQueries(0):
+            heatmap.day_buckets(self.test_user.id, 2023)
+
+    def test_calendar(self):
+        calendar = heatmap.calendar(self.test_user.id, 2023)
+        # 2023 starts on a sunday, so the first week is six blanks and january 1st
+        self.assertEqual(calendar["weeks"][0][:6], [None] * 6)
+        self.assertEqual(calendar["weeks"][0][6]["date"], datetime.date(2023, 1, 1))
+        days = {day["date"]: day for week in calendar["weeks"] for day in week if day}
+        self.assertEqual(len(days), 365)
+        self.assertEqual(days[datetime.date(2023, 6, 1)]["level"], 4)
+        self.assertEqual(days[datetime.date(2023, 6, 3)]["level"], 2)
+        self.assertEqual(days[datetime.date(2023, 6, 2)]["level"], 0)
+        self.assertEqual((calendar["loops"], calendar["money"], calendar["days"]), (4, 300, 2))
+
+    def test_views_patch_cached_days(self):
+        heatmap.day_buckets(self.test_user.id, 2023)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse("loopers:new_loop"), self.loop_data("2023-06-02"))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(
+                reverse("loopers:edit_loop", kwargs={"pk": self.loop.pk}), self.loop_data("2023-06-03")
+            )
+        with self.assertNumQueries(0):
+            buckets = heatmap.day_buckets(self.test_user.id, 2023)
+        self.assertEqual(buckets[datetime.date(2023, 6, 1)], (2, 150))
+        self.assertEqual(buckets[datetime.date(2023, 6, 2)], (1, 60))
+        self.assertEqual(buckets[datetime.date(2023, 6, 3)], (2, 160))
+
+        loop = Loop.objects.get(date=datetime.date(2023, 6, 2))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.get(reverse("loopers:delete_loop", kwargs={"loop_id": loop.pk}))
+        self.assertNotIn(datetime.date(2023, 6, 2), heatmap.day_buckets(self.test_user.id, 2023))
+
+    def test_stats_page(self):
+        response = self.client.get(reverse("loopers:stats"), {"year": 2023})
+        self.assertEqual(response.context["heatmap"]["year"], 2023)
+        self.assertContains(response, "2023-06-01: 3 loops, $200")
+        response = self.client.get(reverse("loopers:stats"), {"year": 1999})
+        self.assertEqual(response.status_code, 404)
+
+
+class CaddyAutocompleteTest(TestCase):
+    def setUp(self):
+        for name, is_staff, is_active in [
+            ("sam", False, True),
+            ("sally", False, True),
+            ("sandy", False, True),
+            ("sarge", True, True),
+            ("sasha", False, False),
+            ("bob", False, True),
+        ]:
+            user = User.objects.create_user(
+                username=name, password="Testpw21!", is_staff=is_staff, is_active=is_active
+            )
+            Caddy.objects.create(user=user, email_validated=1)
+        self.test_caddy = Caddy.objects.get(user__username="sam")
+        self.test_caddy.friends.add(Caddy.objects.get(user__username="sally"))
+        autocomplete.index.load()
+        graph.graph.load()
+        self.client.login(username="sam", password="Testpw21!")
+
+    def search(self, prefix):
+        response = self.client.get(reverse("loopers:caddy_autocomplete"), {"q": prefix})
+        return response.json()["usernames"]
+
+    def test_prefix_search_skips_staff_inactive_followed_and_self(self):
+        # just the session and the user
+        with self.assertNumQueries(2):
+            self.assertEqual(self.search("sa"), ["sandy"])
+        self.assertEqual(self.search("B"), ["bob"])
+        self.assertEqual(self.search(""), [])
+
+    def test_index_follows_user_changes(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            user = User.objects.create_user(username="sabrina", password="Testpw21!")
+            Caddy.objects.create(user=user)
+        with self.captureOnCommitCallbacks(execute=True):
+            User.objects.filter(username="sasha").update(is_active=True)
+            sasha = User.objects.get(username="sasha")
+            sasha.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            User.objects.get(username="sandy").delete()
+        self.assertEqual(self.search("sa"), ["sabrina", "sasha"])
+
+    def test_followed_caddy_drops_out(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse("loopers:friends"), {"caddy_to_follow": "sandy"})
+        self.assertEqual(self.search("sa"), [])
+
+
+class ReplicaPinViewTest(TestCase):
+    def setUp(self):
+        self.test_user = User.objects.create_user(
+            username="test_user1", password="Stset01@", email="test@test.com"
+        )
+        Caddy.objects.create(user=self.test_user, email_validated=1)
+        stats.rebuild_stats(self.test_user)
+        self.client.login(username="test_user1", password="Stset01@")
+
+    def loop_data(self):
+        return {"loop_title": "test", "date": "2024-02-01", "num_loops": "1", "money": "60", "notes": ""}
+
+    @mock.patch("loopers.routers.replica_configured", return_value=True)
+    def test_write_pins_browser_to_primary(self, configured):
+        response = self.client.post(reverse("loopers:new_loop"), self.loop_data())
+        cookie = response.cookies[routers.PIN_COOKIE]
+        self.assertEqual(cookie["max-age"], settings.REPLICA_STICKY_SECONDS)
+
+        # pinned, so the replica views read from the primary and see the new loop
+        for name in ["loopers:index", "loopers:loops", "loopers:friends", "loopers:followers"]:
+            response = self.client.get(reverse(name))
+            self.assertEqual(response.status_code, 200)
+            self.assertNotIn(routers.PIN_COOKIE, response.cookies)
+        self.assertContains(self.client.get(reverse("loopers:loops")), "test")
+
+    def test_no_pin_without_replica(self):
+        response = self.client.post(reverse("loopers:new_loop"), self.loop_data())
+        self.assertNotIn(routers.PIN_COOKIE, response.cookies)
+
+
 class DeleteLoopViewTest(TestCase):
     def setUp(self):
         test_user = User.objects.create_user(
@@ -309,6 +993,8 @@ class DeleteLoopViewTest(TestCase):
             notes="This is test user1s loop",
             caddy=test_user1,
         )
+        stats.rebuild_stats(test_user)
+        stats.rebuild_stats(test_user1)
 
     def test_redirect_if_not_logged_in(self):
         response = self.client.get(reverse("loopers:delete_loop", kwargs={"loop_id": 1}))
@@ -389,6 +1075,173 @@ class FollowersViewTest(TestCase):
         followers = ''.join(response.context["followers"])
         self.assertEqual(followers, self.test_caddy1.user.username)
 
+    def test_follow_counts_denormalized(self):
+        self.test_caddy1.refresh_from_db()
+        test_caddy2 = Caddy.objects.get(user__username="test_user2")
+        self.assertEqual(self.test_caddy1.following_count, 1)
+        self.assertEqual(test_caddy2.follower_count, 1)
+
+        self.test_caddy1.friends.remove(test_caddy2)
+        test_caddy2.refresh_from_db()
+        self.assertEqual(test_caddy2.follower_count, 0)
+
+        self.test_caddy1.friends.add(test_caddy2)
+        test_caddy2.caddy_set.clear()
+        self.test_caddy1.refresh_from_db()
+        self.assertEqual(self.test_caddy1.following_count, 0)
+
+    def test_follow_counts_after_delete_account(self):
+        test_caddy2 = Caddy.objects.get(user__username="test_user2")
+        test_caddy2.friends.add(self.test_caddy1)
+        self.client.login(username="test_user2", password="Stset0133!")
+        self.client.post(reverse("loopers:delete_account", kwargs={"pk": test_caddy2.user_id}))
+        self.assertFalse(Caddy.objects.filter(pk=test_caddy2.pk).exists())
+        self.test_caddy1.refresh_from_db()
+        self.assertEqual((self.test_caddy1.follower_count, self.test_caddy1.following_count), (0, 0))
+
+    def test_followers_constant_queries(self):
+        test_caddy2 = Caddy.objects.get(user__username="test_user2")
+        for i in range(60):
+            user = User.objects.create_user(username=f"follower{i}", password="Testpw21!")
+            Caddy.objects.create(user=user).friends.add(test_caddy2)
+
+        self.client.login(username="test_user2", password="Stset0133!")
+        with self.assertNumQueries(4):
+            # session, user, caddy and one joined followers query
+            response = self.client.get(reverse("loopers:followers"))
+        self.assertEqual(response.context["total"], 61)
+        self.assertEqual(len(response.context["followers"]), 50)
+
+        next_cursor = response.context["page_obj"].next_cursor
+        response = self.client.get(reverse("loopers:followers") + "?after=" + next_cursor)
+        self.assertEqual(len(response.context["followers"]), 11)
+        self.assertFalse(response.context["page_obj"].has_next())
+
+    def test_followers_page_is_an_index_range(self):
+        from loopers.management.commands import index_advisor
+
+        self.client.login(username="test_user2", password="Stset0133!")
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse("loopers:followers"))
+        # the page is read off follow_to_from_idx in order, not sorted afterwards
+        self.assertEqual(index_advisor.explain("default", queries[-1]["sql"], None), [])
+
+class FeedViewTest(TestCase):
+    def setUp(self):
+        self.test_user1 = User.objects.create_user(
+            username="test_user1", password="Stset01@", email="test2@test.com"
+        )
+        self.test_caddy1 = Caddy.objects.create(user=self.test_user1, email_validated=1)
+
+        self.test_user2 = User.objects.create_user(
+            username="test_user2", password="Stset0133!", email="testfriend@test.com"
+        )
+        self.test_caddy2 = Caddy.objects.create(user=self.test_user2, email_validated=1)
+        Loop.objects.create(
+            loop_title="Old loop",
+            date=datetime.date(2024, 2, 5),
+            money=60,
+            caddy=self.test_user2,
+        )
+        stats.rebuild_stats(self.test_user1)
+        stats.rebuild_stats(self.test_user2)
+
+    def new_loop(self, title, date):
+        self.client.login(username="test_user2", password="Stset0133!")
+        self.client.post(reverse('loopers:new_loop'),
+            {
+                'loop_title': title,
+                'date': date,
+                'num_loops': '1',
+                'money': '100',
+                'notes': '',
+            })
+
+    def feed_titles(self):
+        return [e.loop.loop_title for e in FeedEntry.objects.filter(user=self.test_user1)]
+
+    def test_redirect_if_not_logged_in(self):
+        response = self.client.get(reverse("loopers:feed"))
+        self.assertRedirects(response, "/accounts/login/?next=/friends/feed/")
+
+    def test_follow_backfills_feed(self):
+        self.test_caddy1.friends.add(self.test_caddy2)
+        self.assertEqual(self.feed_titles(), ["Old loop"])
+
+    def test_new_loop_fans_out_to_followers(self):
+        self.test_caddy1.friends.add(self.test_caddy2)
+        self.new_loop("New loop", "2024-03-01")
+        self.assertEqual(self.feed_titles(), ["New loop", "Old loop"])
+        # the author doesn't follow themselves so gets nothing
+        self.assertFalse(FeedEntry.objects.filter(user=self.test_user2).exists())
+
+    def test_unfollow_removes_entries(self):
+        self.test_caddy1.friends.add(self.test_caddy2)
+        self.test_caddy1.friends.remove(self.test_caddy2)
+        self.assertEqual(self.feed_titles(), [])
+
+        self.test_caddy1.friends.add(self.test_caddy2)
+        self.test_caddy1.friends.clear()
+        self.assertEqual(self.feed_titles(), [])
+
+    def test_feed_trimmed(self):
+        self.test_caddy1.friends.add(self.test_caddy2)
+        with mock.patch("loopers.feed.FEED_SIZE", 2):
+            self.new_loop("Loop 1", "2024-03-01")
+            self.new_loop("Loop 2", "2024-03-02")
+            # the write leaves trimming to the worker
+            self.assertEqual(len(self.feed_titles()), 3)
+            call_command("send_outbox", stdout=io.StringIO())
+        self.assertEqual(self.feed_titles(), ["Loop 2", "Loop 1"])
+
+    def test_new_loop_constant_in_followers(self):
+        for i in range(3):
+            user = User.objects.create_user(username=f"follower{i}", password="Testpw21!")
+            Caddy.objects.create(user=user).friends.add(self.test_caddy2)
+        loop = Loop.objects.create(loop_title="New loop", date=datetime.date(2024, 3, 1), money=60, caddy=self.test_user2)
+        # the followers and one insert
+        with self.assertNumQueries(2):
+            feed.loop_added(loop)
+
+        # only the feeds with new entries are trimmed
+        with mock.patch("loopers.feed.trim_feeds") as trim_feeds:
+            after = feed.trim_new_entries(FeedEntry.objects.filter(loop=loop).order_by("id").first().id)
+            self.assertEqual(feed.trim_new_entries(after), after)
+        self.assertEqual(trim_feeds.call_count, 1)
+        self.assertEqual(len(trim_feeds.call_args.args[0]), 2)
+
+    def test_edit_loop_moves_entry(self):
+        self.test_caddy1.friends.add(self.test_caddy2)
+        self.new_loop("New loop", "2024-03-01")
+        loop = Loop.objects.get(loop_title="Old loop")
+        self.client.post(reverse("loopers:edit_loop", kwargs={"pk": loop.id}),
+            {
+                'loop_title': 'Old loop',
+                'date': '2024-04-01',
+                'num_loops': '1',
+                'money': '60',
+                'notes': '',
+            })
+        self.assertEqual(self.feed_titles(), ["Old loop", "New loop"])
+
+    def test_feed_constant_queries(self):
+        self.test_caddy1.friends.add(self.test_caddy2)
+        for i in range(30):
+            Loop.objects.create(loop_title=f"Loop {i}", money=60, caddy=self.test_user2)
+        feed.backfill(self.test_user1.id)
+
+        self.client.login(username="test_user1", password="Stset01@")
+        with self.assertNumQueries(3):
+            # session, user and one joined feed query
+            response = self.client.get(reverse("loopers:feed"))
+        self.assertEqual(len(response.context["entries"]), 25)
+        self.assertEqual(response.context["entries"][0].caddy, self.test_user2)
+
+        next_cursor = response.context["page_obj"].next_cursor
+        response = self.client.get(reverse("loopers:feed") + "?after=" + next_cursor)
+        self.assertEqual(len(response.context["entries"]), 6)
+        self.assertFalse(response.context["page_obj"].has_next())
+
 class RegisterViewTest(TestCase):
     def test_get_register_page(self):
         response = self.client.get(reverse("loopers:register"))
@@ -405,6 +1258,11 @@ class RegisterViewTest(TestCase):
             }
         )
         self.assertEqual(response.status_code, 302)
+        self.assertTrue(User.objects.filter(username="new_user1").exists())
+        # nothing is sent until the outbox is drained
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(OutgoingEmail.objects.get().to, "example@test.com")
+        self.assertTrue(AccountToken.objects.filter(user__username="new_user1").exists())
 
     def test_register_new_user_invalid_form(self):
         response = self.client.post(reverse("loopers:register"),
@@ -419,20 +1277,22 @@ class RegisterViewTest(TestCase):
 
 class ActivateAccountViewTest(TestCase):
     def setUp(self):
-        test_user = User.objects.create_user(
-            username="test_user", password="Stset01@", email="test2@test.com"
+        self.test_user = User.objects.create_user(
+            username="test_user", password="Stset01@", email="test2@test.com", is_active=False
         )
         Caddy.objects.create(
-            user=test_user,
+            user=self.test_user,
             loop_count=14,
-            activation_key="346efab47cd89fabd",
             email_validated=0,
         )
+        self.key = helpers.generate_activation_key(self.test_user)
 
     def test_activate_account_successfully(self):
-        response = self.client.get(reverse("loopers:activate"), {"key":"346efab47cd89fabd"})
+        response = self.client.get(reverse("loopers:activate"), {"key": self.key})
         self.assertEqual(response.status_code, 200)
         self.assertTemplateUsed(response, "loopers/activated.html")
+        self.assertTrue(User.objects.get(pk=self.test_user.pk).is_active)
+        self.assertTrue(Caddy.objects.get(user=self.test_user).email_validated)
 
     def test_activate_account_fail(self):
         response = self.client.get(reverse("loopers:activate"), {"key":"346efab47cd8"})
@@ -442,6 +1302,16 @@ class ActivateAccountViewTest(TestCase):
         response = self.client.get(reverse("loopers:activate"), {"key":""})
         self.assertEqual(response.status_code, 404)
 
+    def test_key_is_single_use(self):
+        self.client.get(reverse("loopers:activate"), {"key": self.key})
+        response = self.client.get(reverse("loopers:activate"), {"key": self.key})
+        self.assertEqual(response.status_code, 404)
+
+    def test_expired_key(self):
+        AccountToken.objects.update(expires_at=timezone.now())
+        response = self.client.get(reverse("loopers:activate"), {"key": self.key})
+        self.assertEqual(response.status_code, 404)
+
 class LoopDetailViewTest(TestCase):
     def setUp(self):
         test_user = User.objects.create_user(
@@ -497,6 +1367,8 @@ class EditLoopViewTest(TestCase):
             notes="This is test user2s loop",
             caddy=test_user2,
         )
+        stats.rebuild_stats(test_user1)
+        stats.rebuild_stats(test_user2)
 
     def test_redirect_if_not_logged_in(self):
         response = self.client.post(reverse("loopers:edit_loop", kwargs={"pk": 1}))
@@ -639,6 +1511,7 @@ class ChangeEmailViewTest(TestCase):
             })
         self.assertEqual(response.status_code, 302)
         self.assertRedirects(response, reverse("loopers:settings"))
+        self.assertEqual(OutgoingEmail.objects.get().to, "new@email.com")
 
     def test_invalid_form_wrong_password(self):
         self.client.login(username="test_user1", password="Stset01@")
@@ -658,17 +1531,16 @@ class ChangeEmailViewTest(TestCase):
 
 class ChangeEmailVerificationTest(TestCase):
     def setUp(self):
-        test_user = User.objects.create_user(
+        self.test_user = User.objects.create_user(
             username="test_user", password="Stset01@", email="test2@test.com"
         )
         Caddy.objects.create(
-            user=test_user,
+            user=self.test_user,
             loop_count=14,
-            activation_key="346efab47cd89fabd",
             email_validated=1,
             change_email="newemail@test.com",
-            change_email_key="123456",
         )
+        self.key = helpers.generate_activation_key(self.test_user, AccountToken.CHANGE_EMAIL)
 
     def test_redirect_if_not_logged_in(self):
         response = self.client.get(reverse("loopers:email_verification"), {"key":"123456"})
@@ -678,9 +1550,10 @@ class ChangeEmailVerificationTest(TestCase):
 
     def test_verify_email_successfully(self):
         self.client.login(username="test_user", password="Stset01@")
-        response = self.client.get(reverse("loopers:email_verification"), {"key":"123456"})
+        response = self.client.get(reverse("loopers:email_verification"), {"key": self.key})
         self.assertEqual(response.status_code, 200)
         self.assertTemplateUsed(response, "loopers/settings.html")
+        self.assertEqual(User.objects.get(pk=self.test_user.pk).email, "newemail@test.com")
 
     def test_verify_email_fail(self):
         self.client.login(username="test_user", password="Stset01@")
@@ -691,3 +1564,159 @@ class ChangeEmailVerificationTest(TestCase):
         self.client.login(username="test_user", password="Stset01@")
         response = self.client.get(reverse("loopers:email_verification"), {"key":""})
         self.assertEqual(response.status_code, 404)
+
+    def test_other_users_key(self):
+        User.objects.create_user(username="other", password="Stset01@")
+        self.client.login(username="other", password="Stset01@")
+        response = self.client.get(reverse("loopers:email_verification"), {"key": self.key})
+        self.assertEqual(response.status_code, 404)
+
+class QueryBudgetTest(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        self.test_user = User.objects.create_user(
+            username="test_user1", password="Stset01@", email="test@test.com"
+        )
+        self.test_caddy = Caddy.objects.create(
+            user=self.test_user, email_validated=1, change_email="new@test.com"
+        )
+        for i in range(5):
+            user = User.objects.create_user(username=f"friend{i}", password="Testpw21!")
+            friend = Caddy.objects.create(user=user, loop_count=i)
+            self.test_caddy.friends.add(friend)
+            friend.friends.add(self.test_caddy)
+            for day in range(3):
+                Loop.objects.create(loop_title=f"Loop {day}", money=60, caddy=user)
+        for day in range(15):
+            self.loop = Loop.objects.create(
+                loop_title=f"Loop {day}",
+                date=datetime.date(2024, 2, 1) + datetime.timedelta(days=day),
+                money=60,
+                caddy=self.test_user,
+            )
+        stats.rebuild_stats(self.test_user)
+        self.client.login(username="test_user1", password="Stset01@")
+        self.visited = set()
+
+    def check(self, response):
+        self.assertLess(response.status_code, 400)
+        self.assertWithinQueryBudget(response)
+        self.visited.add(response.resolver_match.view_name)
+
+    def loop_data(self):
+        return {
+            "loop_title": "test",
+            "date": "2024-03-01",
+            "num_loops": "1",
+            "money": "100",
+            "notes": "",
+        }
+
+    def test_every_route_within_budget(self):
+        for name, kwargs in [
+            ("loopers:index", {}),
+            ("loopers:loops", {}),
+            ("loopers:loop-detail", {"pk": self.loop.pk}),
+            ("loopers:new_loop", {}),
+            ("loopers:edit_loop", {"pk": self.loop.pk}),
+            ("loopers:settings", {}),
+            ("loopers:change_password", {}),
+            ("loopers:change_email", {}),
+            ("loopers:delete_account", {"pk": self.test_user.pk}),
+            ("loopers:friends", {}),
+            ("loopers:caddy_autocomplete", {}),
+            ("loopers:followers", {}),
+            ("loopers:feed", {}),
+            ("loopers:leaderboard", {}),
+            ("loopers:stats", {}),
+            ("loopers:stats_json", {}),
+            ("loopers:export_loops", {}),
+            ("loopers:import_loops", {}),
+            ("loopers:terms_of_service", {}),
+            ("loopers:privacy_policy", {}),
+        ]:
+            self.check(self.client.get(reverse(name, kwargs=kwargs)))
+
+        self.check(self.client.post(reverse("loopers:new_loop"), self.loop_data()))
+        self.check(
+            self.client.post(reverse("loopers:edit_loop", kwargs={"pk": self.loop.pk}), self.loop_data())
+        )
+        self.check(self.client.get(reverse("loopers:delete_loop", kwargs={"loop_id": self.loop.pk})))
+        self.check(self.client.post(reverse("loopers:friends"), {"caddy_to_follow": "friend0"}))
+        friend = Caddy.objects.get(user__username="friend1")
+        self.check(self.client.get(reverse("loopers:unfollow_friend", kwargs={"friend_id": friend.pk})))
+
+        csv_file = SimpleUploadedFile(
+            "loops.csv", b"date,loop_title,num_loops,money,notes\n2024-02-05,a,1,60,\nbad,b,1,60,\n"
+        )
+        self.check(self.client.post(reverse("loopers:import_loops"), {"csv_file": csv_file}))
+        self.check(self.client.get(reverse("loopers:import_errors")))
+        with override_settings(METRICS_TOKEN="scrape"):
+            self.check(self.client.get(
+                reverse("loopers:metrics"), headers={"Authorization": "Bearer scrape"}
+            ))
+
+        self.check(self.client.post(
+            reverse("loopers:change_email"), {"password": "Stset01@", "new_email": "other@test.com"}
+        ))
+        key = helpers.generate_activation_key(self.test_user, AccountToken.CHANGE_EMAIL)
+        self.check(self.client.get(reverse("loopers:email_verification"), {"key": key}))
+        self.check(self.client.post(reverse("loopers:change_password"), {
+            "old_password": "Stset01@",
+            "new_password1": "TheNew103$",
+            "new_password2": "TheNew103$",
+        }))
+        self.check(self.client.post(reverse("loopers:delete_account", kwargs={"pk": self.test_user.pk})))
+
+        self.check(self.client.get(reverse("loopers:register")))
+        self.check(self.client.post(reverse("loopers:register"), {
+            "username": "new_user1",
+            "password1": "MyPass123!",
+            "password2": "MyPass123!",
+            "email": "example@test.com",
+        }))
+        key = helpers.generate_activation_key(User.objects.get(username="new_user1"))
+        self.check(self.client.get(reverse("loopers:activate"), {"key": key}))
+
+        self.assertEqual(self.visited, url_names("loopers"))
+
+    def test_server_timing_header(self):
+        response = self.client.get(reverse("loopers:settings"))
+        self.assertRegex(response["Server-Timing"], r'^db;dur=[0-9.]+;desc="2 queries"$')
+
+    def test_over_budget(self):
+        with override_settings(QUERY_BUDGETS={"loopers:settings": 1}):
+            with self.assertLogs("loopers.sql", "WARNING") as logs:
+                self.client.get(reverse("loopers:settings"))
+        self.assertIn("loopers:settings ran 2 queries, budget is 1", logs.output[0])
+
+        with override_settings(QUERY_BUDGETS={"loopers:settings": 1}, QUERY_BUDGET_RAISE=True):
+            with self.assertRaises(QueryBudgetExceeded):
+                self.client.get(reverse("loopers:settings"))
+
+
+class MetricsViewTest(TestCase):
+    def setUp(self):
+        patcher = mock.patch.object(metrics, "registry", metrics.Registry())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.test_user = User.objects.create_user(username="test_user1", password="Stset01@")
+        Caddy.objects.create(user=self.test_user)
+        self.staff = User.objects.create_user(username="staff", password="Stset01@", is_staff=True)
+
+    def test_staff_only(self):
+        self.client.login(username="test_user1", password="Stset01@")
+        self.assertEqual(self.client.get(reverse("loopers:metrics")).status_code, 403)
+
+        self.client.login(username="staff", password="Stset01@")
+        response = self.client.get(reverse("loopers:metrics"))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "text/plain; version=0.0.4")
+        self.assertIn('caddyshackhub_http_responses_total{status="403",view="loopers:metrics"} 1', response.content.decode())
+
+    def test_token(self):
+        url = reverse("loopers:metrics")
+        self.assertEqual(self.client.get(url, headers={"Authorization": "Bearer "}).status_code, 403)
+        with override_settings(METRICS_TOKEN="scrape"):
+            self.assertEqual(self.client.get(url, headers={"Authorization": "Bearer wrong"}).status_code, 403)
+            self.assertEqual(self.client.get(url, headers={"Authorization": "Bearer scrape"}).status_code, 200)
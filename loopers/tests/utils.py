@@ -0,0 +1,27 @@
+from django.conf import settings
+from django.urls import get_resolver
+
+
+class QueryBudgetMixin:
+    """Assertions for the query budgets enforced by QueryInstrumentationMiddleware."""
+
+    def assertWithinQueryBudget(self, response):
+        url_name = response.resolver_match.view_name
+        budget = settings.QUERY_BUDGETS.get(url_name)
+        self.assertIsNotNone(budget, f"{url_name} has no entry in QUERY_BUDGETS")
+
+        queries = response.wsgi_request.sql_queries
+        self.assertLessEqual(
+            queries.count,
+            budget,
+            f"{url_name} ran {queries.count} queries, budget is {budget}. "
+            f"Repeated: {queries.duplicates}",
+        )
+
+
+def url_names(namespace):
+    """Every URL name in the namespace, e.g. "loopers:index"."""
+    resolver = get_resolver().namespace_dict[namespace][1]
+    return {
+        f"{namespace}:{pattern.name}" for pattern in resolver.url_patterns if pattern.name
+    }
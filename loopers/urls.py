@@ -8,6 +8,9 @@ urlpatterns = [
     path("register/", views.register, name="register"),
     path("activate/account/", views.activate_account, name="activate"),
     path("loops/", views.LoopListView.as_view(), name="loops"),
+    path("loops/export/", views.export_loops, name="export_loops"),
+    path("loops/import/", views.import_loops, name="import_loops"),
+    path("loops/import/errors/", views.import_errors, name="import_errors"),
     path("loop/<int:pk>", views.DetailView.as_view(), name="loop-detail"),
     path("loop/new_loop/", views.new_loop, name="new_loop"),
     path("loop/<int:pk>/edit_loop", views.edit_loop, name="edit_loop"),
@@ -21,7 +24,13 @@ urlpatterns = [
     path(
         "friends/delete/<int:friend_id>", views.unfollow_friend, name="unfollow_friend"
     ),
+    path("friends/autocomplete/", views.caddy_autocomplete, name="caddy_autocomplete"),
     path("friends/followers/", views.followers, name="followers"),
+    path("friends/feed/", views.friends_feed, name="feed"),
+    path("leaderboard/", views.leaderboards, name="leaderboard"),
+    path("stats/", views.earnings, name="stats"),
+    path("stats/json/", views.earnings_json, name="stats_json"),
+    path("metrics", views.metrics_view, name="metrics"),
     path("terms-of-service/", views.terms_of_service, name="terms_of_service"),
     path("privacy-policy/", views.privacy_policy, name="privacy_policy"),
 ]
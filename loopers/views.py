@@ -1,60 +1,53 @@
-from django.http import HttpResponseForbidden, Http404
+from django.http import HttpResponse, HttpResponseBadRequest, HttpResponseForbidden, Http404, JsonResponse, StreamingHttpResponse
 from django.shortcuts import render, redirect, get_object_or_404, Http404
 from django.urls import reverse, reverse_lazy
 from django.views import generic, View
+from django.views.decorators.http import condition
 from django.views.generic.edit import FormMixin
+from django.core.paginator import InvalidPage
 from django.db.models import F
 from django.contrib import messages
 from django.contrib.auth import update_session_auth_hash
 from django.contrib.auth.forms import PasswordChangeForm
 from django.contrib.auth.hashers import check_password
 from django.conf import settings
-from django.core.mail import send_mail
-from django.db import connection
+from django.db import transaction
 
 from django.contrib.auth.models import User
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib.auth.decorators import login_required
+from django.utils.decorators import method_decorator
 
-from .models import Caddy, Loop
-from .forms import NewUserForm, NewLoopForm, FollowCaddyForm, ChangeEmailForm
-from loopers import helpers
-import logging
+from .models import AccountToken, Caddy, CaddyStats, FeedEntry, Follow, Loop, OutgoingEmail, PeriodStats
+from .forms import NewUserForm, NewLoopForm, FollowCaddyForm, ChangeEmailForm, ExportLoopsForm, ImportLoopsForm
+from loopers import analytics, autocomplete, dashboard, export, feed, graph, heatmap, helpers, importer, leaderboard, metrics, outbox, stats
+from loopers.pagination import KeysetPaginator
+from loopers.routers import replica_view
+import copy
+import datetime
+import hmac
+import io
 
 
+@method_decorator(replica_view, name="dispatch")
 class IndexView(LoginRequiredMixin, generic.ListView):
     model = Loop
     template_name = "loopers/index.html"
     context_object_name = "all_loops"
 
+    def get(self, request, *args, **kwargs):
+        self.dashboard = dashboard.get_dashboard(request.user)
+        return super().get(request, *args, **kwargs)
+
     def get_queryset(self):
-        # return the last five loops
-        return Loop.objects.filter(caddy=self.request.user)[:5]
+        # the last five loops
+        return self.dashboard["recent_loops"]
 
     def get_context_data(self, **kwargs):
         context = super(IndexView, self).get_context_data(**kwargs)
-        total_loops = Caddy.objects.get(user=self.request.user).loop_count
-        context["loop_count"] = total_loops
-
-        total_money = Loop.objects.filter(caddy=self.request.user).values_list(
-            "money", flat=True
-        )
-        grand_money_total = 0
-        for cash in total_money:
-            grand_money_total += cash
-        context["total_money"] = grand_money_total
-
-        friends = Caddy.objects.get(user=self.request.user).friends.all()
-        friends_loop_dict = {}
-        for fri in friends:
-            friends_loop_dict.update({fri.loop_count: fri})
-        top_three_friends = dict(
-            sorted(friends_loop_dict.items(), key=lambda item: item[0], reverse=True)[
-                :3
-            ]
-        )
-        context["top_three_friends"] = top_three_friends
-
+        context["loop_count"] = self.dashboard["loop_count"]
+        context["total_money"] = self.dashboard["total_money"]
+        context["top_three_friends"] = self.dashboard["top_three_friends"]
         return context
 
 
@@ -62,57 +55,44 @@ def register(request):
     if request.method == "POST":
         f = NewUserForm(request.POST)
         if f.is_valid():
-            activation_key = helpers.generate_activation_key(
-                username=request.POST["username"]
-            )
+            with transaction.atomic():
+                u = User.objects.create_user(
+                    request.POST["username"],
+                    request.POST["email"],
+                    request.POST["password1"],
+                    is_active=0,
+                )
+
+                caddy = Caddy()
+                caddy.user = u
+                caddy.save()
+                # an empty rollup now saves building one on their first visit
+                CaddyStats.objects.create(user=u)
+
+                activation_key = helpers.generate_activation_key(u)
 
-            subject = "CaddyShackHub Confirm Account"
-            message = """\n
+                subject = "CaddyShackHub Confirm Account"
+                message = """\n
                 Thank you for signing up for an account on CaddyShackHub! The premier loop tracker.
                 \nPlease visit the following link to verify your email and confirm your account sign up. You won't be able to login until you do so.
                 \n\n{0}://{1}/activate/account/?key={2}
                 \n\n- The CaddyShackHub team
                     """.format(
-                request.scheme, request.get_host(), activation_key
-            )
-
-            error = False
+                    request.scheme, request.get_host(), activation_key
+                )
 
-            try:
-                send_mail(
+                # sent by the send_outbox worker, not while the request waits
+                outbox.queue_mail(
                     subject=subject,
                     message=message,
                     from_email=None,
                     recipient_list=[request.POST["email"]],
-                    fail_silently=False,
-                )
-                messages.add_message(
-                    request,
-                    messages.INFO,
-                    "Account created! Please activate your account by clicking on the link sent to your email.",
-                )
-
-            except:
-                error = True
-                messages.add_message(
-                    request,
-                    messages.INFO,
-                    "Unable to send email verification. Please try again",
-                )
-                logging.exception("Send email failure")
-
-            if not error:
-                u = User.objects.create_user(
-                    request.POST["username"],
-                    request.POST["email"],
-                    request.POST["password1"],
-                    is_active=0,
                 )
-
-                caddy = Caddy()
-                caddy.activation_key = activation_key
-                caddy.user = u
-                caddy.save()
+            messages.add_message(
+                request,
+                messages.INFO,
+                "Account created! Please activate your account by clicking on the link sent to your email.",
+            )
 
             return redirect(reverse("loopers:register"))
     else:
@@ -126,15 +106,18 @@ def activate_account(request):
     if not key:
         raise Http404()
 
-    r = get_object_or_404(Caddy, activation_key=key, email_validated=False)
-    r.user.is_active = True
-    r.user.save()
-    r.email_validated = True
-    r.save()
+    token = helpers.use_token(key, AccountToken.ACTIVATION)
+    if token is None:
+        raise Http404()
+
+    token.user.is_active = True
+    token.user.save()
+    Caddy.objects.filter(user=token.user).update(email_validated=True)
 
     return render(request, "loopers/activated.html")
 
 
+@method_decorator(replica_view, name="dispatch")
 class DetailView(LoginRequiredMixin, generic.DetailView):
     model = Loop
     template_name = "loopers/detail.html"
@@ -144,6 +127,7 @@ class DetailView(LoginRequiredMixin, generic.DetailView):
         return Loop.objects.filter(caddy=self.request.user)
 
 
+@method_decorator(replica_view, name="dispatch")
 class LoopListView(LoginRequiredMixin, generic.ListView):
     model = Loop
     paginate_by = 10
@@ -152,6 +136,104 @@ class LoopListView(LoginRequiredMixin, generic.ListView):
     def get_queryset(self):
         return Loop.objects.filter(caddy=self.request.user)
 
+    def paginate_queryset(self, queryset, page_size):
+        # numbered pages are still there with ?page=, otherwise page with a
+        # cursor so deep pages don't need an OFFSET or a COUNT(*)
+        if "page" in self.request.GET:
+            return super().paginate_queryset(queryset, page_size)
+
+        paginator = KeysetPaginator(queryset, page_size, ordering=("-date", "-id"))
+        try:
+            page = paginator.page(self.request.GET.get("after"))
+        except InvalidPage:
+            raise Http404("Invalid page")
+        return (paginator, page, page.object_list, page.has_next() or page.has_previous())
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context["cursor_paging"] = isinstance(context["paginator"], KeysetPaginator)
+        return context
+
+
+def _export_stats(request):
+    # the etag and last modified checks both need the rollup, only read it once
+    if not hasattr(request, "_export_stats"):
+        request._export_stats = stats.get_stats(request.user)
+    return request._export_stats
+
+
+def _export_etag(request):
+    form = ExportLoopsForm(request.GET)
+    if not form.is_valid():
+        return None
+    data = form.cleaned_data
+    return export.export_etag(_export_stats(request), data["format"], data["start"], data["end"])
+
+
+def _export_last_modified(request):
+    return _export_stats(request).updated_at
+
+
+@login_required
+@condition(etag_func=_export_etag, last_modified_func=_export_last_modified)
+def export_loops(request):
+    form = ExportLoopsForm(request.GET)
+    if not form.is_valid():
+        return HttpResponseBadRequest("Invalid export options")
+
+    fmt = form.cleaned_data["format"]
+    rows = export.export_rows(
+        request.user, start=form.cleaned_data["start"], end=form.cleaned_data["end"]
+    )
+    lines = export.csv_lines(rows) if fmt == "csv" else export.ndjson_lines(rows)
+
+    response = StreamingHttpResponse(lines, content_type=export.CONTENT_TYPES[fmt])
+    response["Content-Disposition"] = f'attachment; filename="loops.{fmt}"'
+    return response
+
+
+@login_required
+def import_loops(request):
+    if request.method == "POST":
+        f = ImportLoopsForm(request.POST, request.FILES)
+        if f.is_valid():
+            lines = io.TextIOWrapper(request.FILES["csv_file"], encoding="utf-8-sig", newline="")
+            try:
+                result = importer.import_loops(request.user, lines)
+            except UnicodeDecodeError:
+                messages.error(request, "File must be a UTF-8 encoded CSV")
+                return redirect(reverse("loopers:import_loops"))
+
+            messages.success(request, f"Imported {result.created} loops")
+            # keep the skipped rows around so they can be downloaded, fixed and
+            # re-imported. only the first few, a bad file would bloat the session
+            request.session["import_errors"] = result.errors[:importer.SESSION_ERRORS]
+            request.session["import_errors_more"] = max(len(result.errors) - importer.SESSION_ERRORS, 0)
+            if result.errors:
+                messages.error(request, f"{len(result.errors)} rows could not be imported")
+            return redirect(reverse("loopers:import_loops"))
+    else:
+        f = ImportLoopsForm()
+
+    return render(
+        request,
+        "loopers/import_loops.html",
+        {"form": f, "has_errors": bool(request.session.get("import_errors"))},
+    )
+
+
+@login_required
+def import_errors(request):
+    errors = request.session.get("import_errors")
+    if not errors:
+        raise Http404("No import errors")
+
+    response = HttpResponse(
+        importer.error_report_lines(errors, request.session.get("import_errors_more", 0)), content_type="text/csv"
+    )
+    response["Content-Disposition"] = 'attachment; filename="import_errors.csv"'
+    return response
+
 
 @login_required
 def new_loop(request):
@@ -159,14 +241,16 @@ def new_loop(request):
         f = NewLoopForm(request.POST)
         if f.is_valid():
             obj = f.save(commit=False)
-            obj.caddy = User.objects.get(pk=request.user.id)
+            obj.caddy = request.user
 
-            loops_to_be_added = obj.num_loops
-            caddy = Caddy.objects.get(user=request.user.id)
-            caddy.loop_count = F("loop_count") + loops_to_be_added
-            caddy.save()
+            with transaction.atomic():
+                # update() instead of save() so the follow counts aren't written back
+                Caddy.objects.filter(user=request.user.id).update(loop_count=F("loop_count") + obj.num_loops)
 
-            obj.save()
+                obj.save()
+                stats.loop_added(obj)
+                feed.loop_added(obj)
+                heatmap.days_changed(request.user.id, [obj.date])
             messages.success(request, "New loop added!")
             return redirect(reverse("loopers:loops"))
     else:
@@ -183,13 +267,28 @@ def edit_loop(request, pk):
         raise Http404("Loop does not exist")
 
     # prevent other users from editing other user's loops
-    if loop_to_edit.caddy.id != request.user.id:
+    if loop_to_edit.caddy_id != request.user.id:
         return HttpResponseForbidden("You cannot edit what is not yours")
+    # already loaded, saves the stats update fetching the user again
+    loop_to_edit.caddy = request.user
 
     if request.method == "POST":
+        # the form writes the new values onto loop_to_edit, keep the old ones
+        old_loop = copy.copy(loop_to_edit)
         f = NewLoopForm(request.POST, instance=loop_to_edit)
         if f.is_valid():
-            f.save()
+            with transaction.atomic():
+                f.save()
+
+                loops_changed = loop_to_edit.num_loops - old_loop.num_loops
+                if loops_changed:
+                    Caddy.objects.filter(user=request.user.id).update(
+                        loop_count=F("loop_count") + loops_changed
+                    )
+                stats.loop_changed(old_loop, loop_to_edit)
+                heatmap.days_changed(request.user.id, [old_loop.date, loop_to_edit.date])
+                if loop_to_edit.date != old_loop.date:
+                    feed.loop_changed(loop_to_edit)
             messages.success(request, "Loop has been updated successfully")
             return redirect(reverse("loopers:loops"))
     else:
@@ -205,17 +304,16 @@ def delete_loop(request, loop_id):
     except Loop.DoesNotExist:
         raise Http404("Loop does not exist")
 
-    if loop_to_delete.caddy.id != request.user.id:
+    if loop_to_delete.caddy_id != request.user.id:
         return HttpResponseForbidden("Loop does not exist")
+    loop_to_delete.caddy = request.user
 
-    num_loops = loop_to_delete.num_loops
-
-    caddy = Caddy.objects.get(user=request.user.id)
-    caddy.loop_count = F("loop_count") - num_loops
-
-    caddy.save()
+    with transaction.atomic():
+        Caddy.objects.filter(user=request.user.id).update(loop_count=F("loop_count") - loop_to_delete.num_loops)
 
-    loop_to_delete.delete()
+        loop_to_delete.delete()
+        stats.loop_removed(loop_to_delete)
+        heatmap.days_changed(request.user.id, [loop_to_delete.date])
     return redirect(reverse("loopers:loops"))
 
 
@@ -247,75 +345,101 @@ class DeleteAccount(LoginRequiredMixin, generic.DeleteView):
     success_message = 'Account successfully deleted'
     success_url = reverse_lazy('loopers:register')
 
+@method_decorator(replica_view, name="dispatch")
 class FriendsListView(LoginRequiredMixin, FormMixin, generic.ListView):
     context_object_name = "all_friends"
     template_name = "loopers/friends.html"
     form_class = FollowCaddyForm
 
     def get_queryset(self):
-        caddy = Caddy.objects.get(user=self.request.user.id)
-        return caddy.friends.all()
+        self.caddy = Caddy.objects.get(user=self.request.user.id)
+        return self.caddy.friends.select_related("user")
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        total_following = len(Caddy.objects.get(user=self.request.user.id).friends.all())
-        context["total_following"] = total_following
+        context["total_following"] = self.caddy.following_count
+        context["suggestions"] = graph.suggestions(self.caddy)
         return context
 
     def post(self, request, *args, **kwargs):
         form = self.get_form()
         caddy = Caddy.objects.get(user=request.user.id)
 
-        if form.is_valid():
-            caddy_to_follow = request.POST["caddy_to_follow"]
-            user = User.objects.get(username=caddy_to_follow)
-            if not user.is_staff:
-                friend = Caddy.objects.get(user_id=user.id)
-
-                caddy.friends.add(friend.id)
-                messages.success(request, "Successfully followed caddy")
-                return redirect(reverse("loopers:friends"))
+        if form.is_valid() and not form.user.is_staff:
+            caddy.friends.add(form.user.caddy.id)
+            messages.success(request, "Successfully followed caddy")
+            return redirect(reverse("loopers:friends"))
 
         return render(
             request,
             "loopers/friends.html",
-            {"form": form, "all_friends": caddy.friends.all(), "total_following": len(caddy.friends.all())},
+            {
+                "form": form,
+                "all_friends": caddy.friends.select_related("user"),
+                "total_following": caddy.following_count,
+                "suggestions": graph.suggestions(caddy),
+            },
         )
 
 
+@login_required()
+def caddy_autocomplete(request):
+    prefix = request.GET.get("q", "").strip()
+    if not prefix:
+        return JsonResponse({"usernames": []})
+    caddy_id = autocomplete.index.caddy_id(request.user.id)
+    # the in-memory follow graph, so leaving out who's already followed is free too
+    exclude = set(graph.graph.following(caddy_id).tolist()) | {caddy_id} if caddy_id else set()
+    return JsonResponse({"usernames": autocomplete.index.search(prefix, exclude)})
+
+
 def unfollow_friend(request, friend_id):
     caddy = Caddy.objects.get(user=request.user.id)
     caddy.friends.remove(friend_id)
     return redirect(reverse("loopers:friends"))
 
 @login_required()
+@replica_view
 def followers(request):
     caddy = Caddy.objects.get(user=request.user.id)
-    followers = []
-    with connection.cursor() as cursor:
-        cursor.execute(
-            "select from_caddy_id from loopers_caddy_friends where to_caddy_id = %s;",
-            [caddy.id],
-        )
-        for row in cursor.fetchall():
-            followers.append(row)
-
-    count = 0
-    for x in followers:
-        temp = int(x[0])
-        followers[count] = temp
-        count += 1
-
-    the_followers_username = []
-    sum_followers = 0
-    for c in followers:
-        temp_caddy = Caddy.objects.get(id=c)
-        name = temp_caddy.user.username
-        the_followers_username.append(name)
-        sum_followers += 1
+
+    # paged on the follow rows themselves, a range of follow_to_from_idx
+    # with the followers' users joined in the same query
+    follows = Follow.objects.filter(to_caddy=caddy).select_related("from_caddy__user")
+    paginator = KeysetPaginator(follows, 50, ordering=("-from_caddy_id",))
+    try:
+        page = paginator.page(request.GET.get("after"))
+    except InvalidPage:
+        raise Http404("Invalid page")
+
+    the_followers_username = [follow.from_caddy.user.username for follow in page]
 
     return render(
-        request, "loopers/followers.html", {"followers": the_followers_username, "total": sum_followers}
+        request,
+        "loopers/followers.html",
+        {
+            "followers": the_followers_username,
+            "total": caddy.follower_count,
+            "page_obj": page,
+        },
+    )
+
+
+@login_required()
+def friends_feed(request):
+    # the timeline is written ahead of time by loopers.feed, so this is one
+    # range read over the user's own entries
+    entries = FeedEntry.objects.filter(user=request.user).select_related("loop__caddy")
+    paginator = KeysetPaginator(entries, 25, ordering=("-date", "-id"))
+    try:
+        page = paginator.page(request.GET.get("after"))
+    except InvalidPage:
+        raise Http404("Invalid page")
+
+    return render(
+        request,
+        "loopers/feed.html",
+        {"entries": [entry.loop for entry in page], "page_obj": page},
     )
 
 
@@ -335,7 +459,7 @@ def change_email(request):
                 caddy.change_email = new_email
 
                 change_email_key = helpers.generate_activation_key(
-                    username=request.user.username
+                    request.user, AccountToken.CHANGE_EMAIL
                 )
 
                 subject = "CaddyShackHub New Email"
@@ -347,35 +471,21 @@ def change_email(request):
                     new_email, request.scheme, request.get_host(), change_email_key
                 )
 
-                error = False
+                with transaction.atomic():
+                    caddy.email_validated = False
+                    caddy.save()
 
-                try:
-                    send_mail(
+                    outbox.queue_mail(
                         subject=subject,
                         message=message,
                         from_email=None,
                         recipient_list=[request.POST["new_email"]],
-                        fail_silently=False,
-                    )
-                    messages.add_message(
-                        request,
-                        messages.INFO,
-                        "Please verify your new email by clicking on the link sent to the new address.",
                     )
-
-                except:
-                    error = True
-                    messages.add_message(
-                        request,
-                        messages.INFO,
-                        "Unable to send email verification. Please try again",
-                    )
-                    logging.exception("Send email failure")
-
-                if not error:
-                    caddy.change_email_key = change_email_key
-                    caddy.email_validated = False
-                    caddy.save()
+                messages.add_message(
+                    request,
+                    messages.INFO,
+                    "Please verify your new email by clicking on the link sent to the new address.",
+                )
 
                 return redirect(reverse("loopers:settings"))
             else:
@@ -393,7 +503,11 @@ def email_verification(request):
     if not key:
         raise Http404()
 
-    caddy = get_object_or_404(Caddy, change_email_key=key)
+    # only the account that asked for the change can confirm it
+    if helpers.use_token(key, AccountToken.CHANGE_EMAIL, user=request.user) is None:
+        raise Http404()
+
+    caddy = Caddy.objects.get(user=request.user)
     user = request.user
     user.email = caddy.change_email
     user.save()
@@ -404,6 +518,66 @@ def email_verification(request):
 
     return render(request, "loopers/settings.html")
 
+@login_required()
+def leaderboards(request):
+    period = request.GET.get("period", PeriodStats.WEEK)
+    if period not in leaderboard.PERIODS:
+        raise Http404("Unknown leaderboard")
+
+    return render(
+        request,
+        "loopers/leaderboard.html",
+        {
+            "period": period,
+            "periods": leaderboard.PERIODS,
+            "board": leaderboard.top_caddies(period),
+        },
+    )
+
+@login_required()
+def earnings(request):
+    result = analytics.get_analytics(request.user)
+    this_year = datetime.date.today().year
+    years = sorted({this_year} | {season["season"] for season in result["seasons"]}, reverse=True)
+    try:
+        year = int(request.GET.get("year", this_year))
+    except ValueError:
+        raise Http404("Invalid year")
+    if year not in years:
+        raise Http404("No loops that year")
+
+    return render(
+        request,
+        "loopers/stats.html",
+        {
+            "analytics": result,
+            "years": years,
+            "heatmap": heatmap.calendar(request.user.id, year),
+        },
+    )
+
+
+@login_required()
+def earnings_json(request):
+    return JsonResponse(analytics.get_analytics(request.user))
+
+
+def metrics_view(request):
+    """Prometheus scrape endpoint, for staff or a scraper sending settings.METRICS_TOKEN."""
+    token = settings.METRICS_TOKEN
+    auth = request.headers.get("Authorization", "")
+    allowed = request.user.is_staff or (
+        token and hmac.compare_digest(auth.encode(), f"Bearer {token}".encode())
+    )
+    if not allowed:
+        return HttpResponseForbidden("Not allowed")
+
+    pending = OutgoingEmail.objects.filter(status=OutgoingEmail.PENDING).count()
+    return HttpResponse(
+        metrics.render({"outbox_pending": pending}), content_type="text/plain; version=0.0.4"
+    )
+
+
 def terms_of_service(request):
     return render(request, "loopers/terms_of_service.html")
 